@@ -332,6 +332,8 @@ def parse_group(
         wait_sbatch: bool = False,
         new_version: bool = False,
         b64vars: Union[list,None] = None,
+        workers: Union[int,None] = None,
+        stream: bool = False,
         toggle_CFA: Union[str,None] = None,
         func: callable = print,
         **kwargs
@@ -403,6 +405,8 @@ def parse_group(
     run_kwargs['input_file'] = input_file
     run_kwargs['aggregator'] = aggregator
     run_kwargs['b64vars'] = b64vars
+    run_kwargs['workers'] = workers
+    run_kwargs['stream'] = stream
 
     ## 5a. Run Parallel
     if parallel:
@@ -491,11 +495,13 @@ def get_args():
     ## Compute
     compute = subparsers.add_parser('compute',help='Compute data aggregations for a project, group or subset of projects. (Pipeline phase 2)', 
                                 parents=[universal_parser, group_parser, phased_parser])
-    compute.add_argument('--mem-allowed', dest='mem_allowed', default='100MB', help='Memory allowed for Zarr rechunking') # Compute only
+    compute.add_argument('--mem-allowed', dest='mem_allowed', default=None, help='Memory allowed for Zarr rechunking (default 100MB) or for Kerchunk refs held in memory (default half the job memory)') # Compute only
     compute.add_argument('--aggregator', dest='aggregator',default=None, help='Specific aggregation method to use for Kerchunk references') # Compute only
     compute.add_argument('--identical_dims', dest='identical_dims', default=None, help='Manually supply new aggregation parameters: Identical dims')
     compute.add_argument('--concat_dims', dest='concat_dims', default=None, help='Manually supply new aggregation parameters: Concat dims')
     compute.add_argument('--b64vars', dest='b64vars', help='Manually supply variables for b64 encoding (Kerchunk)' )
+    compute.add_argument('--workers', dest='workers', type=int, default=None, help='Number of workers for creating Kerchunk references and encoding in the PADOCC aggregator') # Compute only
+    compute.add_argument('--stream', dest='stream', action='store_true', help='Stream Kerchunk references from the cache during aggregation to reduce memory usage') # Compute only
     ## Logs
     logs = subparsers.add_parser('logs',help='Obtain logs from a given project or group.', 
                                 parents=[universal_parser, group_parser])
@@ -0,0 +1,247 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import array
+import json
+from typing import Iterator, Union
+
+import numpy as np
+
+class ConversionStats:
+    """
+    Per-file conversion statistics, held as arrays rather than
+    per-file dictionaries.
+
+    Records the wall-time, native file size, number of chunk refs
+    and driver for each converted file, and summarises these as 
+    percentiles with a list of outlier files.
+    """
+
+    def __init__(self):
+        self._positions = array.array('q')
+        self._times     = array.array('d')
+        self._sizes     = array.array('q')
+        self._nrefs     = array.array('q')
+        self._drivers   = array.array('b')
+        self._driver_names = []
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(
+            self, 
+            position: int, 
+            seconds: float, 
+            size: Union[int,None] = None, 
+            nrefs: int = 0, 
+            driver: Union[str,None] = None
+        ) -> None:
+        """
+        Add the statistics for a single converted file.
+
+        :param position:    (int) Position of the file in the fileset.
+
+        :param seconds:     (float) Conversion wall-time.
+
+        :param size:        (int) Size of the native file in bytes, -1 if unknown.
+
+        :param nrefs:       (int) Number of chunk refs produced.
+
+        :param driver:      (str) Driver used for conversion.
+        """
+        if driver not in self._driver_names:
+            self._driver_names.append(driver)
+
+        self._positions.append(position)
+        self._times.append(seconds)
+        self._sizes.append(-1 if size is None else size)
+        self._nrefs.append(nrefs)
+        self._drivers.append(self._driver_names.index(driver))
+
+    def summary(self, listfiles: Union[list,None] = None, max_outliers: int = 10) -> dict:
+        """
+        Summarise the conversion statistics.
+
+        Outliers are files with conversion times above the upper 
+        quartile by more than three times the interquartile range,
+        and at least twice the median.
+
+        :param listfiles:   (list) Native files, used to name outlier files.
+
+        :param max_outliers:    (int) Maximum number of outlier files to list.
+        """
+        times = np.frombuffer(self._times, dtype=np.float64)
+        sizes = np.frombuffer(self._sizes, dtype=np.int64)
+        nrefs = np.frombuffer(self._nrefs, dtype=np.int64)
+        drivers = np.frombuffer(self._drivers, dtype=np.int8)
+
+        def _describe(values: np.ndarray) -> dict:
+            if values.size == 0:
+                return {}
+            p50, p95 = np.percentile(values, [50, 95])
+            return {
+                'mean': round(float(values.mean()),3),
+                'p50': round(float(p50),3),
+                'p95': round(float(p95),3),
+                'max': round(float(values.max()),3),
+            }
+
+        q1, p50, q3 = np.percentile(times, [25, 50, 75])
+        limit = max(q3 + 3*(q3 - q1), 2*p50)
+
+        outliers = []
+        for i in np.argsort(times)[::-1][:max_outliers]:
+            if times[i] <= limit:
+                break
+            position = int(self._positions[i])
+            outliers.append({
+                'file': listfiles[position] if listfiles is not None else position,
+                'time': round(float(times[i]),3),
+                'size': int(sizes[i]),
+                'nrefs': int(nrefs[i]),
+            })
+
+        return {
+            'files': len(self),
+            'time': _describe(times),
+            'size': _describe(sizes[sizes >= 0]),
+            'nrefs': _describe(nrefs),
+            'drivers': {
+                str(name): int((drivers == i).sum()) for i, name in enumerate(self._driver_names)
+            },
+            'outliers': outliers,
+        }
+
+class AttrReducer:
+    """
+    Incremental reducer for the global attributes of a set of files.
+
+    Each file's attributes are added as refs are created, keeping only 
+    the first set of attributes, the names of attributes which differ and
+    a summary of each time attribute. Memory use depends on the number
+    of attributes rather than the number of files.
+
+    Time attributes (with 'time' in the name) are reduced as:
+     - 'start' attributes: earliest value.
+     - 'end'/'stop' attributes: latest value.
+     - 'duration' attributes: first value.
+     - Other attributes: the value if all the same, otherwise the distinct
+       values, or a note to see the individual files if every file (or more 
+       than ``max_distinct`` files) has a different value.
+    """
+
+    def __init__(self, concat_msg: str, nfiles: Union[int,None] = None, max_distinct: int = 100):
+        """
+        :param concat_msg:      (str) Value for attributes that differ across files.
+
+        :param nfiles:          (int) Total number of files in the set.
+
+        :param max_distinct:    (int) Number of distinct values to keep for each
+            time attribute.
+        """
+        self.concat_msg   = concat_msg
+        self.nfiles       = nfiles
+        self.max_distinct = max_distinct
+
+        self._base     = None
+        self._nonequal = set()
+        self._times    = {}
+
+    def add(self, zattrs: Union[str,dict]) -> None:
+        """
+        Add the global attributes for a single file.
+        """
+        if isinstance(zattrs, str):
+            zattrs = json.loads(zattrs)
+
+        if self._base is None:
+            self._base = zattrs
+            for k, v in zattrs.items():
+                if 'time' in k:
+                    self._times[k] = {'min': v, 'max': v, 'distinct': {json.dumps(v): v}}
+            return
+
+        for attr, value in zattrs.items():
+            if attr in self._times:
+                self._add_time(attr, value)
+            elif attr not in self._base:
+                self._nonequal.add(attr)
+            elif attr not in self._nonequal and self._base[attr] != value:
+                self._nonequal.add(attr)
+
+    def _add_time(self, attr: str, value) -> None:
+        """
+        Update the summary for a single time attribute.
+        """
+        summary = self._times[attr]
+        if value < summary['min']:
+            summary['min'] = value
+        if value > summary['max']:
+            summary['max'] = value
+
+        distinct = summary['distinct']
+        if distinct is not None:
+            distinct[json.dumps(value)] = value
+            if len(distinct) > self.max_distinct:
+                summary['distinct'] = None
+
+    def reduce(self) -> tuple[dict,list]:
+        """
+        Combine the collected attributes.
+
+        :returns:   The combined attributes, and the names of 
+            attributes which differ across files.
+        """
+        if self._base is None:
+            raise ValueError('No attributes added to reducer')
+
+        base = dict(self._base)
+        for k, summary in self._times.items():
+            distinct = summary['distinct']
+            if 'start' in k:
+                base[k] = summary['min']
+            elif 'end' in k or 'stop' in k:
+                base[k] = summary['max']
+            elif 'duration' in k:
+                pass
+            elif distinct is not None and len(distinct) == 1:
+                pass
+            elif distinct is None or len(distinct) == self.nfiles:
+                base[k] = 'See individual files for details'
+            else:
+                base[k] = list(distinct.values())
+
+        for attr in self._nonequal:
+            base[attr] = self.concat_msg
+
+        return base, sorted(self._nonequal)
+
+class CachedRefs:
+    """
+    Ordered sequence of refs loaded lazily from the per-file cache.
+
+    Used in place of a list of refs when streaming, so only one
+    file's refs are held in memory at any time. Each iteration
+    re-reads the cache files.
+    """
+
+    def __init__(self, cache_file: callable, positions: list):
+        """
+        :param cache_file:  (callable) Function returning the cache filehandler
+            for a given position.
+
+        :param positions:   (list) Ordered cache file positions.
+        """
+        self._cache_file = cache_file
+        self._positions  = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __getitem__(self, index: int) -> dict:
+        return self._cache_file(self._positions[index]).get()
+
+    def __iter__(self) -> Iterator[dict]:
+        for x in self._positions:
+            yield self._cache_file(x).get()
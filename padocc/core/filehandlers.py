@@ -2,15 +2,24 @@ __author__    = "Daniel Westwood"
 __contact__   = "daniel.westwood@stfc.ac.uk"
 __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 
+import base64
 import json
 import logging
 import os
 import re
 import glob
+import hashlib
+import shutil
 from datetime import datetime
 from typing import Iterator, Optional, Union, Any
 import netCDF4
 
+try:
+    import fcntl
+except ImportError:
+    # File locking unavailable (non-POSIX systems)
+    fcntl = None
+
 import fsspec
 import xarray as xr
 import yaml
@@ -593,7 +602,186 @@ class JSONFileHandler(FileIOMixin):
         """
         self._set_value_in_file()
 
+COMPRESSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+def _open_text(filepath: str, compression: Union[str,None] = None):
+    """
+    Open a text file for writing, with optional gzip or zstd compression.
+    """
+    if compression is None:
+        return open(filepath,'w')
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filepath,'wt')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(
+                "zstandard package not installed in your environment - please "
+                "install with pip or otherwise to use 'zstd' compression."
+            )
+        return zstandard.open(filepath,'wt')
+    raise ValueError(
+        f'Unrecognised compression "{compression}" - must be one of '
+        f'{list(COMPRESSIONS.values())}'
+    )
+
+class RefWriter:
+    """
+    Incremental writer for Kerchunk references.
+
+    References are written to the output file as they are produced,
+    rather than serialising the whole reference dictionary to a single
+    string first. Where no output file is given, refs are collected into 
+    a dictionary instead.
+    """
+
+    def __init__(
+            self, 
+            output_file: Union[str,None], 
+            version: int,
+            compression: Union[str,None] = None,
+            extra: Union[dict,None] = None,
+            buffer_size: int = 1000000,
+        ) -> None:
+        """
+        :param output_file: (str) Path to the output file.
+
+        :param version:     (int) Kerchunk reference version.
+
+        :param compression: (str) Compress the output with 'gzip' or 'zstd'. Inferred 
+            from the output file extension if not given.
+
+        :param extra:       (dict) Any other top-level items to write before the refs.
+
+        :param buffer_size: (int) Approximate number of characters held before each write.
+        """
+        
+        self.output_file = output_file
+        self.refs = None
+        self._first = True
+        self._buffer = []
+        self._buffered = 0
+        self._buffer_size = buffer_size
+
+        if output_file is None:
+            self.refs = {}
+            self._version = version
+            self._extra = extra or {}
+            return
+
+        if compression is None:
+            compression = COMPRESSIONS.get(os.path.splitext(output_file)[-1])
+
+        self._f = _open_text(output_file, compression)
+        self._f.write(f'{{"version": {json.dumps(version)}, ')
+        for key, value in (extra or {}).items():
+            self._f.write(f'{json.dumps(key)}: {json.dumps(value)}, ')
+        self._f.write('"refs": {')
+
+    def write(self, key: str, value) -> None:
+        """
+        Add a single reference to the output.
+        """
+        if self.refs is not None:
+            self.refs[key] = value
+            return
+
+        sep = '' if self._first else ', '
+        item = f'{sep}{json.dumps(key)}: {json.dumps(value)}'
+        self._first = False
+
+        self._buffer.append(item)
+        self._buffered += len(item)
+        if self._buffered > self._buffer_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._f.write(''.join(self._buffer))
+        self._buffer, self._buffered = [], 0
+
+    def close(self) -> Union[dict,None]:
+        """
+        Finish writing the output, returns the refs 
+        if no output file was given.
+        """
+        if self.refs is not None:
+            return {'version': self._version, **self._extra, 'refs': self.refs}
+        
+        self._flush()
+        self._f.write('}}')
+        self._f.close()
+
+    def abort(self) -> None:
+        """
+        Remove any partially written output.
+        """
+        if self.refs is not None:
+            return
+        
+        self._f.close()
+        if os.path.isfile(self.output_file):
+            os.remove(self.output_file)
+
+class ParqRefWriter:
+    """
+    Incremental writer for Kerchunk references to a Parquet store.
+
+    Shares the interface of ``RefWriter``, with references written into a
+    ``LazyReferenceMapper`` which writes each record to disk once full.
+    Metadata must be written before the chunks of each array.
+    """
+
+    def __init__(
+            self, 
+            output_store: str, 
+            record_size: int = 10000,
+        ) -> None:
+        """
+        :param output_store:    (str) Path to the Parquet store.
+
+        :param record_size:     (int) Number of references per Parquet file.
+        """
+        from fsspec import filesystem
+        from fsspec.implementations.reference import LazyReferenceMapper
+
+        self.output_store = output_store
+        self._out = LazyReferenceMapper.create(
+            output_store, fs=filesystem('file'), record_size=record_size)
+
+    def write(self, key: str, value) -> None:
+        """
+        Add a single reference to the output. Inlined data is 
+        stored as raw bytes rather than base64 strings.
+        """
+        if isinstance(value, dict):
+            value = json.dumps(value)
+        elif isinstance(value, str) and not key.split('/')[-1].startswith('.'):
+            if value.startswith('base64:'):
+                value = base64.b64decode(value[7:])
+            else:
+                value = value.encode()
+        self._out[key] = value
+
+    def close(self) -> None:
+        """
+        Write any remaining records and the store metadata.
+        """
+        self._out.flush()
+
+    def abort(self) -> None:
+        """
+        Remove any partially written output.
+        """
+        if os.path.isdir(self.output_store):
+            shutil.rmtree(self.output_store)
+
 class KerchunkFile(JSONFileHandler):
+
     """
     Filehandler for Kerchunk file, enables substitution/replacement
     for local/remote links, and updating content.
@@ -605,6 +793,32 @@ class KerchunkFile(JSONFileHandler):
 
         self._xarray_kwargs = xarray_kwargs or {}
 
+    def _set_value_in_file(self) -> None:
+        """
+        On initialisation or close, set the value
+        in the file. Refs are written incrementally rather 
+        than as a single serialised string.
+        """
+        if self._dryrun or self._value == {}:
+            self.logger.debug(f"Skipped setting value in {self.file}")
+            return
+        
+        self._apply_conf()
+
+        if 'refs' not in self._value:
+            super()._set_value_in_file()
+            return
+
+        extra = {k: v for k, v in self._value.items() if k not in ['version','refs']}
+        writer = RefWriter(self.filepath, self._value.get('version',1), extra=extra)
+        try:
+            for key, value in self._value['refs'].items():
+                writer.write(key, value)
+        except Exception as err:
+            writer.abort()
+            raise err
+        writer.close()
+
     def add_download_link(
             self,
             sub: str = '/',
@@ -763,6 +977,411 @@ class KerchunkFile(JSONFileHandler):
         else:
             os.system(f'cp {self.filepath} {copy}.{self._extension}')
 
+class KerchunkPackFile(KerchunkFile):
+    """
+    Filehandler for Kerchunk refs stored in a compact binary (msgpack)
+    form, used for the per-file reference cache.
+
+    Chunk references are stored as columns of keys, path indices, offsets
+    and sizes, with the offset/size columns packed as raw integer arrays.
+    Metadata and inlined values are stored as-is. Existing JSON cache files
+    with the same name are still readable.
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        self._extension = 'msgpack'
+
+    def __repr__(self) -> str:
+        """Programmatic representation"""
+        return f"<PADOCC Kerchunk Pack Filehandler: {format_str(self.file,10, concat=True)}>"
+
+    @property
+    def legacy_filepath(self) -> str:
+        """Path to an equivalent JSON cache file."""
+        return f'{self._dir}/{self._file}.json'
+
+    def file_exists(self) -> bool:
+        """
+        Return true if the file (or a JSON equivalent) is found.
+        """
+        return os.path.isfile(self.filepath) or os.path.isfile(self.legacy_filepath)
+
+    def create_file(self) -> None:
+        """Binary files are only created when a value is saved."""
+        pass
+
+    def _obtain_value_from_file(self) -> None:
+        """
+        Obtain the value from the packed file, or the JSON 
+        equivalent if no packed file is present.
+        """
+        if os.path.isfile(self.filepath):
+            with open(self.filepath,'rb') as f:
+                self._value = _unpack_refs(f.read())
+        elif os.path.isfile(self.legacy_filepath):
+            with open(self.legacy_filepath) as f:
+                try:
+                    self._value = json.load(f)
+                except Exception as err:
+                    self.logger.warning(f'Invalid file contents at {self.legacy_filepath} - {err}')
+                    self._value = {}
+
+    def _set_value_in_file(self) -> None:
+        """
+        On initialisation or close, set the value
+        in the file.
+        """
+        if self._dryrun or self._value == {}:
+            self.logger.debug(f"Skipped setting value in {self.file}")
+            return
+
+        self._apply_conf()
+
+        with open(self.filepath,'wb') as f:
+            f.write(_pack_refs(self._value))
+
+        # Packed file supersedes any older JSON copy.
+        if os.path.isfile(self.legacy_filepath):
+            os.remove(self.legacy_filepath)
+
+    def open_dataset(self, **kwargs) -> xr.Dataset:
+        """
+        Open the packed refs as a dataset, via the unpacked
+        reference dict.
+        """
+        self.logger.info('Attempting to open packed Kerchunk file')
+
+        if not self.file_exists():
+            raise FileNotFoundError(self.filepath)
+
+        try:
+            ds = xr.open_dataset(self.get(), engine='kerchunk', **kwargs)
+        except Exception as err:
+            self.logger.error('Unable to open packed kerchunk file')
+            raise err
+        
+        self.logger.debug('Successfully opened packed Kerchunk with virtual xarray ds')
+        return ds
+
+    def spawn_copy(self, copy: str):
+        """
+        Spawn a copy of this file (not filehandler)
+
+        :param copy:    (str) Path to new copy location and filename (minus extension).
+        """
+        if self._dryrun:
+            self.logger.info(f'[DRYRUN]: cp {self.filepath} {copy}.{self._extension}')
+        else:
+            os.system(f'cp {self.filepath} {copy}.{self._extension}')
+
+def _import_msgpack():
+    """
+    Import msgpack for the packed cache format.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError(
+            "msgpack package not installed in your environment - please "
+            "install with pip or otherwise to use the 'msgpack' cache format."
+        )
+    return msgpack
+
+def _pack_refs(value: dict) -> bytes:
+    """
+    Pack a Kerchunk reference dict into columnar msgpack bytes.
+    """
+    import numpy as np
+    msgpack = _import_msgpack()
+
+    meta, inline = {}, {}
+    keys, path_index, offsets, sizes = [], [], [], []
+    paths = {}
+
+    for key, ref in value.get('refs',{}).items():
+        if isinstance(ref, list) and len(ref) == 3:
+            keys.append(key)
+            path_index.append(paths.setdefault(ref[0], len(paths)))
+            offsets.append(int(ref[1]))
+            sizes.append(int(ref[2]))
+        elif key.split('/')[-1].startswith('.'):
+            meta[key] = ref
+        else:
+            inline[key] = ref
+
+    return msgpack.packb({
+        'attrs': {k: v for k, v in value.items() if k != 'refs'},
+        'meta': meta,
+        'inline': inline,
+        'keys': keys,
+        'paths': list(paths.keys()),
+        'path_index': np.array(path_index, dtype='<i4').tobytes(),
+        'offsets': np.array(offsets, dtype='<i8').tobytes(),
+        'sizes': np.array(sizes, dtype='<i8').tobytes(),
+    }, use_bin_type=True)
+
+def _unpack_refs(content: bytes) -> dict:
+    """
+    Unpack columnar msgpack bytes into a Kerchunk reference dict.
+    """
+    import numpy as np
+    msgpack = _import_msgpack()
+
+    packed = msgpack.unpackb(content, raw=False)
+
+    paths   = packed['paths']
+    indices = np.frombuffer(packed['path_index'], dtype='<i4').tolist()
+    offsets = np.frombuffer(packed['offsets'], dtype='<i8').tolist()
+    sizes   = np.frombuffer(packed['sizes'], dtype='<i8').tolist()
+
+    refs = packed['meta']
+    refs.update({
+        key: [paths[p], o, s] for key, p, o, s in zip(packed['keys'], indices, offsets, sizes)
+    })
+    refs.update(packed['inline'])
+
+    return {**packed['attrs'], 'refs': refs}
+
+# Filehandlers for each per-file cache format.
+CACHE_FORMATS = {
+    'json': KerchunkFile,
+    'msgpack': KerchunkPackFile,
+}
+
+def _fast_hash(path: str, size: int, block: int = 1048576) -> str:
+    """
+    Hash the first and last blocks of a file.
+
+    Intended as a cheap check for content changes that do not
+    alter the size or modification time of a file.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            digest.update(f.read(block))
+    return digest.hexdigest()
+
+class CacheManifest(JSONFileHandler):
+    """
+    Filehandler for the manifest of source files used to create
+    the per-file Kerchunk cache.
+
+    Each native file path maps to the cache position it was converted
+    into, along with the size, modification time and (optionally) a
+    fast hash of the file. Cached refs are only reused where the file
+    at a given position is unchanged.
+    """
+
+    def __init__(
+            self, 
+            dir: str, 
+            filename: str = 'manifest', 
+            use_hash: bool = False,
+            **kwargs
+        ) -> None:
+        """
+        :param dir:     (str) The path to the cache directory.
+
+        :param filename: (str) The name of the manifest file.
+
+        :param use_hash:    (bool) Include a fast hash of each file in the 
+            fingerprint, in addition to size and modification time.
+        """
+        super().__init__(dir, filename, **kwargs)
+
+        self._use_hash = use_hash
+        self._positions = None
+        self._legacy = None
+
+    def __repr__(self) -> str:
+        """Programmatic representation"""
+        return f"<PADOCC Cache Manifest: {format_str(self.file,10, concat=True)}>"
+
+    @property
+    def is_legacy(self) -> bool:
+        """
+        True if no fingerprints had been recorded when the manifest
+        was first loaded, in which case existing cache files are 
+        trusted as before.
+
+        Caches written before the manifest was introduced are not checked
+        against their source files, so stale refs are reused until the
+        project is recomputed with ``forceful`` or ``thorough``.
+        """
+        if self._legacy is None:
+            self._obtain_value()
+            self._legacy = self._value == {}
+        return self._legacy
+
+    def fingerprint(self, path: str) -> dict:
+        """
+        Determine the current fingerprint for a native file.
+
+        :param path:    (str) Path to the native file.
+        """
+        stat = os.stat(path)
+        fprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        if self._use_hash:
+            fprint['hash'] = _fast_hash(path, stat.st_size)
+        return fprint
+
+    def matches(self, path: str) -> bool:
+        """
+        Check the recorded fingerprint for a file against the file itself.
+
+        :param path:    (str) Path to the native file.
+        """
+        self._obtain_value()
+
+        entry = self._value.get(path)
+        if entry is None:
+            return False
+        try:
+            fprint = self.fingerprint(path)
+        except OSError:
+            return False
+
+        for key, value in fprint.items():
+            if key == 'hash' and 'hash' not in entry:
+                continue
+            if entry.get(key) != value:
+                return False
+        return True
+
+    def position(self, path: str) -> Union[int,None]:
+        """
+        Get the cache position recorded for a native file.
+
+        :param path:    (str) Path to the native file.
+        """
+        self._obtain_value()
+        entry = self._value.get(path)
+        if entry is None:
+            return None
+        return entry.get('cache')
+
+    def is_current(self, path: str, position: int) -> bool:
+        """
+        Determine if the cache entry at this position can be reused
+        for this native file.
+
+        :param path:    (str) Path to the native file.
+
+        :param position:    (int) Position of the cache file.
+        """
+        if self.is_legacy:
+            return True
+        return self.position(path) == position and self.matches(path)
+
+    def driver(self, path: str) -> Union[str,None]:
+        """
+        Get the driver previously used to convert a native file, if
+        the file is unchanged.
+
+        :param path:    (str) Path to the native file.
+        """
+        if not self.matches(path):
+            return None
+        return self._value[path].get('driver')
+
+    def record(self, path: str, position: int, driver: Union[str,None] = None) -> None:
+        """
+        Record the fingerprint of a native file converted into the
+        cache at this position.
+
+        :param path:    (str) Path to the native file.
+
+        :param position:    (int) Position of the cache file.
+
+        :param driver:  (str) Driver used to convert the file, the previously
+            recorded driver is kept if not given.
+        """
+        self._obtain_value()
+
+        driver = driver or self._value.get(path,{}).get('driver')
+
+        if self._positions is None:
+            self._positions = {v.get('cache'): k for k, v in self._value.items()}
+
+        previous = self._positions.get(position)
+        if previous is not None and previous != path:
+            self._value.pop(previous, None)
+
+        old = self.position(path)
+        if old is not None and self._positions.get(old) == path:
+            self._positions.pop(old)
+
+        try:
+            self._value[path] = {'cache': position, **self.fingerprint(path)}
+        except OSError:
+            self._value.pop(path, None)
+            return
+
+        if driver is not None:
+            self._value[path]['driver'] = driver
+        self._positions[position] = path
+
+    def relocations(self, listfiles: list) -> dict:
+        """
+        Find cache entries that are still valid but recorded at a 
+        different position to the current file order.
+
+        :param listfiles:   (list) The current ordered set of native files.
+
+        :returns:   Dictionary of old to new cache positions.
+        """
+        if self.is_legacy:
+            return {}
+
+        moves = {}
+        for x, path in enumerate(listfiles):
+            old = self.position(path)
+            if old is not None and old != x and self.matches(path):
+                moves[old] = x
+        return moves
+
+    def save(self) -> None:
+        """
+        Save the manifest, merging with any entries written by
+        other processes since this manifest was loaded.
+
+        The read-merge-write is made under an exclusive lock on a
+        sidecar ``.lock`` file, and the merged manifest is written to a 
+        temporary file then moved into place, so compute-subset jobs 
+        sharing a manifest do not overwrite each other's entries.
+        """
+        if self._dryrun or self._value == {}:
+            return
+
+        with open(f'{self.filepath}.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            current = {}
+            if self.file_exists():
+                with open(self.filepath) as f:
+                    try:
+                        current = json.load(f)
+                    except json.JSONDecodeError:
+                        current = {}
+
+            claimed = {v.get('cache') for v in self._value.values()}
+            merged = {k: v for k, v in current.items() if v.get('cache') not in claimed}
+            merged.update(self._value)
+
+            tmpfile = f'{self.filepath}.{os.getpid()}.tmp'
+            with open(tmpfile, 'w') as f:
+                f.write(json.dumps(merged))
+            os.replace(tmpfile, self.filepath)
+
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
 class GenericStore(LoggedOperation):
     """
     Filehandler for Generic stores in Padocc - enables Filesystem
@@ -1218,6 +1837,251 @@ class KerchunkStore(GenericStore):
             df.to_parquet(file)
 
 
+def _import_icechunk():
+    """
+    Import icechunk for the Icechunk output format.
+    """
+    try:
+        import icechunk
+    except ImportError as err:
+        raise ImportError(
+            "icechunk package not installed in your environment - please "
+            "install the optional dependency with `pip install padocc[icechunk]` "
+            "to use the 'icechunk' file type."
+        ) from err
+    return icechunk
+
+class IcechunkStore(GenericStore):
+    """
+    Filehandler for Icechunk repositories in PADOCC, holding
+    virtual references to the native files. Metadata is read from 
+    and committed to the root group of the repository.
+
+    Added behaviours
+    ----------------
+
+    1. Open dataset - opens the main branch of the repository.
+
+    2. Write virtual - write a virtual dataset to a new repository.
+    """
+
+    def __init__(
+            self,
+            parent_dir: str,
+            store_name: str,
+            **kwargs
+        ) -> None:
+
+        super().__init__(
+            parent_dir, store_name, 
+            metadata_name='.zattrs',
+            extension='icechunk',
+            **kwargs)
+
+    def __repr__(self) -> str:
+        """Programmatic representation"""
+        return f'<PADOCC IcechunkStore: {format_str(self._store_name,10)}>'
+
+    @property
+    def filepath(self) -> str:
+        """Path to the repository, for consistency with file products."""
+        return self.store_path
+
+    def _repository(self):
+        """
+        Open the repository, authorising access to the virtual 
+        chunk containers registered on creation.
+        """
+        icechunk = _import_icechunk()
+
+        storage = icechunk.local_filesystem_storage(self.store_path)
+        config = icechunk.Repository.fetch_config(storage)
+
+        prefixes = []
+        if config is not None and config.virtual_chunk_containers:
+            prefixes = list(config.virtual_chunk_containers.keys())
+
+        return icechunk.Repository.open(
+            storage,
+            authorize_virtual_chunk_access=icechunk.containers_credentials(
+                {p: None for p in prefixes}
+            )
+        )
+
+    def write_virtual(
+            self, 
+            vds: xr.Dataset, 
+            native_files: list, 
+            attrs: Union[dict,None] = None,
+            message: str = 'Virtual dataset written by padocc'
+        ) -> None:
+        """
+        Write a virtual dataset to a new repository, replacing any existing one.
+
+        :param vds:     (xr.Dataset) Virtual dataset (e.g. from VirtualiZarr).
+
+        :param native_files:    (list) Native files referenced by the dataset, 
+            used to register virtual chunk containers.
+
+        :param attrs:   (dict) Global attributes to apply to the root group.
+
+        :param message: (str) Commit message.
+        """
+        icechunk = _import_icechunk()
+
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped writing {self}')
+            return
+
+        self.clear()
+
+        config = icechunk.RepositoryConfig.default()
+        prefixes = _virtual_prefixes(native_files)
+        for prefix in prefixes:
+            config.set_virtual_chunk_container(
+                icechunk.VirtualChunkContainer(
+                    prefix,
+                    icechunk.local_filesystem_store(prefix[len('file://'):])
+                )
+            )
+
+        repo = icechunk.Repository.create(
+            icechunk.local_filesystem_storage(self.store_path),
+            config,
+            authorize_virtual_chunk_access=icechunk.containers_credentials(
+                {p: None for p in prefixes}
+            )
+        )
+        session = repo.writable_session('main')
+        vds.virtualize.to_icechunk(session.store)
+
+        if attrs:
+            import zarr
+            group = zarr.open_group(session.store, mode='r+')
+            group.attrs.update(attrs)
+
+        session.commit(message)
+        self.logger.info(f'Written virtual dataset to {self}')
+
+    def open_dataset(self, **zarr_kwargs) -> xr.Dataset:
+        """
+        Open the Icechunk repository as an xarray dataset
+        """
+        self.logger.debug('Opening Icechunk repository')
+
+        session = self._repository().readonly_session('main')
+        return xr.open_zarr(session.store, consolidated=False, **zarr_kwargs)
+
+    def get_meta(self) -> dict:
+        """
+        Obtain the global attributes of the root group.
+        """
+        import zarr
+
+        session = self._repository().readonly_session('main')
+        return dict(zarr.open_group(session.store, mode='r').attrs)
+
+    def set_meta(self, values: dict):
+        """
+        Replace the global attributes of the root group.
+
+        :param values:  (dict) Complete set of metadata for this store.
+        """
+        import zarr
+
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped setting metadata for {self}')
+            return
+
+        session = self._repository().writable_session('main')
+        group = zarr.open_group(session.store, mode='r+')
+        group.attrs.put(values)
+        session.commit('Metadata updated by padocc')
+
+    def update_history(
+            self,
+            addition: str,
+            new_version: str,
+        ) -> None:
+        """
+        Update the history with a new addition.
+        
+        Sets the new version/revision automatically.
+
+        :param addition:    (str) Message to add to dataset history.
+
+        :param new_version: (str) New version the message applies to.
+        """
+        attrs = self.get_meta()
+        now   = datetime.now()
+
+        hist = attrs.get('history',[])
+        if isinstance(hist, str):
+            hist = hist.split('\n')
+        hist.append(addition)
+
+        attrs['history'] = '\n'.join(hist)
+        attrs['padocc_revision'] = new_version
+        attrs['padocc_last_changed'] = now.strftime("%d%m%yT%H%M%S")
+
+        self.set_meta(attrs)
+
+    def save(self) -> None:
+        """
+        Changes are committed to the repository as they are made.
+        """
+        pass
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Check if a key exists in the global attributes.
+
+        :param key: (str) Key to be checked in the metadata for this store.
+        """
+        return key in self.get_meta()
+
+    def __len__(self) -> int:
+        """Find the number of global attributes""" 
+        return len(self.get_meta())
+
+    def __getitem__(self, index: str) -> Union[str,dict,None]:
+        """
+        Get a global attribute from the repository.
+        
+        :param index:   (str) Key in the metadata to attempt retrieval.
+        """
+        return self.get_meta()[index]
+    
+    def __setitem__(self, index: str, value: str) -> None:
+        """
+        Set a global attribute in the repository.
+        
+        :param index:   (str) Key in the metadata to attempt retrieval.
+        
+        :param value:   (str) Value to set for the key in the metadata.
+        """
+        meta = self.get_meta()
+        meta[index] = value
+        self.set_meta(meta)
+
+def _virtual_prefixes(native_files: list, max_prefixes: int = 10) -> list:
+    """
+    URL prefixes covering all native files, for registering as virtual 
+    chunk containers. Uses the directory of each file, or the common 
+    directory where files are spread over many directories.
+    """
+    remote = [f for f in native_files if '://' in f and not f.startswith('file://')]
+    if remote:
+        raise NotImplementedError(
+            f'Icechunk output only supports local native files - found {remote[0]}'
+        )
+
+    paths = [f[len('file://'):] if f.startswith('file://') else f for f in native_files]
+    dirs = sorted(set(os.path.dirname(os.path.abspath(p)) for p in paths))
+    if len(dirs) > max_prefixes:
+        dirs = [os.path.commonpath(dirs)]
+    return [f'file://{d.rstrip("/")}/' for d in dirs]
+
 class LogFileHandler(ListFileHandler):
     """Log File handler for padocc phase logs."""
     description = "Log File handler for padocc phase logs."
@@ -7,8 +7,8 @@ from typing import Any, Callable, Union
 
 import xarray as xr
 
-from ..filehandlers import (CFADataset, GenericStore, KerchunkFile,
-                            KerchunkStore, ZarrStore)
+from ..filehandlers import (CFADataset, GenericStore, IcechunkStore,
+                            KerchunkFile, KerchunkStore, ZarrStore)
 from ..utils import extract_json
 
 
@@ -40,6 +40,7 @@ class DatasetHandlerMixin:
         func(' > project.dataset_attributes - Fetch metadata from the default dataset')
         func(' > project.kfile - Kerchunk Filehandler property')
         func(' > project.kstore - Kerchunk (Parquet) Filehandler property')
+        func(' > project.icstore - Icechunk Filehandler property')
         func(' > project.cfa_dataset - CFA Filehandler property')
         func(' > project.zstore - Zarr Filehandler property')
         func(' > project.update_attribute() - Update an attribute within the metadata')
@@ -48,6 +49,7 @@ class DatasetHandlerMixin:
         ""
         self._kfile = None
         self._kstore = None
+        self._icstore = None
         self._zstore = None
         self._cfa_dataset = None
 
@@ -67,6 +69,9 @@ class DatasetHandlerMixin:
         if self._kstore is not None:
             self.kstore.save()
 
+        if self._icstore is not None:
+            self.icstore.save()
+
         if self._zstore is not None:
             self.zstore.save()
 
@@ -103,6 +108,21 @@ class DatasetHandlerMixin:
             )
 
         return self._kstore
+
+    @property
+    def icstore(self) -> Union[IcechunkStore,None]:
+        """
+        Retrieve the Icechunk filehandler or create if not present
+        """
+        if self._icstore is None:
+            self._icstore = IcechunkStore(
+                self.dir,
+                self.outproduct,
+                logger=self.logger,
+                **self.fh_kwargs,
+            )
+
+        return self._icstore
     
     @property
     def dataset(
@@ -124,6 +144,8 @@ class DatasetHandlerMixin:
         if self.cloud_format == 'kerchunk':
             if self.file_type == 'parq':
                 return self.kstore
+            elif self.file_type == 'icechunk':
+                return self.icstore
             else:
                 return self.kfile
         elif self.cloud_format == 'zarr':
@@ -36,7 +36,7 @@ class PropertiesMixin:
         func(' > project.revision - Revision identifier (major + minor version plus type indicator)')
         func(' > project.version_no - Get major + minor version identifier')
         func(' > project.cloud_format[EDITABLE] - Cloud format (Kerchunk/Zarr) for this project')
-        func(' > project.file_type[EDITABLE] - The file type to use (e.g JSON/parq for kerchunk).')
+        func(' > project.file_type[EDITABLE] - The file type to use (e.g JSON/parq/icechunk for kerchunk).')
         func(' > project.source_format - Get the driver used by kerchunk')
         func(
             ' > project.get_stac_representation() - Provide a mapper, '
@@ -240,14 +240,14 @@ class PropertiesMixin:
         """
         Override the file type determined during scanning.
         
-        Changing from json to parquet for kerchunk storage, 
+        Changing from json to parquet (or Icechunk) for kerchunk storage, 
         or switching to Zarr will require changing the file type,
-        to ``parq`` or None respectively.
+        to ``parq`` (``icechunk``) or None respectively.
 
         """
         
         type_map = {
-            'kerchunk': ['json','parq'],
+            'kerchunk': ['json','parq','icechunk'],
             'zarr':[None],
             'CFA':[None]
         }
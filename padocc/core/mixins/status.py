@@ -64,10 +64,13 @@ class StatusMixin:
                 self.logger.error(f'CFA File missing - expected {",".join(missing)}')
                 return False
         
-        num_caches = len(glob.glob(f'{self.dir}/cache/*.json'))
-        if num_caches < num_files+1:
-            # Accounts for temp_zattrs.json file
-            self.logger.error(f'Kerchunk Files missing - expected {num_files+1}, got {num_caches}')
+        # Only per-file caches (not temp_zattrs, manifest or partials)
+        num_caches = len([
+            c for c in glob.glob(f'{self.dir}/cache/*') 
+            if os.path.basename(c).split('.')[0].isdigit()
+        ])
+        if num_caches < num_files:
+            self.logger.error(f'Kerchunk Files missing - expected {num_files}, got {num_caches}')
             return False
         
         return True
@@ -141,6 +141,9 @@ class ProjectOperation(
         self.detail_cfg = JSONFileHandler(self.dir, 'detail-cfg', conf=file_configs['detail_cfg'], logger=self.logger, **self.fh_kwargs)
         self.allfiles   = ListFileHandler(self.dir, 'allfiles', logger=self.logger, **self.fh_kwargs)
 
+        # Cached per-file ranges of the concatenation coordinate.
+        self.coord_ranges = JSONFileHandler(self.dir, 'coord_ranges', logger=self.logger, **self.fh_kwargs)
+
         # ft_kwargs <- stored in base_cfg after this point.
         if first_time:
 
@@ -166,6 +169,7 @@ class ProjectOperation(
 
         self._kfile  = None
         self._kstore = None
+        self._icstore = None
         self._zstore = None
         self._cfa_dataset = None
         self._remote = False
@@ -293,7 +293,8 @@ def mem_to_val(value: str) -> float:
     """
     Convert a value in Bytes to an integer number of bytes.
 
-    :param value:   (str) Convert number of bytes (XB) to float.
+    :param value:   (str) Convert number of bytes (XB) to float. Accepts
+        '100 MB', '100MB' and '100M'.
     """
 
     suffixes = {
@@ -302,8 +303,12 @@ def mem_to_val(value: str) -> float:
         'GB': 1000000000,
         'TB': 1000000000000,
         'PB': 1000000000000000}
-    suff = suffixes[value.split(' ')[1]]
-    return float(value.split(' ')[0]) * suff
+    value = value.replace(' ','').upper()
+    number = value.rstrip('KMGTPB')
+    suff = value[len(number):]
+    if len(suff) == 1 and suff != 'B':
+        suff += 'B'
+    return float(number) * suffixes.get(suff, 1)
 
 def extract_file(input_file: str) -> list:
     """
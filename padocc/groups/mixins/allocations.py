@@ -99,8 +99,12 @@ class AllocationsMixin:
             nfiles  = proj_op.detail_cfg['num_files']
 
             # Determine last run if present for this job
-            
-            if 'concat_estm' in timings and phase == 'compute':
+            stats   = proj_op.detail_cfg.get('conversion_stats') or {}
+
+            if stats.get('time') and phase == 'compute':
+                # Measured per-file conversion times, allowing once for the slowest file.
+                time_estms[p] = (500 + (2.5 + stats['time']['mean'])*nfiles + stats['time']['max'])/60
+            elif 'concat_estm' in timings and phase == 'compute':
                 # Calculate time estimation (minutes) - experimentally derived equation
                 time_estms[p] = (500 + (2.5 + 1.5*timings['convert_estm'])*nfiles)/60 # Changed units to minutes for allocation
             else:
@@ -425,6 +429,10 @@ class AllocationsMixin:
         for k, v in run_kwargs.items():
             if isinstance(v,list):
                 sbatch_flags += f' --{k} {",".join(v)}'
+            elif isinstance(v,bool):
+                # Boolean flags have no value.
+                if v:
+                    sbatch_flags += f' --{k}'
             elif v is not None:
                 sbatch_flags += f' --{k} {v}'
 
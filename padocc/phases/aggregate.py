@@ -15,6 +15,10 @@ import xarray as xr
 import logging
 import struct
 import os
+import hashlib
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from obstore.store import from_url
 from virtualizarr import open_virtual_dataset
@@ -22,9 +26,10 @@ from virtualizarr.parsers import KerchunkJSONParser, HDFParser, NetCDF3Parser
 from virtualizarr.registry import ObjectStoreRegistry
 from kerchunk.combine import MultiZarrToZarr
 
-from padocc.core.filehandlers import KerchunkFile
+from padocc.core.filehandlers import KerchunkFile, ParqRefWriter, RefWriter
 from padocc.core.errors import MissingDataError, ConcatFatalError
 from padocc.core.logs import FalseLogger, init_logger
+from padocc.core.utils import make_tuple
 
 warnings.filterwarnings(
     "ignore",
@@ -41,7 +46,191 @@ MAPPINGS = {
     '<i4':'<i'
 }
 
-def virtualise(cache_dir: str, output_file: str, agg_dims: list, data_vars: list, nfiles: int, logger, allfiles: list) -> None:
+class AggregationPlanner:
+    """
+    Cost model for selecting an aggregation method.
+
+    Predicts the runtime and peak memory of each aggregator from the 
+    number of files, chunk references and chunks to be inlined. Predicted 
+    times are scaled by a calibration factor per aggregator, taken from 
+    the ratio of actual to predicted time in previous runs.
+
+    The default ``COSTS`` are order-of-magnitude starting values, in the
+    relative order observed for each aggregator: VirtualiZarr parses each
+    file into a dataset, and MultiZarrToZarr holds all refs as Python
+    objects. Only their ratios matter for the initial choice, and predicted 
+    times are corrected by calibration once a project has been aggregated.
+    Memory is not calibrated, so costs measured on a given system may be 
+    supplied with ``costs`` (``aggregation_costs`` in the base config).
+
+    The same model predicts the size and open time of the aggregated 
+    product for each file type, from ``OPEN_COSTS`` and ``REF_SIZES``.
+    """
+
+    # Seconds per file, per aggregated variable per file, per chunk ref and 
+    # per inlined chunk, and bytes held per file and per chunk ref.
+    COSTS = {
+        'PADOCC Aggregator': {
+            'file': 0.02, 'var': 0.002, 'ref': 2e-6, 'b64': 5e-5,
+            'mem_file': 2e4, 'mem_ref': 80,
+        },
+        'VirtualiZarr': {
+            'file': 0.15, 'var': 0.02, 'ref': 4e-6, 'b64': 0,
+            'mem_file': 5e5, 'mem_ref': 150,
+        },
+        'Kerchunk MultiZarrToZarr': {
+            'file': 0.05, 'var': 0.01, 'ref': 2e-5, 'b64': 1e-4,
+            'mem_file': 5e4, 'mem_ref': 600,
+        },
+    }
+
+    # Reader open costs - seconds per byte of JSON parsed and per reference
+    # loaded, and per Parquet record file and per variable opened.
+    OPEN_COSTS = {
+        'json': {'byte': 1e-8, 'ref': 1e-6},
+        'parq': {'byte': 1e-8, 'ref': 2e-7, 'file': 0.01, 'var': 0.005},
+    }
+
+    # Typical sizes (bytes) where the scan did not record them, for the key
+    # and value of a JSON reference and for each reference in Parquet.
+    REF_SIZES = {'key': 20, 'ref': 150, 'parq': 16}
+
+    def __init__(
+            self,
+            nfiles: int,
+            chunks_per_file: float,
+            nvars: int,
+            b64_chunks: float = 0,
+            calibration: Union[dict,None] = None,
+            costs: Union[dict,None] = None,
+        ) -> None:
+        """
+        :param nfiles:          (int) Number of files to aggregate.
+
+        :param chunks_per_file: (float) Average number of chunk refs per file.
+
+        :param nvars:           (int) Number of aggregated variables.
+
+        :param b64_chunks:      (float) Estimated number of chunks to be inlined.
+
+        :param calibration:     (dict) Factor applied to the predicted time of 
+            each aggregator.
+
+        :param costs:           (dict) Costs to replace any of the defaults, 
+            per aggregator or file type e.g. ``{'VirtualiZarr': {'mem_ref': 200}}``,
+            and ``ref_sizes`` to replace the typical reference sizes.
+        """
+        self.nfiles = nfiles
+        self.nrefs = nfiles * chunks_per_file
+        self.nvars = nvars
+        self.b64_chunks = b64_chunks
+        self.calibration = calibration or {}
+
+        costs = costs or {}
+        self.costs = {
+            mode: cost | costs.get(mode, {}) 
+            for mode, cost in (self.COSTS | self.OPEN_COSTS).items()
+        }
+        self.ref_sizes = self.REF_SIZES | costs.get('ref_sizes', {})
+
+    def predict(self, mode: str, calibrate: bool = True) -> dict:
+        """
+        Predicted time (seconds) and memory (bytes) for an aggregator.
+        """
+        cost = self.costs[mode]
+        time = (
+            self.nfiles * (cost['file'] + cost['var']*self.nvars) 
+            + self.nrefs * cost['ref'] 
+            + self.b64_chunks * cost['b64']
+        )
+        if calibrate:
+            time *= self.calibration.get(mode, 1)
+
+        memory = self.nfiles * cost['mem_file'] + self.nrefs * cost['mem_ref']
+        return {'time': round(time, 3), 'memory': int(memory)}
+
+    def plan(self, candidates: list, memory_budget: Union[int,None] = None) -> list:
+        """
+        Order the candidate aggregators by predicted time, excluding
+        those predicted to exceed the memory budget. If no candidate
+        fits the budget, the one with least predicted memory is kept.
+        """
+        predictions = {mode: self.predict(mode) for mode in candidates}
+
+        viable = [
+            m for m in candidates 
+            if memory_budget is None or predictions[m]['memory'] <= memory_budget
+        ]
+        if not viable and candidates:
+            viable = [min(candidates, key=lambda m: predictions[m]['memory'])]
+
+        return sorted(viable, key=lambda m: predictions[m]['time'])
+
+    def open_time(
+            self, 
+            file_type: str, 
+            nbytes: float, 
+            nrefs: float, 
+            dim_files: float = 0, 
+            nvars: int = 0
+        ) -> float:
+        """
+        Predicted time (seconds) to open the aggregated product.
+
+        JSON is parsed in full, so ``nbytes`` and ``nrefs`` cover the whole
+        file. Parquet loads only the metadata and the coordinate records, so
+        these cover only the metadata bytes and coordinate refs, read from 
+        ``dim_files`` record files, with ``nvars`` variables opened.
+        """
+        cost = self.costs[file_type]
+        time = nbytes*cost['byte'] + nrefs*cost['ref']
+        if file_type == 'parq':
+            time += dim_files*cost['file'] + nvars*cost['var']
+        return time
+
+    def calibrate(self, mode: str, actual: float) -> dict:
+        """
+        Update the calibration factor for an aggregator from its actual 
+        time, returning the new calibration set.
+        """
+        predicted = self.predict(mode, calibrate=False)['time']
+        if predicted > 0 and actual > 0:
+            self.calibration[mode] = round(actual/predicted, 3)
+        return self.calibration
+
+def virtualise(
+        cache_dir: str, 
+        output_file: str, 
+        agg_dims: list, 
+        data_vars: list, 
+        nfiles: int, 
+        logger, 
+        allfiles: list,
+        workers: Union[int,None] = None,
+        tree_size: Union[int,None] = 1000,
+        icechunk_store: Union[object,None] = None,
+        zattrs: Union[dict,None] = None,
+        file_type: str = 'json',
+        record_size: int = 10000,
+    ) -> None:
+    """
+    Combine the cached Kerchunk refs using VirtualiZarr.
+
+    The combined dataset is written as Kerchunk JSON to ``output_file``, or 
+    to an Icechunk repository if ``icechunk_store`` (IcechunkStore) is given.
+
+    :param workers:     (int) Number of threads for parsing cache files, parsed 
+        serially if not given.
+
+    :param tree_size:   (int) For a single aggregation dimension, combine datasets 
+        in groups of this size and then combine the groups, rather than combining
+        all datasets at once.
+
+    :param zattrs:      (dict) Global attributes for the Icechunk repository.
+
+    :param file_type:   (str) Write Kerchunk refs as 'json' or as a 'parq' store
+        with ``record_size`` references per Parquet file.
+    """
 
     logger.info('VirtualiZarr: Starting Concatenation')
 
@@ -63,50 +252,49 @@ def virtualise(cache_dir: str, output_file: str, agg_dims: list, data_vars: list
     registry.register(file_url, store)
     parser = KerchunkJSONParser()
 
-    vds = []
-    for f in cachekerchunk:
-        logger.info(f'VirtualiZarr: Parsing virtual dataset - {f}')
-        try:
-            vds.append(open_virtual_dataset(
-                url=f,
-                parser=parser,
-                registry=registry
-            ))
-        except Exception as err:
-            raise err #ValueError('Kerchunk Parsing failed')
+    def _parse(f: str):
+        logger.debug(f'VirtualiZarr: Parsing virtual dataset - {f}')
+        return open_virtual_dataset(
+            url=f,
+            parser=parser,
+            registry=registry
+        )
+
+    logger.info(f'VirtualiZarr: Parsing {len(cachekerchunk)} virtual datasets')
+    if workers is not None and workers > 1:
+        # Results are returned in the order of the cache files.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            vds = list(pool.map(_parse, cachekerchunk))
+    else:
+        vds = [_parse(f) for f in cachekerchunk]
 
     logger.info('VirtualiZarr: Combining Datasets')
     logger.debug(f'VirtualiZarr: Combining with agg_dims: {agg_dims}, data_vars: {data_vars}')
     logger.debug('VirtualiZarr: Coords: minimal, compat: override, combine_attrs: override')
 
-    try:
-        combined_vds = xr.combine_nested(vds, concat_dim=agg_dims, data_vars=data_vars, coords='minimal',compat='override', combine_attrs='override')
-    except Exception as err:
-        raise err #ValueError('Kerchunk Concatenation failed.')
-
-    logger.debug('VirtualiZarr: Virtualising combined dataset')
-    try:
-        # TESTING
-        # import icechunk
-
-        # storage = icechunk.local_filesystem_storage(f'/home/users/dwest77/cedadev/padocc/data/{output_file.split("/")[-1]}.ice')
-        # config = icechunk.RepositoryConfig.default()
+    def _combine(dsets: list):
+        return xr.combine_nested(dsets, concat_dim=agg_dims, data_vars=data_vars, coords='minimal',compat='override', combine_attrs='override')
 
-        # containers = {}
-        # for file in allfiles:
-        #     uri = f'file://{file}'
-        #     containers[uri] = icechunk.VirtualChunkContainer(
-        #         url_prefix=uri,
-        #         store=icechunk.local_filesystem_storage(uri)
-        #     )
-        # config.set_virtual_chunk_container(containers)
+    if tree_size is not None and len(agg_dims) == 1:
+        # Combine in groups so each concatenation handles a limited number of datasets.
+        tree_size = max(tree_size, 2)
+        while len(vds) > tree_size:
+            logger.debug(f'VirtualiZarr: Combining {len(vds)} datasets in groups of {tree_size}')
+            vds = [_combine(vds[i:i+tree_size]) for i in range(0, len(vds), tree_size)]
 
-        # repo = icechunk.Repository.create(storage, config)
-        # session=repo.writable_session('main')
+    combined_vds = _combine(vds)
 
-        # combined_vds.virtualize.to_icechunk(session.store)
+    if icechunk_store is not None:
+        logger.debug('VirtualiZarr: Writing combined dataset to Icechunk')
+        icechunk_store.write_virtual(combined_vds, allfiles, attrs=zattrs)
+        return
 
-        combined_vds.virtualize.to_kerchunk(output_file, format='json')
+    logger.debug('VirtualiZarr: Virtualising combined dataset')
+    try:
+        if file_type == 'parq':
+            combined_vds.virtualize.to_kerchunk(output_file, format='parquet', record_size=record_size)
+        else:
+            combined_vds.virtualize.to_kerchunk(output_file, format='json')
     except:
         raise ValueError('Kerchunk serialisation failed.')
 
@@ -202,12 +390,102 @@ def process_identical_vars(identical_dim_zarrays: dict, logger: logging.Logger):
         refs_to_output[f'{var}/.zarray'] = identical_dim_zarrays[var]
     return refs_to_output
 
-def process_agg_dims(agg_dim_zarrays: dict, logger: logging.Logger, ideal: int = 1000):
+def _chunk_offsets(chunk_count: list, blocks: Union[list,None] = None) -> list:
+    """
+    Chunk offset of each file along one aggregation dimension.
+
+    Files in the same block (i.e. with the same coordinate values along this
+    dimension) share an offset. Blocks are placed in order of first appearance.
+
+    :param chunk_count: (list) Number of chunks in each file along this dimension.
+
+    :param blocks:      (list) Block index of each file along this dimension. Each
+        file is a separate block if not given.
+
+    :returns:   The offset for each file, followed by the total number of chunks.
+    """
+    if blocks is None:
+        return [0] + [int(c) for c in np.cumsum(chunk_count)]
+
+    block_offsets, total = {}, 0
+    for count, block in zip(chunk_count, blocks):
+        if block not in block_offsets:
+            block_offsets[block] = total
+            total += count
+    return [block_offsets[b] for b in blocks] + [total]
+
+def _file_blocks(
+        ordered_refs: list[dict],
+        agg_dims: list,
+        native_files: Union[list,None] = None,
+        read_gap: int = 65536,
+    ) -> dict:
+    """
+    Determine the position of each file along each aggregation dimension.
+
+    Files with identical coordinate chunks along a dimension occupy the same
+    block of that dimension. The coordinate data is compared as raw bytes, so
+    no decoding is needed.
+
+    :returns:   Dictionary of the block index of each file, per dimension.
+    """
+    file_blocks = {dim: [] for dim in agg_dims}
+    identities  = {dim: {} for dim in agg_dims}
+    for file_ord, ref in enumerate(ordered_refs):
+        native_file = native_files[file_ord] if native_files is not None else None
+        data = _read_ranges(ref, agg_dims, native_file=native_file, max_gap=read_gap)
+
+        for dim in agg_dims:
+            identity = hashlib.sha1()
+            for key in sorted(k for k in ref['refs'].keys() if k.split('/')[0] == dim):
+                if key.split('/')[-1].startswith('.'):
+                    continue
+                value = ref['refs'][key]
+                identity.update(key.encode())
+                if isinstance(value, str):
+                    identity.update(value.encode())
+                else:
+                    identity.update(data[key])
+            identity = identity.hexdigest()
+            if identity not in identities[dim]:
+                identities[dim][identity] = len(identities[dim])
+            file_blocks[dim].append(identities[dim][identity])
+
+    grid = [file_blocks[dim] for dim in agg_dims]
+    ncells = math.prod(len(identities[dim]) for dim in agg_dims)
+    if ncells != len(file_blocks[agg_dims[0]]) or len(set(zip(*grid))) != ncells:
+        raise NotImplementedError(
+            f'Files do not form a complete grid across aggregation dimensions {agg_dims}'
+        )
+    return file_blocks
+
+def _block_owners(file_blocks: dict, label_dims: list) -> set:
+    """
+    Files which first provide each block of an array spanning only
+    ``label_dims`` of the aggregation dimensions. Chunks of this array
+    from any other file are duplicates.
+    """
+    owners, seen = set(), set()
+    for file_ord, position in enumerate(zip(*[file_blocks[d] for d in label_dims])):
+        if position not in seen:
+            seen.add(position)
+            owners.add(file_ord)
+    return owners
+
+def process_agg_dims(
+        agg_dim_zarrays: dict, 
+        logger: logging.Logger, 
+        ideal: int = 1000, 
+        file_blocks: Union[dict,None] = None
+    ):
     """
     Process aggregation dimensions
     
     Catch uneven dtypes across the aggregation dimensions, allow for rechunking in b64.
+    For multiple aggregation dimensions, ``file_blocks`` gives the position of
+    each file along each dimension (see ``_file_blocks``).
     """
+    file_blocks = file_blocks or {}
     chunk_bounds    = {}
     agg_dim_rechunk = {}
     agg_dim_index   = {}
@@ -235,7 +513,7 @@ def process_agg_dims(agg_dim_zarrays: dict, logger: logging.Logger, ideal: int =
             chunk_count.append(int(chunks))
 
         arr = arr[0]
-        chunk_bounds[dim] = [0] + list(np.cumsum(chunk_count))
+        chunk_bounds[dim] = _chunk_offsets(chunk_count, file_blocks.get(dim))
 
         if standard_rechunk:
             logger.debug('PADOCC-A: Standard rechunking enabled')
@@ -279,13 +557,16 @@ def process_agg_vars(
         example_ref: dict,
         b64vars: list, 
         logger: logging.Logger,
-        ideal: int = 1000):
+        ideal: int = 1000,
+        file_blocks: Union[dict,None] = None):
 
     """
     Process aggregation variables.
     
-    Enable rechunking etc"""
+    Enable rechunking etc. Chunk bounds are determined separately along each 
+    aggregation dimension spanned by the variable."""
     
+    file_blocks = file_blocks or {}
     refs_to_output = {}
     agg_var_rechunk = {}
     agg_var_chunk_bounds = {}
@@ -300,27 +581,36 @@ def process_agg_vars(
 
         ndims = len(arr[0]['chunks'])
 
-        standard_rechunk = True
-        size_sum = 0
-        chunk_count = []
-        for a in arr:
-            chunks = a['shape'][0]/a['chunks'][0]
-            logger.debug(f'PADOCC-A: {var}: {len(chunk_count)} - {chunks}')
-            standard_rechunk = standard_rechunk and chunks%1==0
+        var_dims = json.loads(example_ref['refs'][f'{var}/.zattrs'])['_ARRAY_DIMENSIONS']
+        agg_indices = {dim: var_dims.index(dim) for dim in agg_dims if dim in var_dims}
+        if not agg_indices:
+            raise ValueError(f'Aggregation variable {var} does not span any of {agg_dims}')
 
-            chunk_count.append(int(chunks))
-            size_sum += a['shape'][0]
+        agg_var_chunk_bounds[var] = {}
+        for dim, dim_ord in agg_indices.items():
+            standard_rechunk = True
+            size_sum = 0
+            chunk_count = []
+            for a in arr:
+                chunks = a['shape'][dim_ord]/a['chunks'][dim_ord]
+                logger.debug(f'PADOCC-A: {var}: {len(chunk_count)} - {chunks}')
+                standard_rechunk = standard_rechunk and chunks%1==0
+
+                chunk_count.append(int(chunks))
+                size_sum += a['shape'][dim_ord]
 
-        chunk_bounds = [0] + list(np.cumsum(chunk_count))
+            agg_var_chunk_bounds[var][dim] = _chunk_offsets(chunk_count, file_blocks.get(dim))
+
+        chunk_bounds = list(agg_var_chunk_bounds[var].values())[-1]
 
         if ndims == 1 and var in b64vars:
             # Suitable for base64 rechunking.
             logger.debug('PADOCC-A: Suitable for base64 encoding.')
 
             # Rechunking by combining existing chunks in predictable way.
+            nchunks = chunk_bounds[-1]
             if standard_rechunk:
                 logger.debug('PADOCC-A: Standard rechunking enabled.')
-                nchunks = chunk_bounds[-1]
                 comb = 1
                 while nchunks/comb > ideal:
                     comb += 1
@@ -347,15 +637,7 @@ def process_agg_vars(
             # Base64 viable but does not meet conditions
             arr = arr[0]
 
-        # Only for 1d aggregations
-        agg_var_chunk_bounds[var] = {
-            agg_dims[0]: chunk_bounds
-        }
-
-        agg_indices = {}
-        for dim in agg_dims:
-            dim_ord = json.loads(example_ref['refs'][f'{var}/.zattrs'])['_ARRAY_DIMENSIONS'].index(dim)
-            agg_indices[dim] = dim_ord
+        for dim, dim_ord in agg_indices.items():
             arr['shape'][dim_ord] = agg_dim_zarrays[dim]['shape'][0]
 
         agg_dim_index[var] = agg_indices
@@ -366,57 +648,135 @@ def process_agg_vars(
 
     return refs_to_output, agg_var_rechunk, agg_dim_index, agg_var_chunk_bounds
 
-def apply_rechunking(rechunk_cache: dict, agg_dim_rechunk: dict, logger: logging.Logger):
-
-    refs_to_output = {}
-
-    for dim, coords in rechunk_cache.items():
-        logger.debug(f'PADOCC-A: Rechunking {dim}: {len(coords.keys())} by {len(coords["/0"])}')
-        for coord, b64set in coords.items():
-
-            combined_b64 = b64set[0]
+class RechunkBuffer:
+    """
+    Bounded-memory buffer for combining inlined chunks when rechunking.
 
-            # Fill the last chunk with fillvalues?
-            if len(b64set) < agg_dim_rechunk[dim]:
-                # Method deemed unreliable
-                raise ValueError('Unsupported chunk/shape size for rechunking')
-                #b64set.append(b64set[-1])
+    Chunks are collected per rechunked group (i.e. per new chunk). Each group
+    is combined and released as soon as all of its members have arrived. If
+    the partially filled groups exceed ``max_memory`` bytes, their chunks are
+    spilled to a temporary file and read back when the group is complete.
+    """
 
-            for b64 in b64set[1:]:
-                combined_b64 += b64
-            refs_to_output[f'{dim}{coord}'] = (b'base64:' + base64.b64encode(combined_b64)).decode()
+    def __init__(
+            self, 
+            agg_rechunk: dict, 
+            max_memory: int = 100000000, 
+            logger: Union[logging.Logger,None] = None
+        ) -> None:
+        """
+        :param agg_rechunk:     (dict) Number of chunks combined per group, for 
+            each rechunked array.
+
+        :param max_memory:      (int) Bytes held in memory before spilling to disk.
+        """
+        self.agg_rechunk = agg_rechunk
+        self.max_memory = max_memory
+        self.logger = logger or FalseLogger()
+
+        # Each member is either bytes, or an (offset, size) in the spill file.
+        self._groups = {}
+        self._held = 0
+        self._spill = None
+
+    def add(self, label: str, coord: str, dataset: list[bytes]) -> Union[tuple,None]:
+        """
+        Add chunks to a group.
+
+        :returns:   The key and base64 value of the combined chunk if the group
+            is now complete, otherwise None.
+        """
+        group = self._groups.setdefault((label, coord), [])
+        group.extend(dataset)
+        self._held += sum(len(d) for d in dataset)
+
+        if len(group) >= self.agg_rechunk[label]:
+            return self._complete(label, coord)
+
+        if self._held > self.max_memory:
+            self._spill_groups()
+        return None
+
+    def _complete(self, label: str, coord: str) -> tuple:
+        """
+        Combine the members of a group into a preallocated buffer.
+        """
+        group = self._groups.pop((label, coord))
+        sizes = [m[1] if isinstance(m, tuple) else len(m) for m in group]
+
+        combined = bytearray(sum(sizes))
+        view = memoryview(combined)
+        pos = 0
+        for member, size in zip(group, sizes):
+            if isinstance(member, tuple):
+                self._spill.seek(member[0])
+                self._spill.readinto(view[pos:pos+size])
+            else:
+                view[pos:pos+size] = member
+                self._held -= size
+            pos += size
+
+        return f'{label}{coord}', (b'base64:' + base64.b64encode(combined)).decode()
+
+    def _spill_groups(self) -> None:
+        """
+        Move all chunks held in memory to the spill file.
+        """
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+            self.logger.debug('PADOCC-A: Spilling rechunk groups to disk')
+
+        self._spill.seek(0, os.SEEK_END)
+        for group in self._groups.values():
+            for i, member in enumerate(group):
+                if isinstance(member, tuple):
+                    continue
+                group[i] = (self._spill.tell(), len(member))
+                self._spill.write(member)
+        self._held = 0
+
+    def close(self) -> None:
+        """
+        Check all groups were completed and remove the spill file.
+        """
+        if self._spill is not None:
+            self._spill.close()
+
+        if self._groups:
+            # Filling the last chunk deemed unreliable
+            raise ValueError('Unsupported chunk/shape size for rechunking')
+
+def remap_keys(
+        array_label: str,
+        keys: list[str],
+        file_ord: int,
+        agg_dim_rechunk: dict,
+        label_dim_index: dict,
+        chunk_bounds: dict,
+    ) -> tuple[Union[list,None], Union[list,None]]:
+    """
+    Remap all chunk keys of one array from a single file.
 
-    return refs_to_output
+    The chunk coordinates are parsed into a single integer array, offset
+    per aggregation dimension and formatted back into keys together.
 
-def remap_key(
-        key: str, 
-        file_ord: int,  
-        agg_dim_rechunk: dict,
-        label_dim_index: dict, 
-        chunk_bounds: dict, 
-        rechunk_cache: dict,
-        data: Union[bytes,None],
-        logger: logging.Logger
-    ):
-    
-    array_label = key.split('/')[0]
+    :returns:   The new keys, or for rechunked arrays the rechunked coordinate
+        of each key (with None in place of the new keys).
+    """
+    coords = np.array(
+        [k[len(array_label)+1:].split('.') for k in keys], dtype=np.int64
+    ).reshape(len(keys), -1)
 
-    chunk_coords = [int(c) for c in key.split('/')[1].split('.')]
     for dim, index in label_dim_index.items():
-        chunk_coords[index] += chunk_bounds[dim][file_ord]
-
-    if array_label in agg_dim_rechunk and data is not None:
-        rechunk_coord = math.floor(chunk_coords[0]/agg_dim_rechunk[array_label])
-        
-        if f'/{rechunk_coord}' not in rechunk_cache[array_label]:
-            rechunk_cache[array_label][f'/{rechunk_coord}'] = []
+        coords[:, index] += chunk_bounds[dim][file_ord]
 
-        rechunk_cache[array_label][f'/{rechunk_coord}'].append(data)
-        # This value is not yet added to the mzz combined dict.
-        return None, rechunk_cache
+    if array_label in agg_dim_rechunk:
+        return None, (coords[:, 0] // agg_dim_rechunk[array_label]).tolist()
 
-    new_key = f'{array_label}/{".".join([str(c) for c in chunk_coords])}'
-    return new_key, rechunk_cache
+    new_keys = coords[:, 0].astype(str)
+    for col in range(1, coords.shape[1]):
+        new_keys = np.char.add(np.char.add(new_keys, '.'), coords[:, col].astype(str))
+    return np.char.add(f'{array_label}/', new_keys).tolist(), None
 
 def _b64_summ(data: bytes, npdtype: str, b64_nth_value_set: list, file_ord: int):
     """
@@ -439,6 +799,210 @@ def _b64_summ(data: bytes, npdtype: str, b64_nth_value_set: list, file_ord: int)
     value = struct.unpack(sdtype, data)[0] + sum_offset
     return struct.pack(sdtype, value)
 
+def _metadata_refs(ref: dict) -> dict:
+    """
+    Extract only the metadata keys (.zattrs, .zarray, .zgroup) from a 
+    set of refs, so the metadata pass does not retain chunk references.
+    Metadata from aggregated refs may be stored as objects rather than 
+    JSON strings, so all values are returned as strings.
+    """
+    return {
+        'version': ref.get('version'),
+        'refs': {
+            k: v if isinstance(v, str) else json.dumps(v) 
+            for k, v in ref['refs'].items() if k.split('/')[-1].startswith('.')
+        }
+    }
+
+def _coalesce_ranges(ranges: list[tuple], max_gap: int) -> list[tuple]:
+    """
+    Merge byte ranges separated by at most ``max_gap`` bytes.
+
+    :param ranges:      (list) Tuples of (offset, size, key).
+
+    :param max_gap:     (int) Largest gap between two ranges that will be
+        read rather than split into separate reads.
+
+    :returns:   List of (start, end, members) for each merged range, where 
+        members are the (offset, size, key) tuples within that range.
+    """
+    merged = []
+    for offset, size, key in sorted(ranges, key=lambda r: r[0]):
+        if merged and offset - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], offset + size)
+            merged[-1][2].append((offset, size, key))
+        else:
+            merged.append([offset, offset + size, [(offset, size, key)]])
+    return [tuple(m) for m in merged]
+
+def _read_ranges(
+        ref: dict, 
+        b64vars: list, 
+        native_file: Union[str,None] = None,
+        max_gap: int = 65536,
+    ) -> dict:
+    """
+    Read all chunks to be inlined for a single set of refs.
+
+    The (offset, size) ranges are sorted and merged per file, so each file
+    is read in a few large sequential reads rather than one read per chunk. 
+    Remote filesystems receive the merged ranges in a single ``cat_ranges`` call.
+
+    :param ref:         (dict) Kerchunk refs for a single file (or partial ref set).
+
+    :param b64vars:     (list) Variables to be inlined.
+
+    :param native_file: (str) Path to read from in place of the path in each ref.
+
+    :param max_gap:     (int) Largest gap in bytes bridged by a single read.
+
+    :returns:   Dictionary of chunk data for each key.
+    """
+    ranges = {}
+    for key, value in ref['refs'].items():
+        if key.split('/')[0] not in b64vars or not isinstance(value, list):
+            continue
+        readfile = native_file or value[0]
+        ranges.setdefault(readfile, []).append((int(value[1]), int(value[2]), key))
+
+    data = {}
+    for readfile, file_ranges in ranges.items():
+        merged = _coalesce_ranges(file_ranges, max_gap)
+        fs, path = fsspec.core.url_to_fs(readfile)
+
+        if 'file' in make_tuple(fs.protocol):
+            blocks = []
+            with fs.open(path, 'rb') as infile:
+                for start, end, _ in merged:
+                    infile.seek(start)
+                    blocks.append(infile.read(end - start))
+        else:
+            blocks = fs.cat_ranges(
+                [path]*len(merged), 
+                [m[0] for m in merged], 
+                [m[1] for m in merged]
+            )
+
+        for (start, _, members), block in zip(merged, blocks):
+            for offset, size, key in members:
+                data[key] = block[offset-start:offset-start+size]
+
+    return data
+
+def _encode_file(
+        file_ord: int,
+        ref: dict,
+        native_files: Union[list,None],
+        b64vars: list,
+        identical_vars: list,
+        agg_dims: list,
+        agg_vars: list,
+        agg_dim_rechunk: dict,
+        agg_var_rechunk: dict,
+        agg_dim_index: dict,
+        chunk_bounds: dict,
+        agg_var_chunk_bounds: dict,
+        logger: logging.Logger,
+        owners: Union[dict,None] = None,
+        read_gap: int = 65536,
+    ) -> tuple[list,dict]:
+    """
+    Encode and remap the chunk references for a single file.
+
+    No shared state is modified, so files may be encoded concurrently. 
+    Chunks of arrays listed in ``owners`` are skipped unless this file
+    is the first to provide their block.
+
+    :returns:   The batch of (new_key, value, aggregated) for each chunk key to
+        be written, and the rechunking cache for this file only.
+    """
+    owners = owners or {}
+    skip = [label for label, files in owners.items() if file_ord not in files]
+
+    inlined = _read_ranges(
+        ref, [v for v in b64vars if v not in skip], 
+        native_file=native_files[file_ord] if native_files is not None else None,
+        max_gap=read_gap
+    )
+
+    file_cache = {a:{} for a in agg_dim_rechunk.keys()} | {a:{} for a in agg_var_rechunk.keys()}
+    batch = []
+
+    # Chunk keys of aggregated arrays, remapped together per array.
+    agg_groups = {}
+    for key, value in ref['refs'].items():
+        data = None
+
+        # Metadata already written in first pass
+        if '.zattrs' in key or '.zarray' in key or '.zgroup' in key:
+            continue
+
+        array_label = key.split('/')[0]
+        if array_label in skip:
+            continue
+
+        if array_label in b64vars and isinstance(value, str) and value.startswith('base64:'):
+            # Already encoded in a partial ref set.
+            data = base64.b64decode(value[7:])
+
+        elif array_label in b64vars:
+            data = inlined[key]
+            value = (b'base64:' + base64.b64encode(data)).decode()
+
+        if array_label not in identical_vars and (array_label in agg_dims or array_label in agg_vars):
+            agg_groups.setdefault(array_label, []).append((key, value, data))
+            continue
+
+        batch.append((key, value, False))
+
+    for array_label, group in agg_groups.items():
+        if array_label in agg_dims:
+            rechunk_set = agg_dim_rechunk
+            bounds      = chunk_bounds
+        else:
+            rechunk_set = agg_var_rechunk
+            bounds      = agg_var_chunk_bounds[array_label]
+
+        keys, values, dataset = zip(*group)
+
+        # Remap keys to determine new positions
+        new_keys, rechunk_coords = remap_keys(
+            array_label, keys, file_ord, rechunk_set,
+            agg_dim_index.get(array_label,{}), bounds)
+
+        if rechunk_coords is not None:
+            # In the case of rechunking, values are combined later.
+            for coord, data in zip(rechunk_coords, dataset):
+                file_cache[array_label].setdefault(f'/{coord}', []).append(data)
+            continue
+
+        batch += [(new_key, value, True) for new_key, value in zip(new_keys, values)]
+
+    return batch, file_cache
+
+def _encode_files(ordered_refs, workers: int = 1, **kwargs):
+    """
+    Encode each file in ``ordered_refs``, yielding the results in file order.
+
+    With multiple workers, files are encoded in a thread pool while earlier
+    results are consumed. At most ``2*workers`` files are in progress at once,
+    so lazily loaded refs are not all held in memory.
+    """
+    if workers is None or workers <= 1:
+        for file_ord, ref in enumerate(ordered_refs):
+            yield _encode_file(file_ord, ref, **kwargs)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for file_ord, ref in enumerate(ordered_refs):
+            pending.append(pool.submit(_encode_file, file_ord, ref, **kwargs))
+            if len(pending) >= 2*workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
 def padocc_combine(
         ordered_refs: list[dict],
         native_files: list, 
@@ -448,7 +1012,14 @@ def padocc_combine(
         identical_vars: Union[list,None] = None, 
         zattrs: Union[dict,None] = None,
         b64vars: Union[list,None] = None,
-        logger: Union[None, logging.Logger] = None
+        logger: Union[None, logging.Logger] = None,
+        rechunk: bool = True,
+        read_gap: int = 65536,
+        workers: Union[int,None] = None,
+        compression: Union[str,None] = None,
+        file_type: str = 'json',
+        record_size: int = 10000,
+        rechunk_memory: int = 100000000,
     ) -> Union[None,dict]:
     """
     Will only support existing aggregation dimensions for now.
@@ -457,46 +1028,69 @@ def padocc_combine(
      - Aggregation dimensions (check against size constraints for rechunking.)
      - Chunks under threshold.
      - Specific variables via b64 vars.
+
+    The refs are read in two passes, first for metadata and then for 
+    chunk references, which are written to the output file as they are 
+    remapped. ``ordered_refs`` may be any re-iterable sequence (e.g. refs 
+    loaded lazily from the cache), so only one file's refs need to be 
+    held in memory at a time.
+
+    ``ordered_refs`` may also be previously aggregated (partial) ref sets, 
+    in which case ``native_files`` may be None. Inlined base64 values are 
+    then decoded rather than re-read, and any other encoded chunks are read
+    from the path given in each ref. Partial ref sets should be created with 
+    ``rechunk=False`` so chunk sizes remain consistent for merging.
+
+    Chunks to be encoded are read per file in merged byte ranges, where
+    ``read_gap`` is the largest gap (in bytes) between chunks read together.
+    With ``workers``, files are read and remapped in a thread pool, and
+    the results merged into the output in file order.
+
+    The output file may be compressed with ``compression`` ('gzip' or 'zstd'),
+    which is otherwise inferred from a '.gz' or '.zst' file extension. With
+    ``file_type='parq'`` the output is instead a Parquet reference store with
+    ``record_size`` references per Parquet file.
+
+    Rechunked chunks are written as soon as each new chunk is complete, with 
+    incomplete chunks spilled to disk beyond ``rechunk_memory`` bytes.
     """
 
     if logger is None:
         logger = init_logger(2, 'padocc_aggregator')
 
-    if len(agg_dims) != 1:
-        raise NotImplementedError(
-            'Multi-dimensional aggregation not supported'
-        )
-
     logger.info("PADOCC-A: Starting PADOCC aggregator")
 
+    # Metadata pass - chunk references are not retained.
+    meta_refs = [_metadata_refs(r) for r in ordered_refs]
+
     # Always attempt b64 encoding for agg dims
     b64vars = b64vars or []
     b64vars        = list(set(b64vars + agg_dims))
     identical_vars = identical_vars or []
     zattrs         = (zattrs or {}) | {'aggregation':'padocc'}
 
-    combined_zattrs = ordered_refs[0]['refs']['.zattrs']
+    combined_zattrs = meta_refs[0]['refs']['.zattrs']
     if isinstance(combined_zattrs,str):
         combined_zattrs = json.loads(combined_zattrs)
     combined_zattrs.update(zattrs)
 
     mzz = {
-        'version': ordered_refs[0]['version'],
+        'version': meta_refs[0]['version'],
         'refs': {
-            '.zgroup': ordered_refs[0]['refs']['.zgroup'],
+            '.zgroup': meta_refs[0]['refs']['.zgroup'],
             '.zattrs': combined_zattrs
         }
     }
 
     # Initial values, where shape must be updated.
-    agg_dim_zarrays       = {dim: [json.loads(r['refs'][f'{dim}/.zarray']) for r in ordered_refs] for dim in agg_dims}
-    agg_var_zarrays       = {var: [json.loads(r['refs'].get(f'{var}/.zarray','None')) for r in ordered_refs] for var in agg_vars}
+    agg_dim_zarrays       = {dim: [json.loads(r['refs'][f'{dim}/.zarray']) for r in meta_refs] for dim in agg_dims}
+    agg_var_zarrays       = {var: [json.loads(r['refs'].get(f'{var}/.zarray','None')) for r in meta_refs] for var in agg_vars}
 
     pure_dims = {}
     # Pure dimensions do not have associated dim zarrays.
     identical_dim_zarrays = {}
     for var in identical_vars:
-        for r in ordered_refs:
+        for r in meta_refs:
             zarrays = []
             if f'{var}/.zarray' in r['refs']:
                 zarrays.append(json.loads(r['refs'][f'{var}/.zarray']))
@@ -510,7 +1104,7 @@ def padocc_combine(
         if v in pure_dims.keys():
             continue
 
-        units = [json.loads(r['refs'][f'{v}/.zattrs']).get('units',None) for r in ordered_refs]
+        units = [json.loads(r['refs'][f'{v}/.zattrs']).get('units',None) for r in meta_refs]
         if len(set(units)) > 1:
             raise NotImplementedError(
                 'Unit conversion is not implemented in the PADOCC Aggregator'
@@ -521,82 +1115,103 @@ def padocc_combine(
     for k, v in refs_to_output.items():
         mzz['refs'][k] = v
 
+    # Position of each file along each aggregation dimension.
+    file_blocks = None
+    if len(agg_dims) > 1:
+        file_blocks = _file_blocks(ordered_refs, agg_dims, native_files=native_files, read_gap=read_gap)
+        logger.info(
+            'PADOCC-A: File grid: ' + 
+            ' x '.join(f'{dim} ({len(set(file_blocks[dim]))})' for dim in agg_dims))
+
     # Process Aggregation Dimensions
-    refs_to_output, chunk_bounds, agg_dim_rechunk, agg_dim_index = process_agg_dims(agg_dim_zarrays, logger)
+    ideal = 1000 if rechunk else math.inf
+    refs_to_output, chunk_bounds, agg_dim_rechunk, agg_dim_index = process_agg_dims(
+        agg_dim_zarrays, logger, ideal=ideal, file_blocks=file_blocks)
     for k, v in refs_to_output.items():
         mzz['refs'][k] = v
 
     # Process Aggregation Variables
     refs_to_output, agg_var_rechunk, agg_dim_index, agg_var_chunk_bounds = process_agg_vars(agg_var_zarrays, agg_dim_zarrays, 
                                                     agg_dim_index, agg_dims,
-                                                    ordered_refs[0], b64vars, logger)
+                                                    meta_refs[0], b64vars, logger, ideal=ideal,
+                                                    file_blocks=file_blocks)
     for k, v in refs_to_output.items():
         mzz['refs'][k] = v
 
-    b64vars = list(agg_dim_rechunk.keys()) + list(agg_var_rechunk.keys()) + list(b64vars)
-
-    rechunk_cache = {a:{} for a in agg_dim_rechunk.keys()} | {a:{} for a in agg_var_rechunk.keys()}
-
-    #additive_encoding = False
-    for file_ord, ref in enumerate(ordered_refs):
-        logger.info(f'PADOCC-A: Encoding file: {file_ord+1}/{len(ordered_refs)}')
-        infile = None
-
+    # Lazy combine attrs - take first value (will update from common zattrs)
+    for ref in meta_refs:
         for key, value in ref['refs'].items():
-            data = None
+            if key not in mzz['refs']:
+                mzz['refs'][key] = value
 
-            # Lazy combine attrs - take first value (will update from common zattrs)
-            if '.zattrs' in key or '.zarray' in key or '.zgroup' in key:
-                if key not in mzz['refs']:
-                    mzz['refs'][key] = value
-                continue
+    nfiles = len(meta_refs)
+    del meta_refs
 
-            array_label = key.split('/')[0]
-            if array_label in b64vars:
+    b64vars = list(agg_dim_rechunk.keys()) + list(agg_var_rechunk.keys()) + list(b64vars)
 
-                # Data Encoding - function
+    rechunk_buffer = RechunkBuffer(agg_dim_rechunk | agg_var_rechunk, max_memory=rechunk_memory, logger=logger)
 
-                if infile is None:
-                    readfile = native_files[file_ord]
-                    fs, path = fsspec.core.url_to_fs(readfile)
-                    infile = fs.open(path, 'rb')
+    # Files providing the chunks of arrays which do not span all aggregation dimensions.
+    owners = {}
+    if file_blocks is not None:
+        for label, label_index in agg_dim_index.items():
+            if len(label_index) < len(agg_dims):
+                owners[label] = _block_owners(file_blocks, list(label_index.keys()))
 
-                infile.seek(int(value[1]))
-                data = infile.read(int(value[2]))
+    if file_type == 'parq':
+        writer = ParqRefWriter(output_file, record_size=record_size)
+    else:
+        writer = RefWriter(output_file, mzz['version'], compression=compression)
+    try:
+        for k, v in mzz['refs'].items():
+            writer.write(k, v)
+
+        # Aggregation index of all keys written so far.
+        written = set(mzz['refs'].keys())
+
+        #additive_encoding = False
+        encode_kwargs = dict(
+            native_files=native_files,
+            b64vars=b64vars,
+            identical_vars=identical_vars,
+            agg_dims=agg_dims,
+            agg_vars=agg_vars,
+            agg_dim_rechunk=agg_dim_rechunk,
+            agg_var_rechunk=agg_var_rechunk,
+            agg_dim_index=agg_dim_index,
+            chunk_bounds=chunk_bounds,
+            agg_var_chunk_bounds=agg_var_chunk_bounds,
+            owners=owners,
+            logger=logger,
+            read_gap=read_gap,
+        )
 
-                value = (b'base64:' + base64.b64encode(data)).decode()
+        for file_ord, (batch, file_cache) in enumerate(
+                _encode_files(ordered_refs, workers=workers, **encode_kwargs)):
+            logger.info(f'PADOCC-A: Encoding file: {file_ord+1}/{nfiles}')
+
+            # Extend in file order so rechunked data is combined in sequence.
+            for label, coords in file_cache.items():
+                for coord, dataset in coords.items():
+                    combined = rechunk_buffer.add(label, coord, dataset)
+                    if combined is not None:
+                        writer.write(*combined)
+
+            for new_key, value, aggregated in batch:
+                if new_key in written:
+                    if aggregated:
+                        raise ValueError(f'Overlapping chunk sections for key: {new_key}')
+                    # Non-aggregated keys - keep the first value.
+                    logger.debug(f'PADOCC-A: Duplicate key {new_key} skipped')
+                    continue
 
-                # End Data Encoding
+                written.add(new_key)
+                writer.write(new_key, value)
 
-            if array_label in identical_vars:
-                new_key = key
-            elif array_label in agg_dims or array_label in agg_vars:
-                if array_label in agg_dims:
-                    rechunk_set = agg_dim_rechunk
-                    bounds      = chunk_bounds
-                else:
-                    rechunk_set = agg_var_rechunk
-                    bounds      = agg_var_chunk_bounds[array_label]
-
-                # Remap key to determine new position
-                new_key, rechunk_cache = remap_key(key, file_ord, rechunk_set,
-                                                   agg_dim_index.get(array_label,{}), 
-                                                   bounds, rechunk_cache, data, logger)
-                # In the case of rechunking, do not assign value in this loop.
-                if new_key is None:
-                    continue
-                
-                if new_key in mzz['refs']:
-                    raise ValueError(f'Overlapping chunk sections for key: {new_key}')
-            mzz['refs'][new_key] = value
+        # All rechunked groups should have been written.
+        rechunk_buffer.close()
+    except Exception as err:
+        writer.abort()
+        raise err
 
-    # Apply collected rechunking
-    refs_to_output = apply_rechunking(rechunk_cache, agg_dim_rechunk | agg_var_rechunk, logger)
-    for k, v in refs_to_output.items():
-        mzz['refs'][k] = v
-            
-    if output_file is not None:
-        with open(output_file, 'w') as f:
-            f.write(json.dumps(mzz))
-    else:
-        return mzz
+    return writer.close()
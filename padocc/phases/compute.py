@@ -3,12 +3,17 @@ __contact__   = "daniel.westwood@stfc.ac.uk"
 __copyright__ = "Copyright 2023 United Kingdom Research and Innovation"
 
 import base64
+import hashlib
 import json
 import logging
+import math
 import os
+import sys
 from datetime import datetime
-from typing import Optional, Union
+from itertools import islice
+from typing import Iterator, Optional, Union
 
+import fsspec
 import glob
 import numpy as np
 import rechunker
@@ -17,12 +22,15 @@ import xarray as xr
 from padocc.core import FalseLogger, LoggedOperation, ProjectOperation
 from padocc.core.errors import (KerchunkDriverFatalError, PartialDriverError,
                                 SourceNotFoundError, ConcatFatalError)
-from padocc.core.filehandlers import JSONFileHandler, ZarrStore, KerchunkFile
-from padocc.core.utils import find_closest, make_tuple, timestamp
+from padocc.core.collectors import AttrReducer, CachedRefs, ConversionStats
+from padocc.core.filehandlers import (JSONFileHandler, ZarrStore, KerchunkFile,
+                                      CacheManifest, CACHE_FORMATS, _import_icechunk)
+from padocc.core.utils import find_closest, make_tuple, mem_to_val, timestamp
 from padocc.phases.validate import ValidateDatasets
 from padocc.core.logs import levels, set_verbose
 
-from padocc.phases.aggregate import virtualise, mzz_combine, padocc_combine
+from padocc.phases.aggregate import (AggregationPlanner, virtualise, 
+                                     mzz_combine, padocc_combine)
 
 import warnings
 
@@ -39,6 +47,24 @@ from kerchunk.grib2 import GribToZarr
 
 CONCAT_MSG = 'See individual files for more details'    
 
+# Driver assumed where none is known or detected.
+DEFAULT_DRIVER = 'ncf3'
+
+# Leading bytes identifying each supported source format.
+MAGIC_BYTES = {
+    b'\x89HDF\r\n\x1a\n': 'hdf5',
+    b'CDF\x01': 'ncf3',
+    b'CDF\x02': 'ncf3',
+    b'II*\x00': 'tif',
+    b'MM\x00*': 'tif',
+    b'II+\x00': 'tif',
+    b'MM\x00+': 'tif',
+    b'GRIB': 'grib',
+}
+
+# HDF5 superblocks may follow a user block of 512 bytes or any larger power of two.
+HDF5_OFFSETS = [0, 512, 1024, 2048, 4096]
+
 class KerchunkConverter(LoggedOperation):
     """Class for converting a single file to a Kerchunk reference object. Handles known
     or unknown file types (NetCDF3/4 versions)."""
@@ -77,9 +103,25 @@ class KerchunkConverter(LoggedOperation):
             verbose=verbose
         )
 
-    def run(self, nfile: str, filehandler=None, extension=None, **kwargs) -> dict:
+    def run(
+            self, 
+            nfile: str, 
+            filehandler=None, 
+            extension=None, 
+            detect: bool = True, 
+            **kwargs
+        ) -> dict:
         """
-        Safe creation allows for known issues and tries multiple drivers
+        Safe creation allows for known issues and tries multiple drivers.
+
+        The file type is identified from the leading bytes of the file where
+        possible, so the correct driver is used first. Other drivers are only
+        tried if the file type cannot be identified or the driver fails.
+
+        :param extension:   (str) Driver to try first if the file type cannot
+            be detected (or if detection is disabled).
+
+        :param detect:      (bool) Identify the file type from the file itself.
 
         :returns:   dictionary of Kerchunk references if successful, raises error
                     otherwise if unsuccessful.
@@ -88,6 +130,9 @@ class KerchunkConverter(LoggedOperation):
         if not os.path.isfile(nfile):
             raise SourceNotFoundError(sfile=nfile)
 
+        if detect:
+            extension = self.detect_type(nfile) or extension
+
         supported_extensions = [ext for ext in list(self.drivers.keys()) if ext != extension]
 
         tdict = None
@@ -112,6 +157,33 @@ class KerchunkConverter(LoggedOperation):
 
         return tdict, ctype
 
+    def detect_type(self, nfile: str) -> Union[str,None]:
+        """
+        Identify the driver for a file from its leading bytes.
+
+        :param nfile:   (str) Path to a local native file.
+
+        :returns:   The driver name if the format is recognised, otherwise None.
+        """
+        try:
+            with open(nfile, 'rb') as f:
+                header = f.read(8)
+                for magic, ctype in MAGIC_BYTES.items():
+                    if header.startswith(magic):
+                        self.logger.debug(f'Detected {ctype} file type')
+                        return ctype
+
+                for offset in HDF5_OFFSETS[1:]:
+                    f.seek(offset)
+                    if f.read(8) == b'\x89HDF\r\n\x1a\n':
+                        self.logger.debug('Detected hdf5 file type (with user block)')
+                        return 'hdf5'
+        except OSError:
+            pass
+
+        self.logger.debug('Unable to detect file type')
+        return None
+
     def _convert_kerchunk(self, nfile: str, ctype, **kwargs) -> None:
         """
         Perform conversion to zarr with exceptions for bypassing driver errors.
@@ -159,6 +231,160 @@ class KerchunkConverter(LoggedOperation):
         """Wrapper for converting GRIB type files to Kerchunk"""
         return GribToZarr(gfile, **kwargs).translate()
 
+def _convert_native_file(
+        nfile: str,
+        cache_dir: str,
+        label: str,
+        ctype: Union[str,None] = None,
+        create_kwargs: Union[dict,None] = None,
+        bypass_driver: bool = False,
+        detect: bool = True,
+        cache_format: str = 'json',
+    ) -> tuple[Union[str,None],float]:
+    """
+    Convert a single native file to a Kerchunk cache file.
+
+    Used as the worker function for process-pool conversion, the refs 
+    are written to ``{cache_dir}/{label}.{cache_format}`` rather than 
+    passed back to the parent process.
+
+    :returns:   The driver type used for conversion (None if all drivers failed),
+        and the conversion time in seconds.
+    """
+    t1 = datetime.now()
+    converter = KerchunkConverter(logger=FalseLogger(), bypass_driver=bypass_driver)
+    cachefile = CACHE_FORMATS[cache_format](cache_dir, label, logger=FalseLogger())
+    try:
+        _, ctype = converter.run(
+            nfile, filehandler=cachefile, extension=ctype, 
+            detect=detect, **(create_kwargs or {}))
+    except KerchunkDriverFatalError:
+        ctype = None
+    return ctype, (datetime.now()-t1).total_seconds()
+
+def _file_stat(nfile: str) -> list:
+    """
+    Size and modification time of a native file, or None values
+    for files not on the local filesystem.
+    """
+    try:
+        stat = os.stat(nfile)
+    except OSError:
+        return [None, None]
+    return [stat.st_size, stat.st_mtime]
+
+def _coord_range(nfile: str, dim: str) -> list:
+    """
+    Read the [min, max, length] of a single coordinate variable from a native
+    file. Uses netCDF4 to read the single variable where possible, so the 
+    full dataset is not decoded.
+    """
+    try:
+        import netCDF4
+        with netCDF4.Dataset(nfile) as ds:
+            var = ds.variables[dim]
+            var.set_auto_mask(False)
+            values = np.asarray(var[:])
+    except Exception:
+        # Other formats e.g. GRIB, Tiff
+        ds = xr.open_dataset(nfile, decode_times=False)
+        values = np.asarray(ds[dim].values)
+        ds.close()
+
+    return [values.min().item(), values.max().item(), int(values.size)]
+
+def _coord_units(nfile: str, dim: str) -> Union[str,None]:
+    """
+    Read the units of a single coordinate variable from a native file,
+    without reading any data where netCDF4 can open the file.
+    """
+    try:
+        import netCDF4
+        with netCDF4.Dataset(nfile) as ds:
+            return getattr(ds.variables[dim], 'units', None)
+    except Exception:
+        # Other formats e.g. GRIB, Tiff
+        ds = xr.open_dataset(nfile, decode_times=False)
+        units = ds[dim].attrs.get('units',None)
+        ds.close()
+        return units
+
+def _header_summary(nfile: str, small: int = 100000, full: int = 10000000) -> dict:
+    """
+    Summarise the dimensions and variables of a native file from its
+    header. Variables of up to ``full`` elements are hashed in full, larger 
+    variables are hashed from a strided sample spanning the whole array, along 
+    with the final element in each dimension.
+
+    Sampled hashes cannot detect differences confined to unsampled elements,
+    so two large variables differing in only a few values may appear identical.
+    Sampled variables are listed under ``sampled`` in the summary.
+
+    :param nfile:   (str) Path to the native file.
+
+    :param small:   (int) Approximate number of elements in the sample for 
+        variables too large to hash in full.
+
+    :param full:    (int) Maximum number of elements for a variable to be
+        hashed in full.
+    """
+    import netCDF4
+
+    def _hash(values) -> str:
+        values = np.asarray(values)
+        try:
+            content = values.tobytes()
+        except ValueError:
+            content = repr(values.tolist()).encode()
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    summary = {'dims': {}, 'vars': {}, 'sampled': []}
+    with netCDF4.Dataset(nfile) as ds:
+        for name, dim in ds.dimensions.items():
+            summary['dims'][name] = len(dim)
+
+        for name, var in ds.variables.items():
+            var.set_auto_mask(False)
+            if var.size <= max(small, full) or var.ndim == 0:
+                vhash = _hash(var[:])
+            else:
+                # Equal stride in each dimension giving about `small` elements.
+                ndim    = max(1, sum(1 for n in var.shape if n > 1))
+                stride  = math.ceil((var.size/small) ** (1/ndim))
+                sample  = tuple(slice(0, None, stride) for _ in var.shape)
+                tail    = tuple(slice(-1, None) for _ in var.shape)
+                vhash = _hash(var[sample]) + _hash(var[tail])
+                summary['sampled'].append(name)
+
+            summary['vars'][name] = {
+                'dims': list(var.dimensions),
+                'shape': list(var.shape),
+                'hash': vhash,
+            }
+    return summary
+
+def _ref_nbytes(ref: dict, sample: int = 100) -> int:
+    """
+    Estimated in-memory size of a set of Kerchunk refs.
+
+    Up to ``sample`` entries, spaced evenly through the refs, are measured 
+    with ``sys.getsizeof`` (key, value and any list items) and scaled to the
+    total number of entries, plus the size of the dictionary itself. This is 
+    an estimate only - entries vary in size, and objects shared between entries
+    are counted for each.
+    """
+    refs = ref['refs']
+    if len(refs) == 0:
+        return sys.getsizeof(refs)
+
+    measured, count = 0, 0
+    for key, value in islice(refs.items(), 0, None, max(1, len(refs)//sample)):
+        measured += sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, list):
+            measured += sum(sys.getsizeof(v) for v in value)
+        count += 1
+    return sys.getsizeof(refs) + int(measured * len(refs) / count)
+
 class ComputeOperation(ProjectOperation):
     """
     PADOCC Dataset Processor Class, capable of processing a single
@@ -177,6 +403,7 @@ class ComputeOperation(ProjectOperation):
             skip_concat : bool = False, 
             label : str = 'compute',
             is_trial: bool = False,
+            append: bool = False,
             **kwargs
         ) -> None:
         """
@@ -209,6 +436,9 @@ class ComputeOperation(ProjectOperation):
 
         :param is_trial:        (bool)
 
+        :param append:          (bool) Open the existing revision for extension with
+            ``append``, rather than determining a new version for output.
+
         :param parallel:        (str)
 
         :param identical_dims:  (list) A set of manually supplied dimension names applied for aggregation.
@@ -261,7 +491,8 @@ class ComputeOperation(ProjectOperation):
         self.partial = (limiter and num_files != limiter)
 
         # Perform this later
-        self._determine_version()
+        if not append:
+            self._determine_version()
         
         self.limiter = limiter
         if not self.limiter:
@@ -312,9 +543,12 @@ class ComputeOperation(ProjectOperation):
             'pre_kwargs': self.pre_kwargs,
         }
     
-    def order_native_files(self) -> Union[list,None]:
+    def order_native_files(self, workers: Union[int,None] = None) -> Union[list,None]:
         """
         Ensure ordering of native files based on aggregation dimensions.
+
+        :param workers:     (int) Number of worker processes for reading
+            coordinate ranges, defaults to the number of available CPUs.
         """
         self.logger.info('Determining native file order')
         concat = self.detail_cfg.get('kwargs',{}).get('combine_kwargs',{}).get('concat_dims',None)
@@ -332,10 +566,9 @@ class ComputeOperation(ProjectOperation):
         sample_run = (self.limiter != len(self.allfiles.get()))
         
         concat = concat[0]
-        ordering = []
-        for allfile in self.allfiles.get()[:self.limiter]:
-            ds = xr.open_dataset(allfile, decode_times=False)
-            ordering.append([ds[concat].min(),allfile])
+        ranges = self.get_coord_ranges(
+            self.allfiles.get()[:self.limiter], concat, workers=workers)
+        ordering = [[r[0], allfile] for allfile, r in ranges.items()]
 
         new_fileorder = [f[1] for f in sorted(ordering)]
 
@@ -350,6 +583,145 @@ class ComputeOperation(ProjectOperation):
             self.logger.info('Native file subset ordered')
             return new_fileorder
 
+    def get_coord_ranges(
+            self, 
+            files: list, 
+            dim: str, 
+            workers: Union[int,None] = None
+        ) -> dict:
+        """
+        Get the (min, max, length) of a coordinate for each native file.
+
+        Values are read from the coordinate variable alone, and cached
+        in the project directory (``coord_ranges.json``) alongside the
+        size and modification time of each file.
+
+        :param files:   (list) Native files to get ranges for.
+
+        :param dim:     (str) Coordinate variable name.
+
+        :param workers: (int) Number of worker processes for reading
+            uncached ranges, defaults to the number of available CPUs.
+
+        :returns:   Dictionary of file path to [min, max, length].
+        """
+        cache = self.coord_ranges.get()
+        cached = {}
+        if cache.get('dim',None) == dim:
+            cached = cache.get('files',{})
+
+        ranges, jobs = {}, []
+        for nfile in files:
+            entry = cached.get(nfile,None)
+            if entry is not None and not self._thorough and entry[3:] == _file_stat(nfile):
+                ranges[nfile] = entry[:3]
+            else:
+                jobs.append(nfile)
+
+        if len(jobs) == 0:
+            self.logger.info(f'Loaded cached "{dim}" ranges for {len(files)} files')
+            return ranges
+
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        self.logger.info(f'Reading "{dim}" ranges for {len(jobs)} files ({workers} workers)')
+
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                values = list(pool.map(
+                    _coord_range, jobs, [dim]*len(jobs),
+                    chunksize=max(1, int(len(jobs)/(workers*4)))
+                ))
+        else:
+            values = [_coord_range(nfile, dim) for nfile in jobs]
+
+        for nfile, value in zip(jobs, values):
+            ranges[nfile] = value
+            cached[nfile] = value + _file_stat(nfile)
+
+        self.coord_ranges.set({'dim': dim, 'files': cached})
+        self.coord_ranges.save()
+
+        # Preserve the requested file order.
+        return {nfile: ranges[nfile] for nfile in files}
+
+    def _append_dim(self) -> str:
+        """
+        Determine the single concatenation dimension along which
+        new files may be appended.
+        """
+        if self.detail_cfg.get('virtual_concat',False):
+            raise ValueError(
+                'Unable to append to a product with a virtual concatenation dimension'
+            )
+
+        kwargs = self.detail_cfg.get('kwargs', {})
+        self.combine_kwargs = self.combine_kwargs or kwargs.get('combine_kwargs',{})
+
+        concat = self.combine_kwargs.get('concat_dims',None) or []
+        if len(concat) != 1:
+            raise NotImplementedError(
+                f'Append is only supported for a single concatenation dimension - {concat}'
+            )
+        return concat[0]
+
+    def _open_existing_product(self) -> xr.Dataset:
+        """
+        Open the existing output product without decoding times,
+        for comparison with appended files.
+        """
+        if not os.path.isfile(self.dataset.filepath) and not os.path.isdir(self.dataset.filepath):
+            raise ValueError(
+                f'No existing product to append to - {self.dataset.filepath}'
+            )
+        if self.cloud_format == 'kerchunk' and self.file_type == 'parq':
+            return self.dataset.open_dataset(
+                backend_kwargs={"consolidated": False, "decode_times": False})
+        return self.dataset.open_dataset(decode_times=False)
+
+    def _order_appended_files(
+            self, 
+            new_files: list, 
+            existing: xr.DataArray, 
+            workers: Union[int,None] = None
+        ) -> list:
+        """
+        Order the new files along the concatenation dimension, and check
+        they extend the existing coordinate monotonically.
+
+        :param new_files:   (list) Native files to be appended.
+
+        :param existing:    (xr.DataArray) Existing concatenation coordinate
+            of the output product, opened without decoding times.
+
+        :param workers:     (int) Number of worker processes for reading
+            coordinate ranges (see ``get_coord_ranges``).
+        """
+        concat = existing.name
+        units  = existing.attrs.get('units',None)
+
+        for nfile in new_files:
+            file_units = _coord_units(nfile, concat)
+            if file_units != units:
+                raise ValueError(
+                    f'Units of "{concat}" in {nfile} do not match the existing product - '
+                    f'{file_units}, {units}'
+                )
+
+        ranges = self.get_coord_ranges(new_files, concat, workers=workers)
+        bounds = sorted((r[0], r[1], nfile) for nfile, r in ranges.items())
+
+        previous = existing[-1].item()
+        for vmin, vmax, nfile in bounds:
+            if vmin <= previous:
+                raise ValueError(
+                    f'Appended file {nfile} does not extend "{concat}" monotonically '
+                    f'- starts at {vmin}, existing values up to {previous}'
+                )
+            previous = vmax
+
+        return [b[2] for b in bounds]
+
     def _run(
             self, 
             compute_subset: Union[str,None] = None,
@@ -717,52 +1089,27 @@ class ComputeOperation(ProjectOperation):
         detail['quality_required'] = self.quality_required
         self.detail_cfg.set(detail)
 
-    def _clean_attr_array(self, allzattrs: dict) -> dict:
+    def _clean_attr_array(self, allzattrs: Union[list,AttrReducer]) -> dict:
         """
         Collect global attributes from all refs:
         - Determine which differ between refs and apply changes
 
+        Accepts either a list of ``.zattrs`` or an ``AttrReducer`` already
+        fed with each file's attributes.
+
         This Class method is common to all zarr-like conversion types.
         """
 
-        base = json.loads(allzattrs[0])
+        reducer = allzattrs
+        if isinstance(allzattrs, list):
+            reducer = AttrReducer(self.concat_msg, nfiles=len(self.allfiles))
+            for zattrs in allzattrs:
+                reducer.add(zattrs)
 
         self.logger.debug('Correcting time attributes')
-        # Sort out time metadata here
-        times = {}
-        all_values = {}
-
-        # Global attributes with 'time' in the name i.e start_datetime
-        for k in base.keys():
-            if 'time' in k:
-                times[k] = [base[k]]
-            all_values[k] = []
-
-        nonequal = {}
-        # Compare other attribute sets to a starting set 0
-        for ref in allzattrs[1:]:
-            zattrs = json.loads(ref)
-            for attr in zattrs.keys():
-                # Compare each attribute.
-                if attr in all_values:
-                    all_values[attr].append(zattrs[attr])
-                else:
-                    all_values[attr] = [zattrs[attr]]
-                if attr in times:
-                    times[attr].append(zattrs[attr])
-                elif attr not in base:
-                    nonequal[attr] = False
-                else:
-                    if base[attr] != zattrs[attr]:
-                        nonequal[attr] = False
+        base, nonequal = reducer.reduce()
 
-        # Requires something special for start and end times
-        base = {**base, **self._check_time_attributes(times)}
-        self.logger.debug('Comparing similar keys')
-
-        for attr in nonequal.keys():
-
-            base[attr] = self.concat_msg
+        for attr in nonequal:
             self.special_attrs[attr] = 0
 
         self.logger.debug('Finished checking similar keys')
@@ -778,35 +1125,6 @@ class ComputeOperation(ProjectOperation):
         self.logger.warning('Attribute cleaning post-loading from temp is not implemented')
         return zattrs
 
-    def _check_time_attributes(self, times: dict) -> dict:
-        """
-        Takes dict of time attributes with lists of values
-        - Sort time arrays
-        - Assume time_coverage_start, time_coverage_end, duration (2 or 3 variables)
-
-        This Class method is common to all zarr-like conversion types.
-        """
-        combined = {}
-        for k in times.keys():
-            if 'start' in k:
-                combined[k] = sorted(times[k])[0]
-            elif 'end' in k or 'stop' in k:
-                combined[k]   = sorted(times[k])[-1]
-            elif 'duration' in k:
-                pass
-            else:
-                # Unrecognised time variable
-                # Check to see if all the same value
-                if len(set(times[k])) == 1:
-                    combined[k] = times[k][0]
-                elif len(set(times[k])) == len(self.allfiles):
-                    combined[k] = 'See individual files for details'
-                else:
-                    combined[k] = list(set(times[k]))
-
-        self.logger.debug('Finished time corrections')
-        return combined
-
     def _correct_metadata(self, allzattrs: dict) -> dict:
         """
         General function for correcting metadata
@@ -817,7 +1135,7 @@ class ComputeOperation(ProjectOperation):
         """
 
         self.logger.debug('Starting metadata corrections')
-        if type(allzattrs) == list:
+        if isinstance(allzattrs, (list, AttrReducer)):
             zattrs = self._clean_attr_array(allzattrs)
         else:
             zattrs = self._clean_attrs(allzattrs)
@@ -858,6 +1176,80 @@ class ComputeOperation(ProjectOperation):
     
         return concat_dims, identicals, report
 
+    def _dims_via_headers(self) -> tuple[list[str]]:
+        """
+        Determine identical/concat dims by comparing file headers across a
+        sample of files.
+
+        The sample size is set by ``dim_sample_size`` in the base config (default 3),
+        taken evenly across the fileset including the first and last files. Dimensions
+        with differing lengths or coordinate values are concatenated, variables with
+        differing shapes or values are aggregated. Falls back to the validator for
+        files unreadable with netCDF4.
+
+        Variables larger than ``header_hash_limit`` elements in the base config 
+        (default 1e7) are compared from a sample of their values only (see 
+        ``_header_summary``), so may be classed as identical when they differ.
+        """
+        self.logger.info('Starting dimension determination - using file headers')
+
+        allfiles = self.allfiles.get()
+        nsample  = max(2, int(self.base_cfg.get('dim_sample_size',3)))
+        indices  = sorted(set(np.linspace(0, len(allfiles)-1, min(nsample, len(allfiles))).astype(int)))
+
+        full = int(self.base_cfg.get('header_hash_limit', 10000000))
+        try:
+            summaries = [_header_summary(allfiles[i], full=full) for i in indices]
+        except Exception as err:
+            self.logger.info(f'Header comparison unavailable - {err}')
+            return self._dims_via_validator()
+
+        base = summaries[0]
+        dimensions = list(base['dims'].keys())
+        variables  = list(base['vars'].keys())
+
+        # Concat dims vary in length or coordinate values across files.
+        concat_dims = []
+        for dim in dimensions:
+            lengths = set(s['dims'].get(dim) for s in summaries)
+            values  = set(s['vars'].get(dim,{}).get('hash') for s in summaries)
+            if len(lengths) > 1 or len(values) > 1:
+                concat_dims.append(dim)
+
+        # Non identical variables vary in shape or data between files.
+        vars = set()
+        for var in variables:
+            shapes = set(tuple(s['vars'].get(var,{}).get('shape',[])) for s in summaries)
+            hashes = set(s['vars'].get(var,{}).get('hash') for s in summaries)
+            if len(shapes) > 1 or len(hashes) > 1:
+                vars.add(var)
+
+        # Identical variables cannot have a concat dimension as one of their dimensions.
+        non_identical = [
+            v for v in variables if any(c in base['vars'][v]['dims'] for c in concat_dims)
+        ]
+
+        identical_dims = [dim for dim in dimensions if (dim not in vars and dim not in concat_dims)]
+        identical_vars = [var for var in variables if (var not in vars and var not in non_identical)]
+
+        identical_dims = list(set(identical_dims + identical_vars))
+
+        sampled = [v for v in set(sum([s['sampled'] for s in summaries], [])) if v in identical_dims]
+        if sampled:
+            self.logger.info(
+                f'Identical variables compared from a sample of values only: {sampled} '
+                '- increase "header_hash_limit" to compare in full'
+            )
+
+        # All variables to be aggregated.
+        aggregated_vars = []
+        for v in variables:
+            if v not in identical_dims and v not in concat_dims:
+                aggregated_vars.append(v)
+
+        self.logger.debug(f'Compared headers for files {indices}')
+        return concat_dims, identical_dims, aggregated_vars
+
     def _dims_via_validator(self) -> tuple[list[str]]:
         """
         Determine identical/concat dims using the validator
@@ -983,8 +1375,8 @@ class ComputeOperation(ProjectOperation):
             aggregated_vars = report['aggregated_vars']
 
         else:
-            self.logger.info('CFA Determination failed - defaulting to Validator-based checks')
-            concat_dims, identical_dims, aggregated_vars = self._dims_via_validator()
+            self.logger.info('CFA Determination failed - defaulting to header-based checks')
+            concat_dims, identical_dims, aggregated_vars = self._dims_via_headers()
 
             self._data_properties = {
                 'aggregated_dims': tuple(concat_dims),
@@ -1019,6 +1411,31 @@ class KerchunkDS(ComputeOperation):
             **kwargs):
 
         super().__init__(proj_code, workdir, stage=stage, **kwargs)
+
+        self.cache_format = self.base_cfg.get('cache_format','json')
+        if self.cache_format not in CACHE_FORMATS:
+            raise ValueError(
+                f'Unrecognised cache format "{self.cache_format}" - '
+                f'must be one of {list(CACHE_FORMATS.keys())}'
+            )
+
+        # Set while aggregating subset products rather than per-file refs.
+        self._merging_subsets = False
+
+        # Conversion times for files converted (not loaded) in this run.
+        self._convert_times = {}
+
+        # Workers for converting native files and encoding in the aggregator.
+        self._workers = None
+
+        # Fingerprints of the native files behind each cache file.
+        self.manifest = CacheManifest(
+            self.cache,
+            use_hash=self.base_cfg.get('cache_hash', False),
+            logger=self.logger,
+            dryrun=self._dryrun,
+            forceful=self._forceful
+        )
         
     def _run(
             self,
@@ -1028,6 +1445,8 @@ class KerchunkDS(ComputeOperation):
             compute_total: Union[str,None] = None,
             aggregator: Union[str,None] = None,
             b64vars: Union[list,None] = None,
+            workers: Union[int,None] = None,
+            stream: bool = False,
             **kwargs
         ) -> str:
         """
@@ -1035,6 +1454,12 @@ class KerchunkDS(ComputeOperation):
         which this subclass inherits. The kwargs capture the ``mode``
         parameter from ``ProjectOperation.run`` which is not needed 
         because we already know we're running for ``Kerchunk``.
+
+        :param workers:     (int) Number of worker processes for converting
+            native files, serial conversion is used if not given.
+
+        :param stream:      (bool) Stream refs from the cache into the aggregator
+            rather than holding all refs in memory.
         """
 
         self.logger.debug(f'Aggregator: {aggregator}')
@@ -1071,7 +1496,7 @@ class KerchunkDS(ComputeOperation):
             self.logger.info('Native order rearrangement bypassed for subsetting')
         elif check_arrangement:
             self.logger.info('Native file order unknown - attempting determination')
-            self.order_native_files()
+            self.order_native_files(workers=workers)
         else:
             self.logger.info('Native file order confirmed/bypassed')
 
@@ -1085,7 +1510,9 @@ class KerchunkDS(ComputeOperation):
             lim0=lim0,
             lim1=lim1,
             aggregator=aggregator,
-            b64vars=b64vars
+            b64vars=b64vars,
+            workers=workers,
+            stream=stream
         )
         
         if ctype is None:
@@ -1106,17 +1533,39 @@ class KerchunkDS(ComputeOperation):
             aggregator: Union[str,None] = None,
             filesubset: Union[list,None] = None,
             b64vars: Union[list,None] = None,
+            workers: Union[int,None] = None,
+            stream: bool = False,
         ) -> None:
         """Organise creation and loading of refs
         - Load existing cached refs
-        - Create new refs
+        - Create new refs (serially or across a pool of worker processes)
         - Combine metadata and global attributes into a single set
-        - Coordinate combining and saving of data"""
+        - Coordinate combining and saving of data
+
+        :param workers:     (int) Number of worker processes to use for converting
+            native files. Files are converted serially if not given.
+            
+        :param stream:      (bool) Release each set of refs once cached, and pass 
+            the aggregator a sequence that reloads them from the cache. Peak memory 
+            is then bounded by one file's refs plus the aggregation index. Streaming
+            is switched on part-way through if the refs held exceed the memory budget
+            (see ``_ref_memory_budget``)."""
 
         self.logger.info(f'Starting computation for components of {self.proj_code}')
+        self._workers = workers
 
-        refs, allzattrs = [], []
+        if stream and self._dryrun:
+            self.logger.info('Streaming disabled for dryrun - cache files are not written')
+            stream = False
+
+        refs, positions = [], []
+        allzattrs = AttrReducer(self.concat_msg, nfiles=len(self.allfiles))
+        stats = ConversionStats()
         partials = []
+
+        # Estimated size of the refs held in memory (see _ref_nbytes)
+        budget = self._ref_memory_budget()
+        held, peak = 0, 0
         ctypes = []
 
         ctype = self.source_format or ctype
@@ -1128,56 +1577,29 @@ class KerchunkDS(ComputeOperation):
         lim1 = lim1 or len(listfiles)
 
         t1 = datetime.now()
-        create_mode = False
-
-        for x, nfile in enumerate(listfiles[lim0:lim1]):
-
-            x += lim0
-
-            self.logger.info(f'Processing file: {x+1}/{lim1}')
-
-            ref = None
-            ## Default Converter Type if not set.
-            if ctype is None:
-                ctype = list(converter.drivers.keys())[0]
-
-            ## Connect to Cache File
-            CacheFile = KerchunkFile(self.cache, f'{x}', 
-                                            dryrun=self._dryrun, forceful=self._forceful,
-                                            logger=self.logger)
-            
-            ## Attempt to load the cache file
-            if not self._thorough:
-                self.logger.debug(f'Attempting cache file load: {x+1}/{lim1}')
 
-                try:
-                    ref = CacheFile.get()
-                    if ref:
-                        self.logger.debug(' > Loaded ref')
-                        create_mode = False
-                except:
-                    ref = None
+        # Merge existing subset products where all compute subsets are complete.
+        if (not self._thorough and lim0 == 0 and lim1 == len(listfiles) and
+                self.detail_cfg.get('compute_subsets') and aggregator in [None, 'P']):
+            if self._merge_subset_products(len(listfiles), b64vars=b64vars):
+                return
 
-            ## Create cache file from scratch if needed
-            if not ref:
-                if not create_mode:
-                    self.logger.debug(' > Cache file not found: Switching to create mode')
-                    create_mode = True
+        if not self._thorough and lim0 == 0 and lim1 == len(listfiles):
+            self._relocate_cache(listfiles)
 
-                self.logger.debug(f'Creating refs: {x+1}/{lim1}')
-                try:
-                    ref, ctype = converter.run(nfile, extension=ctype, **self.create_kwargs)
-                except KerchunkDriverFatalError as err:
-                    if len(refs) == 0:
-                        raise err
-                    else:
-                        partials.append(x)
+        if workers is not None and workers > 1 and not self._dryrun:
+            self.logger.info(f'Converting files using a pool of {workers} workers')
+            refset = self._convert_parallel(listfiles, lim0, lim1, ctype, workers)
+        else:
+            refset = self._convert_serial(converter, listfiles, lim0, lim1, ctype)
 
+        for x, ref, ctype, CacheFile in refset:
 
-                if ref is not None:
-                    CacheFile.set(ref)
-                    # Get again in case of future changes.
-                    ref = CacheFile.get()
+            if ref is None:
+                if len(positions) == 0:
+                    raise KerchunkDriverFatalError
+                partials.append(x)
+                continue
 
             # Drop variables not selected.
             if self.keep_vars:
@@ -1188,17 +1610,51 @@ class KerchunkDS(ComputeOperation):
             if not ref:
                 continue
             
-            allzattrs.append(ref['refs']['.zattrs'])
+            allzattrs.add(ref['refs']['.zattrs'])
 
             # Perform any and all checks here if required
             ref = self._perform_shape_checks(ref, check_refs=check_refs, ctype=ctype)
 
-            refs.append(ref)
+            if not stream:
+                refs.append(ref)
+                held += _ref_nbytes(ref)
+                peak = max(peak, held)
+
+                if budget is not None and held > budget and not self._dryrun:
+                    # Refs are already cached, so release them and reload from the cache.
+                    self.logger.warning(
+                        f'Refs held in memory ({held/1e6:.1f} MB) exceed the allowed '
+                        f'memory ({self.mem_allowed}) - switching to streamed aggregation')
+                    refs, held = [], 0
+                    stream = True
+            positions.append(x)
+
+            if x in self._convert_times:
+                stats.add(
+                    x, self._convert_times.pop(x), 
+                    size=_file_stat(listfiles[x])[0],
+                    nrefs=sum(1 for v in ref['refs'].values() if isinstance(v, list)),
+                    driver=ctype)
 
             CacheFile.set(ref)
             CacheFile.save()
             ctypes.append(ctype)
 
+        self.manifest.save()
+
+        if len(stats) > 0:
+            self.detail_cfg['conversion_stats'] = stats.summary(listfiles)
+        self.detail_cfg['ref_memory'] = {
+            'allowed': budget,
+            'peak': peak,
+            'streamed': stream,
+        }
+        self.detail_cfg.save()
+
+        if stream:
+            self.logger.info('Streaming refs from the cache for aggregation')
+            refs = CachedRefs(self._cache_file, positions)
+
         self.success = converter.success
         self.ctypes = ctypes
 
@@ -1220,66 +1676,711 @@ class KerchunkDS(ComputeOperation):
                 self._combine_and_save(refs, aggregator=aggregator, b64vars=b64vars)
             else:
                 self.logger.info(f'Concatenation skipped')
+                if self.success and self.skip_concat and self.detail_cfg.get('compute_subsets'):
+                    self._write_subset_product(refs, listfiles, lim0, lim1, b64vars=b64vars)
         except Exception as err:
             # Any additional parts here.
             raise err
 
-    def _combine_and_save(
-            self, 
-            refs: dict, 
-            aggregator: Union[str,None] = None,
-            b64vars: Union[list,None] = None
-        ) -> None:
+    def append(
+            self,
+            new_files: list,
+            workers: Union[int,None] = None,
+        ) -> str:
         """
-        Concatenation of refs data for different kerchunk schemes.
+        Extend the existing Kerchunk product with newly arrived files.
 
-        :param refs:    (dict) The set of generated
+        Only the new files are converted. Their refs are remapped to follow
+        the existing chunks along the concatenation dimension and patched into
+        the existing JSON file or Parquet store. Construct with ``append=True``
+        to use the current revision rather than a new version.
+
+        :param new_files:   (list) Paths to native files to add to the product.
+
+        :param workers:     (int) Number of worker processes for converting
+            the new files.
+
+        :returns:   Status of the append operation.
         """
+        if self.file_type == 'icechunk':
+            raise NotImplementedError('Appending to Icechunk repositories is not yet supported')
 
-        self.logger.info('Starting concatenation of refs')
-        if len(refs) > 1:
+        existing_files = self.allfiles.get()
+        new_files = [f for f in new_files if f not in existing_files]
+        if len(new_files) == 0:
+            self.logger.info('No new files to append')
+            return 'Skipped'
 
-            # Extract combine kwargs
-            kwargs = self.detail_cfg.get('kwargs', {})
-            self.combine_kwargs = self.combine_kwargs or kwargs.get('combine_kwargs',{})
+        concat = self._append_dim()
+
+        ds = self._open_existing_product()
+        new_files = self._order_appended_files(new_files, ds[concat], workers=workers)
+        ds.close()
+
+        self.logger.info(f'Appending {len(new_files)} files along "{concat}"')
+
+        listfiles = existing_files + new_files
+        lim0, lim1 = len(existing_files), len(listfiles)
+
+        if workers is not None and workers > 1 and not self._dryrun:
+            refset = self._convert_parallel(listfiles, lim0, lim1, self.source_format, workers)
+        else:
+            converter = KerchunkConverter(logger=self.logger, 
+                                          bypass_driver=self._bypass.skip_driver)
+            refset = self._convert_serial(converter, listfiles, lim0, lim1, self.source_format)
+
+        new_refs = []
+        for x, ref, ctype, CacheFile in refset:
+            if ref is None:
+                raise PartialDriverError(filenums=[x])
+
+            if self.keep_vars:
+                if self.drop_vars is None:
+                    self._determine_drop_vars(ref)
+                ref = self._drop_vars(ref)
+
+            CacheFile.set(ref)
+            CacheFile.save()
+            new_refs.append(ref)
+
+        self.manifest.save()
+
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped patching {self.dataset}')
+            return 'Success'
 
-        t1 = datetime.now()  
         if self.file_type == 'parq':
-            self.logger.info('Concatenating to Parquet format Kerchunk store')
-            self._data_to_parq(refs)
+            self._append_to_parq(new_refs, new_files, concat)
         else:
-            self.logger.info('Concatenating to JSON format Kerchunk file')
-            self._data_to_json(refs, aggregator=aggregator, b64vars=b64vars)
+            refs = self.kfile.get()
+            updates, chunk_refs = self._remap_appended_refs(
+                refs['refs'], new_refs, new_files, concat)
+            refs['refs'].update(updates)
+            refs['refs'].update(chunk_refs)
+            self.kfile.set(refs)
+            self.kfile.save()
 
-        self.concat_time = (datetime.now()-t1).total_seconds()/self.limiter
-        self.detail_cfg['kwargs']['combine_kwargs'] = self.combine_kwargs
+        self.allfiles.set(listfiles)
+        self.allfiles.save()
+
+        self.detail_cfg['num_files'] = len(listfiles)
         self.detail_cfg.save()
 
-        if not self._dryrun:
-            self._collect_details() # Zarr might want this too.
-            self.logger.info("Details updated in detail-cfg.json")
+        self.logger.info(f'Appended {len(new_files)} files to {self.dataset}')
+        return 'Success'
 
-    def _construct_virtual_dim(self, refs: list) -> None:
+    def _remap_appended_refs(
+            self,
+            existing: dict,
+            new_refs: list,
+            new_files: list,
+            concat: str,
+        ) -> tuple[dict,dict]:
         """
-        Construct a Virtual dimension for stacking multiple files 
-        where no suitable concatenation dimension is present.
+        Remap the refs of appended files to follow the existing chunks.
+
+        Inlined 1D variables (e.g. the concatenation dimension) may have been
+        rechunked by the PADOCC aggregator, combining several native chunks
+        into each chunk of the product. The new chunks are read and combined
+        in the same way, provided they divide the existing chunk size. Appended
+        files must then fill whole combined chunks, other than the final file.
+        Any other difference in chunking cannot be appended.
+
+        :param existing:    (dict-like) Existing aggregated refs - only metadata
+            keys and the first chunk of each variable are accessed.
+
+        :returns:   Updated metadata refs, and the remapped chunk refs.
         """
-        # For now this just means creating a list of numbers 0 to N files
-        vdim = 'file_number'
+        updates, chunk_refs = {}, {}
+
+        zattrs = existing['.zattrs']
+        if not isinstance(zattrs, str):
+            zattrs = json.dumps(zattrs)
+        updates['.zattrs'] = self._correct_metadata(
+            [zattrs] + [r['refs']['.zattrs'] for r in new_refs])
+
+        infiles = {}
+        def read_chunk(file_ord: int, value) -> bytes:
+            if isinstance(value, str):
+                # Already inlined by the converter.
+                if value.startswith('base64:'):
+                    return base64.b64decode(value[7:])
+                return value.encode()
+            if file_ord not in infiles:
+                fs, path = fsspec.core.url_to_fs(new_files[file_ord])
+                infiles[file_ord] = fs.open(path, 'rb')
+            infiles[file_ord].seek(int(value[1]))
+            return infiles[file_ord].read(int(value[2]))
+
+        for key in existing.keys():
+            if not key.endswith('/.zattrs'):
+                continue
 
-        for idx, ref in enumerate(refs):
-            zarray = json.dumps({
-                "chunks": [1],
-                "compressor": None,
-                "dtype":"<i8",
-                "fill_value": 4611686018427387904,
-                "filters": None,
-                "order": "C",
-                "shape": [1],
-                "zarr_format": 2
-            })
-            zattrs = json.dumps({
-                "_ARRAY_DIMENSIONS": [vdim],
+            var = key.split('/')[0]
+            var_zattrs = existing[key]
+            if isinstance(var_zattrs, str):
+                var_zattrs = json.loads(var_zattrs)
+
+            if concat not in var_zattrs.get('_ARRAY_DIMENSIONS',[]):
+                # Identical variables keep existing refs.
+                continue
+            axis = var_zattrs['_ARRAY_DIMENSIONS'].index(concat)
+
+            zarray = existing[f'{var}/.zarray']
+            is_str = isinstance(zarray, str)
+            if is_str:
+                zarray = json.loads(zarray)
+
+            chunk = zarray['chunks'][axis]
+            if zarray['shape'][axis] % chunk != 0:
+                raise ValueError(
+                    f'Existing "{var}" has a partial final chunk along "{concat}" - unable to append'
+                )
+            offset = zarray['shape'][axis] // chunk
+
+            # Match existing encoding of the variable.
+            first = existing.get(f'{var}/' + '.'.join(['0']*len(zarray['shape'])), None)
+            inline = isinstance(first, str) and first.startswith('base64:')
+
+            # Native chunks combined in each existing chunk, and any not yet combined.
+            comb, pending = None, []
+            for file_ord, ref in enumerate(new_refs):
+                if f'{var}/.zarray' not in ref['refs']:
+                    raise ValueError(f'Variable "{var}" missing from {new_files[file_ord]}')
+                
+                new_zarray = json.loads(ref['refs'][f'{var}/.zarray'])
+                new_chunk = new_zarray['chunks'][axis]
+                if new_zarray['chunks'] != zarray['chunks']:
+                    rechunked = (
+                        inline and len(zarray['chunks']) == 1 and chunk % new_chunk == 0 
+                        and comb in (None, chunk // new_chunk)
+                    )
+                    if not rechunked:
+                        self.logger.error(
+                            f'Unable to append "{var}" - chunks {new_zarray["chunks"]} do not match '
+                            f'the existing product {zarray["chunks"]}. Only inlined 1D variables may be '
+                            'rechunked on append, other chunk changes require recomputing the product.'
+                        )
+                        raise ConcatFatalError(var=var, chunk1=chunk, chunk2=new_chunk)
+                    comb = chunk // new_chunk
+                
+                other_dims = [s for i, s in enumerate(new_zarray['shape']) if i != axis]
+                if other_dims != [s for i, s in enumerate(zarray['shape']) if i != axis]:
+                    raise ValueError(
+                        f'Shape of "{var}" in {new_files[file_ord]} does not match the existing product'
+                    )
+
+                chunk_keys = sorted(
+                    [k for k in ref['refs'].keys() 
+                     if k.startswith(f'{var}/') and not k.split('/')[-1].startswith('.')],
+                    key=lambda k: [int(c) for c in k.split('/')[1].split('.')]
+                )
+
+                for k in chunk_keys:
+                    v = ref['refs'][k]
+                    if comb is not None:
+                        # Combine into the rechunked layout of the existing product.
+                        pending.append(read_chunk(file_ord, v))
+                        if len(pending) == comb:
+                            chunk_refs[f'{var}/{offset}'] = (
+                                b'base64:' + base64.b64encode(b''.join(pending))).decode()
+                            pending = []
+                            offset += 1
+                        continue
+
+                    coords = [int(c) for c in k.split('/')[1].split('.')]
+                    coords[axis] += offset
+
+                    if inline and isinstance(v, list):
+                        v = (b'base64:' + base64.b64encode(read_chunk(file_ord, v))).decode()
+
+                    chunk_refs[f'{var}/{".".join([str(c) for c in coords])}'] = v
+
+                if new_zarray['shape'][axis] % new_chunk != 0 and file_ord != len(new_refs)-1:
+                    raise ValueError(
+                        f'Partial chunk of "{var}" in {new_files[file_ord]} - unable to append further files'
+                    )
+                if comb is None:
+                    offset += -(-new_zarray['shape'][axis] // chunk)
+                zarray['shape'][axis] += new_zarray['shape'][axis]
+
+            if pending:
+                # As for rechunking in the aggregator, filling the last chunk is unreliable.
+                raise ValueError(
+                    f'Appended files do not fill the final rechunked chunk of "{var}" '
+                    f'({len(pending)}/{comb} chunks) - unable to append'
+                )
+
+            updates[f'{var}/.zarray'] = json.dumps(zarray) if is_str else zarray
+
+        for infile in infiles.values():
+            infile.close()
+
+        return updates, chunk_refs
+
+    def _append_to_parq(self, new_refs: list, new_files: list, concat: str) -> None:
+        """
+        Patch appended refs into the existing Parquet store. Only 
+        records containing new refs are rewritten, unless the concat
+        dimension is not the leading dimension of a variable.
+        """
+        from fsspec import filesystem
+        from fsspec.implementations.reference import LazyReferenceMapper
+
+        store = str(self.kstore.store_path)
+
+        existing = LazyReferenceMapper(store, fs=filesystem("file"))
+        meta = {k: json.dumps(v) for k, v in existing.zmetadata.items()}
+
+        # Metadata plus the first chunk of each variable, 
+        # with inlined (raw) chunks marked as base64.
+        existing_refs = dict(meta)
+        for key in meta.keys():
+            if not key.endswith('/.zarray'):
+                continue
+            first = key.replace('.zarray', '.'.join(['0']*len(json.loads(meta[key])['shape'])))
+            try:
+                value = existing[first]
+            except KeyError:
+                continue
+            existing_refs[first] = 'base64:' if isinstance(value, bytes) else value
+
+        updates, chunk_refs = self._remap_appended_refs(
+            existing_refs, new_refs, new_files, concat)
+
+        # Reload refs from any records which will be rewritten.
+        reload = {}
+        record_size = existing.record_size
+        for key, zarray in updates.items():
+            if not key.endswith('/.zarray'):
+                continue
+            var = key.split('/')[0]
+            zarray = zarray if isinstance(zarray, dict) else json.loads(zarray)
+            old_zarray = json.loads(meta[key])
+            old_grid = [-(-s // c) for s, c in zip(old_zarray['shape'], old_zarray['chunks'])]
+            
+            axis = json.loads(meta[f'{var}/.zattrs'])['_ARRAY_DIMENSIONS'].index(concat)
+            total = int(np.prod(old_grid))
+            if axis == 0:
+                # Chunk positions are unchanged, only the final record is extended.
+                start = (total // record_size) * record_size
+            else:
+                self.logger.info(f'Rewriting all refs for "{var}" - "{concat}" is not the leading dimension')
+                start = 0
+
+            for index in range(start, total):
+                coords = np.unravel_index(index, old_grid)
+                ckey = f'{var}/{".".join([str(c) for c in coords])}'
+                try:
+                    value = existing[ckey]
+                except KeyError:
+                    continue
+                reload[ckey] = list(value) if isinstance(value, tuple) else value
+
+        out = LazyReferenceMapper(store, fs=filesystem("file"))
+        for key, value in updates.items():
+            out[key] = value if isinstance(value, str) else json.dumps(value)
+
+        for key, value in (reload | chunk_refs).items():
+            if isinstance(value, str) and value.startswith('base64:'):
+                value = base64.b64decode(value[7:])
+            out[key] = value
+
+        out.flush()
+        self.logger.info(f'Patched {len(chunk_refs)} new refs into parquet store - {self.kstore}')
+
+    def _write_subset_product(
+            self,
+            refs: list,
+            listfiles: list,
+            lim0: int,
+            lim1: int,
+            b64vars: Union[list,None] = None,
+        ) -> None:
+        """
+        Aggregate the refs for a single compute subset into a partial
+        product (``cache/subset_{lim0}_{lim1}.json``), with chunk keys 
+        already remapped along the concat dimension for this subset.
+
+        Partial products are not rechunked, so they can be merged 
+        with the PADOCC aggregator once all subsets are complete.
+        """
+        kwargs  = self.detail_cfg.get('kwargs', {})
+        combine = self.combine_kwargs or kwargs.get('combine_kwargs',{})
+
+        concat   = combine.get('concat_dims',None) or []
+        agg_vars = combine.get('aggregated_vars',None) or \
+            self.base_cfg['data_properties'].get('aggregated_vars')
+
+        if len(concat) != 1 or self.detail_cfg.get('virtual_concat',False) or agg_vars == 'Unknown':
+            self.logger.info('Subset product skipped - aggregation parameters unsuitable')
+            return
+        
+        drop_vars = self.drop_vars or []
+        agg_vars  = [v for v in agg_vars if v not in drop_vars]
+
+        name = f'subset_{lim0}_{lim1}'
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped writing subset product {name}')
+            return
+
+        # Remove products from previous runs which overlap this subset.
+        for product in glob.glob(f'{self.cache}/subset_*.json'):
+            p0, p1 = [int(p) for p in os.path.basename(product)[7:-5].split('_')]
+            if p0 < lim1 and p1 > lim0:
+                os.remove(product)
+
+        self.logger.info(f'Writing subset product {name}')
+        try:
+            padocc_combine(
+                refs,
+                listfiles[lim0:lim1],
+                agg_dims=concat,
+                agg_vars=agg_vars,
+                output_file=f'{self.cache}/{name}.json',
+                identical_vars=combine.get('identical_dims',None),
+                b64vars=b64vars or concat,
+                logger=self.logger,
+                rechunk=False,
+                workers=self._workers
+            )
+        except Exception as err:
+            self.logger.warning(f'Subset product not created - {err}')
+
+    def _find_subset_products(self, nfiles: int) -> Union[list,None]:
+        """
+        Find the set of subset products which together cover all 
+        native files in order, or None if any subset is missing.
+        """
+        ends = {}
+        for product in glob.glob(f'{self.cache}/subset_*.json'):
+            p0, p1 = [int(p) for p in os.path.basename(product)[7:-5].split('_')]
+            ends[p0] = p1
+
+        products, start = [], 0
+        while start < nfiles:
+            if start not in ends:
+                return None
+            products.append(f'subset_{start}_{ends[start]}')
+            start = ends[start]
+
+        if start != nfiles:
+            return None
+        return products
+
+    def _merge_subset_products(self, nfiles: int, b64vars: Union[list,None] = None) -> bool:
+        """
+        Aggregate the partial products from all compute subsets, rather
+        than reloading the per-file cache. Each product is loaded one at
+        a time.
+
+        :returns:   True if the products were merged, False if the 
+            standard aggregation should be used instead.
+        """
+        if self.detail_cfg.get('virtual_concat',False) or self.file_type in ['parq','icechunk']:
+            return False
+        
+        products = self._find_subset_products(nfiles)
+        if products is None or len(products) < 2:
+            return False
+        
+        self.logger.info(f'Merging {len(products)} subset products')
+
+        subset_refs = CachedRefs(
+            lambda name: KerchunkFile(self.cache, name, logger=self.logger, **self.fh_kwargs),
+            products)
+
+        allzattrs = AttrReducer(self.concat_msg, nfiles=nfiles)
+        for ref in subset_refs:
+            allzattrs.add(ref['refs']['.zattrs'])
+        self.temp_zattrs.set(self._correct_metadata(allzattrs))
+
+        self.success = True
+        self.loaded_refs = True
+        self.ctypes = [d for d in (self.detail_cfg.get('driver',None) or '').split('/') if d]
+
+        self._merging_subsets = True
+        try:
+            self._combine_and_save(subset_refs, aggregator='P', b64vars=b64vars)
+        except Exception as err:
+            self.logger.warning(f'Subset product merge failed, using per-file cache - {err}')
+            return False
+        finally:
+            self._merging_subsets = False
+        return True
+
+    def _cache_file(self, x: Union[int,str]) -> KerchunkFile:
+        """
+        Connect to the cache file for the native file at position ``x``.
+        """
+        return CACHE_FORMATS[self.cache_format](
+            self.cache, f'{x}', 
+            dryrun=self._dryrun, forceful=self._forceful,
+            logger=self.logger)
+
+    def _ref_memory_budget(self) -> Union[int,None]:
+        """
+        Memory allowed for refs held during ref creation, in bytes.
+
+        Taken from ``mem_allowed`` where given, otherwise half the memory
+        allocated to this SLURM job so the remainder covers aggregation.
+        """
+        if self.mem_allowed is not None:
+            return int(mem_to_val(self.mem_allowed))
+
+        slurm_mem = os.getenv('SLURM_MEM_PER_NODE')
+        if slurm_mem is not None and slurm_mem.isnumeric():
+            # SLURM reports memory in MB
+            return int(slurm_mem)*1000000//2
+        return None
+
+    def _convert_serial(
+            self,
+            converter: KerchunkConverter,
+            listfiles: list,
+            lim0: int,
+            lim1: int,
+            ctype: Union[str,None] = None,
+        ) -> Iterator[tuple]:
+        """
+        Load or create refs for each file in turn, in file order.
+
+        Yields the file position, refs (None if all drivers failed),
+        driver type and cache filehandler for each file.
+        """
+        create_mode = False
+
+        for x, nfile in enumerate(listfiles[lim0:lim1]):
+
+            x += lim0
+
+            self.logger.info(f'Processing file: {x+1}/{lim1}')
+
+            ref, converted = None, False
+            ## Default Converter Type if not set.
+            if ctype is None:
+                ctype = DEFAULT_DRIVER
+
+            ## Connect to Cache File
+            CacheFile = self._cache_file(x)
+            
+            ## Attempt to load the cache file if the native file is unchanged
+            if not self._thorough and self.manifest.is_current(nfile, x):
+                self.logger.debug(f'Attempting cache file load: {x+1}/{lim1}')
+
+                try:
+                    ref = CacheFile.get()
+                    if ref:
+                        self.logger.debug(' > Loaded ref')
+                        create_mode = False
+                except:
+                    ref = None
+
+            ## Create cache file from scratch if needed
+            if not ref:
+                if not create_mode:
+                    self.logger.debug(' > Cache file not found: Switching to create mode')
+                    create_mode = True
+
+                self.logger.debug(f'Creating refs: {x+1}/{lim1}')
+
+                # Driver recorded for this file on a previous run
+                known = self.manifest.driver(nfile)
+                tc = datetime.now()
+                try:
+                    ref, ctype = converter.run(
+                        nfile, extension=known or ctype, 
+                        detect=(known is None), **self.create_kwargs)
+                except KerchunkDriverFatalError:
+                    ref = None
+                self._convert_times[x] = (datetime.now()-tc).total_seconds()
+
+                if ref is not None:
+                    converted = True
+                    CacheFile.set(ref)
+                    # Get again in case of future changes.
+                    ref = CacheFile.get()
+
+            if ref is not None:
+                if converted:
+                    self.manifest.record(nfile, x, driver=ctype)
+                else:
+                    # Loaded from cache, driver not determined for this file.
+                    self.manifest.record(nfile, x)
+
+            yield x, ref, ctype, CacheFile
+
+    def _convert_parallel(
+            self,
+            listfiles: list,
+            lim0: int,
+            lim1: int,
+            ctype: Union[str,None] = None,
+            workers: int = 2,
+        ) -> Iterator[tuple]:
+        """
+        Create refs across a pool of worker processes.
+
+        Each worker writes its own ``cache/{x}`` file, only the 
+        driver type is returned to this process. Results are yielded 
+        in file order so aggregators still receive ordered refs.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Cached refs are only read when yielded, so memory use matches
+        # the serial conversion.
+        jobs, cached = [], set()
+        for x in range(lim0, lim1):
+            if (
+                not self._thorough and 
+                self.manifest.is_current(listfiles[x], x) and 
+                self._cache_file(x).file_exists()
+            ):
+                cached.add(x)
+                continue
+            jobs.append(x)
+
+        self.logger.info(f'Found {len(cached)} cached refs, converting {len(jobs)} files')
+
+        known = [self.manifest.driver(listfiles[x]) for x in jobs]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                _convert_native_file,
+                [listfiles[x] for x in jobs],
+                [self.cache] * len(jobs),
+                [f'{x}' for x in jobs],
+                [k or ctype for k in known],
+                [self.create_kwargs] * len(jobs),
+                [self._bypass.skip_driver] * len(jobs),
+                [k is None for k in known],
+                [self.cache_format] * len(jobs),
+                chunksize=max(1, int(len(jobs)/(workers*4)))
+            )
+            converted = dict(zip(jobs, results))
+
+        for x in range(lim0, lim1):
+            self.logger.info(f'Processing file: {x+1}/{lim1}')
+            CacheFile = self._cache_file(x)
+
+            if x in cached:
+                try:
+                    ref = CacheFile.get()
+                except:
+                    ref = None
+                if ref:
+                    self.manifest.record(listfiles[x], x)
+                    # Driver may not be set on a rerun, default as for serial conversion.
+                    xtype = self.manifest.driver(listfiles[x]) or ctype or DEFAULT_DRIVER
+                    yield x, ref, xtype, CacheFile
+                    continue
+
+                # Unreadable cache file - convert in this process instead.
+                known = self.manifest.driver(listfiles[x])
+                converted[x] = _convert_native_file(
+                    listfiles[x], self.cache, f'{x}', known or ctype, 
+                    self.create_kwargs, self._bypass.skip_driver, 
+                    known is None, self.cache_format)
+
+            xtype, self._convert_times[x] = converted[x]
+            if xtype is None:
+                yield x, None, ctype, CacheFile
+                continue
+            
+            ctype = xtype
+            self.manifest.record(listfiles[x], x, driver=ctype)
+            yield x, CacheFile.get(), ctype, CacheFile
+
+    def _relocate_cache(self, listfiles: list) -> None:
+        """
+        Move cache files to match the current native file order.
+
+        Where files have been reordered or inserted, existing cache
+        files with unchanged source files are moved to their new 
+        positions rather than being reconverted.
+        """
+        moves = self.manifest.relocations(listfiles)
+        if not moves:
+            return
+        
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped relocating {len(moves)} cache files')
+            return
+
+        self.logger.info(f'Relocating {len(moves)} cache files to match the current file order')
+
+        # Two-step move so no cache file is overwritten before it is relocated.
+        for ext in set(['json', self.cache_format]):
+            for old in moves.keys():
+                if os.path.isfile(f'{self.cache}/{old}.{ext}'):
+                    os.rename(f'{self.cache}/{old}.{ext}', f'{self.cache}/{old}.relocate.{ext}')
+
+            for old, new in moves.items():
+                if os.path.isfile(f'{self.cache}/{old}.relocate.{ext}'):
+                    os.replace(f'{self.cache}/{old}.relocate.{ext}', f'{self.cache}/{new}.{ext}')
+
+        for new in moves.values():
+            self.manifest.record(listfiles[new], new)
+
+    def _combine_and_save(
+            self, 
+            refs: dict, 
+            aggregator: Union[str,None] = None,
+            b64vars: Union[list,None] = None
+        ) -> None:
+        """
+        Concatenation of refs data for different kerchunk schemes.
+
+        :param refs:    (dict) The set of generated
+        """
+
+        self.logger.info('Starting concatenation of refs')
+        if len(refs) > 1:
+
+            # Extract combine kwargs
+            kwargs = self.detail_cfg.get('kwargs', {})
+            self.combine_kwargs = self.combine_kwargs or kwargs.get('combine_kwargs',{})
+
+        t1 = datetime.now()  
+        if self.file_type == 'parq':
+            self.logger.info('Concatenating to Parquet format Kerchunk store')
+            self._data_to_json(refs, aggregator=aggregator, b64vars=b64vars)
+        elif self.file_type == 'icechunk':
+            self.logger.info('Concatenating to Icechunk repository')
+            self._data_to_icechunk()
+        else:
+            self.logger.info('Concatenating to JSON format Kerchunk file')
+            self._data_to_json(refs, aggregator=aggregator, b64vars=b64vars)
+
+        self.concat_time = (datetime.now()-t1).total_seconds()/self.limiter
+        self.detail_cfg['kwargs']['combine_kwargs'] = self.combine_kwargs
+        self.detail_cfg.save()
+
+        if not self._dryrun:
+            self._collect_details() # Zarr might want this too.
+            self.logger.info("Details updated in detail-cfg.json")
+
+    def _construct_virtual_dim(self, refs: list) -> None:
+        """
+        Construct a Virtual dimension for stacking multiple files 
+        where no suitable concatenation dimension is present.
+        """
+        # For now this just means creating a list of numbers 0 to N files
+        vdim = 'file_number'
+
+        for idx, ref in enumerate(refs):
+            zarray = json.dumps({
+                "chunks": [1],
+                "compressor": None,
+                "dtype":"<i8",
+                "fill_value": 4611686018427387904,
+                "filters": None,
+                "order": "C",
+                "shape": [1],
+                "zarr_format": 2
+            })
+            zattrs = json.dumps({
+                "_ARRAY_DIMENSIONS": [vdim],
                 "axis": "F",
                 "long_name": vdim,
                 "standard_name": vdim
@@ -1309,10 +2410,12 @@ class KerchunkDS(ComputeOperation):
 
         out = LazyReferenceMapper.create(str(self.kstore.store_path), fs = filesystem("file"), **self.pre_kwargs)
 
+        # Aggregated vars are only used by the other aggregators.
+        combine_kwargs = {k: v for k, v in self.combine_kwargs.items() if k != 'aggregated_vars'}
         _ = MultiZarrToZarr(
-            refs,
+            list(refs),
             out=out,
-            **self.combine_kwargs
+            **combine_kwargs
         ).translate()
         
         if self.partial:
@@ -1321,6 +2424,52 @@ class KerchunkDS(ComputeOperation):
             out.flush()
             self.logger.info(f'Written to parquet store - {self.kstore}')
 
+    def _data_to_icechunk(self) -> None:
+        """
+        Concatenating to an Icechunk repository of virtual references,
+        using the VirtualiZarr aggregator on the cache files.
+        """
+        self.logger.debug('Starting Icechunk-write process')
+
+        # Fail before combining if the optional dependency is missing.
+        _import_icechunk()
+
+        if self.cache_format != 'json':
+            raise ValueError(
+                f'Icechunk output unavailable for "{self.cache_format}" cache files.')
+        
+        if self.detail_cfg['virtual_concat']:
+            raise ValueError('Icechunk output unavailable for virtual concatenation.')
+
+        self.combine_kwargs = self.combine_kwargs or {}
+        if self.combine_kwargs.get('aggregated_vars',None) is None:
+            self.combine_kwargs['aggregated_vars'] = self.base_cfg['data_properties'].get('aggregated_vars')
+
+        for kw in ['identical_dims','concat_dims']:
+            if self._manual_combine_kwargs[kw] is not None:
+                self.combine_kwargs[kw] = self._manual_combine_kwargs[kw]
+
+        self.drop_vars = self.drop_vars or []
+        agg_vars = [v for v in self.combine_kwargs["aggregated_vars"] if v not in self.drop_vars]
+
+        if self.partial:
+            self.logger.info(f'Skipped writing to Icechunk repository - {self.icstore}')
+            return
+
+        self.padocc_aggregation = False
+        self.virtualizarr = True
+        virtualise(
+            f'{self.dir}/cache/', 
+            output_file=None, 
+            agg_dims=self.combine_kwargs['concat_dims'],
+            data_vars=agg_vars,
+            nfiles=self.limiter,
+            logger=self.logger,
+            allfiles=self.allfiles.get(),
+            workers=self._workers,
+            icechunk_store=self.icstore,
+            zattrs=self.temp_zattrs.get())
+
     def _chunk_estm_per_var(self, var):
         """
         Estimate number of chunks for a particular variable/dimension
@@ -1331,6 +2480,234 @@ class KerchunkDS(ComputeOperation):
         value = float(self.detail_cfg.get('chunk_info',{}).get('variables',{}).get(var,0)) * len(self.allfiles.get())
         return value
 
+    def estimate_aggregation(
+            self,
+            b64vars: Union[list,None] = None,
+            chunk_info: Union[dict,None] = None,
+            nfiles: Union[int,None] = None,
+        ) -> Union[dict,None]:
+        """
+        Dry-run of the aggregation, predicting the combined reference set 
+        from the scan chunk counts without reading any cache files.
+
+        Sizes and times are estimates from the aggregation cost model (see 
+        ``AggregationPlanner``), using reference sizes measured in the scan 
+        where available.
+
+        :param b64vars:     (list) Variables to be inlined as base64, defaults
+            to the concatenation dimensions as for the PADOCC Aggregator.
+
+        :param chunk_info:  (dict) Chunk summary from the scan, taken from the 
+            detail config if not given.
+
+        :param nfiles:      (int) Number of files to aggregate, defaults to 
+            all files in the project.
+
+        :returns:   Total references, inlined base64 bytes, JSON and Parquet 
+            sizes (bytes), reader open times (seconds) and predicted time and
+            memory for each aggregator, or None if the project has not been scanned.
+        """
+        chunk_info = chunk_info or self.detail_cfg.get('chunk_info')
+        if not chunk_info or not chunk_info.get('variables'):
+            return None
+
+        nfiles = nfiles or len(self.allfiles.get())
+        record_size = self.pre_kwargs.get('record_size', 10000)
+
+        combine_kwargs = (
+            self.combine_kwargs or 
+            self.detail_cfg.get('kwargs',{}).get('combine_kwargs') or {}
+        )
+        concat_dims = combine_kwargs.get('concat_dims') or []
+        dims = set(concat_dims) | set(combine_kwargs.get('identical_dims') or [])
+        agg_vars = (
+            combine_kwargs.get('aggregated_vars') or 
+            self.base_cfg.get('data_properties',{}).get('aggregated_vars')
+        )
+        if b64vars is None:
+            b64vars = concat_dims
+
+        planned_vars = [
+            v for v in chunk_info['variables'] 
+            if (agg_vars is None or v in agg_vars) and v not in (self.drop_vars or [])
+        ]
+        b64_chunks = sum(float(chunk_info['variables'].get(v) or 0)*nfiles for v in b64vars)
+        planner = self._aggregation_planner(nfiles, planned_vars, b64_chunks, chunk_info=chunk_info)
+
+        ref_sizes = chunk_info.get('ref_sizes') or {}
+        meta_bytes = float(chunk_info.get('metadata_bytes') or 0)
+
+        nrefs, json_bytes, b64_bytes, parq_bytes = 0, meta_bytes, 0, meta_bytes
+        parq_files, dim_refs, dim_files, nvars = 0, 0, 0, 0
+        for var, per_file in chunk_info['variables'].items():
+            if var in (self.drop_vars or []):
+                continue
+            
+            per_file = float(per_file or 0)
+            # Variables not aggregated are taken from a single file.
+            if agg_vars is None or var in agg_vars or var in concat_dims:
+                count = per_file * nfiles
+            else:
+                count = per_file
+
+            sizes = ref_sizes.get(var,{})
+            key = sizes.get('key', planner.ref_sizes['key'])
+            if var in b64vars and 'chunk' in sizes:
+                encoded = 4 * math.ceil(sizes['chunk']/3) + len('"base64:"')
+                b64_bytes  += count * encoded
+                json_bytes += count * (key + encoded)
+                parq_bytes += count * sizes['chunk']
+            else:
+                json_bytes += count * (key + sizes.get('ref', planner.ref_sizes['ref']))
+                parq_bytes += count * planner.ref_sizes['parq']
+
+            # Each variable is partitioned into its own record files.
+            files = math.ceil(count/record_size)
+            if var in dims:
+                dim_refs  += count
+                dim_files += files
+
+            nvars      += 1
+            nrefs      += count
+            parq_files += files
+
+        open_time = {
+            'json': planner.open_time('json', json_bytes, nrefs),
+            'parq': planner.open_time('parq', meta_bytes, dim_refs, dim_files=dim_files, nvars=nvars),
+        }
+
+        return {
+            'nfiles': nfiles,
+            'total_refs': int(nrefs),
+            'b64vars': [v for v in b64vars if v in chunk_info['variables']],
+            'b64_bytes': int(b64_bytes),
+            'json_size': int(json_bytes),
+            'parq_size': int(parq_bytes),
+            'parq_files': int(parq_files),
+            'open_time': {k: round(v, 3) for k, v in open_time.items()},
+            'suggested_type': min(open_time, key=open_time.get),
+            'aggregators': {mode: planner.predict(mode) for mode in planner.COSTS},
+        }
+
+    def _aggregation_planner(
+            self, 
+            nfiles: int, 
+            agg_vars: list, 
+            b64_chunks: float,
+            chunk_info: Union[dict,None] = None,
+        ) -> AggregationPlanner:
+        """
+        Set up the aggregation cost model from the scan statistics, and 
+        any calibration from previous aggregations of this project. Default
+        costs may be replaced with ``aggregation_costs`` in the base config.
+        """
+        chunk_info = chunk_info or self.detail_cfg.get('chunk_info')
+        try:
+            chunks_per_file = float(chunk_info['chunks_per_file'])
+        except (KeyError, TypeError, ValueError):
+            chunks_per_file = 0
+
+        previous = self.detail_cfg.get('aggregation_plan') or {}
+        return AggregationPlanner(
+            nfiles,
+            chunks_per_file,
+            len(agg_vars),
+            b64_chunks=b64_chunks,
+            calibration=dict(previous.get('calibration') or {}),
+            costs=self.base_cfg.get('aggregation_costs'),
+        )
+
+    def _aggregation_memory_budget(self) -> Union[int,None]:
+        """
+        Memory available to the aggregator, in bytes.
+
+        Taken from ``aggregation_memory`` in the base config where given. 
+        Otherwise the memory for this job (``mem_allowed`` or the SLURM 
+        allocation), less any refs still held from ref creation. 
+        """
+        if self.base_cfg.get('aggregation_memory'):
+            return int(mem_to_val(str(self.base_cfg['aggregation_memory'])))
+
+        if self.mem_allowed is not None:
+            total = int(mem_to_val(self.mem_allowed))
+        else:
+            slurm_mem = os.getenv('SLURM_MEM_PER_NODE')
+            if slurm_mem is None or not slurm_mem.isnumeric():
+                return None
+            # SLURM reports memory in MB
+            total = int(slurm_mem)*1000000
+
+        # Streamed refs are reloaded from the cache, so are not held.
+        ref_memory = self.detail_cfg.get('ref_memory') or {}
+        held = 0 if ref_memory.get('streamed') else int(ref_memory.get('peak') or 0)
+        return max(total - held, 0)
+
+    def _record_aggregation(
+            self, 
+            planner: AggregationPlanner, 
+            mode: str, 
+            t_attempt: datetime, 
+            success: bool
+        ) -> None:
+        """
+        Record the outcome of an aggregation attempt alongside its
+        prediction, and calibrate the cost model from successful attempts.
+        """
+        actual = (datetime.now()-t_attempt).total_seconds()
+        plan = self.detail_cfg['aggregation_plan']
+        plan['attempts'].append({
+            'aggregator': mode,
+            'time': round(actual, 3),
+            'success': success,
+        })
+        if success:
+            plan['calibration'] = planner.calibrate(mode, actual)
+        self.detail_cfg['aggregation_plan'] = plan
+        self.detail_cfg.save()
+
+    def _attempt_aggregation(
+            self,
+            planner: AggregationPlanner,
+            attempt_aggs: list,
+            methods: dict,
+            aggregator: Union[str,None] = None,
+        ) -> str:
+        """
+        Run each aggregation method in order until one succeeds.
+
+        A ``ConcatFatalError`` is raised immediately, as no other method
+        can combine the files. Any other failure falls back to the next
+        method, unless a specific aggregator was requested or no fallbacks
+        remain.
+
+        :param attempt_aggs:    (list) Aggregation methods in order of preference.
+
+        :param methods:         (dict) Function running each aggregation method.
+
+        :param aggregator:      (str) Aggregator requested by the user, if any.
+
+        :returns:   The aggregation method which succeeded.
+        """
+        for attempt, mode in enumerate(attempt_aggs):
+
+            self.logger.info(f'Attempt {attempt+1}: {mode}')
+            t_attempt = datetime.now()
+            try:
+                methods[mode]()
+            except ConcatFatalError as err:
+                self._record_aggregation(planner, mode, t_attempt, False)
+                raise err
+            except Exception as err:
+                self._record_aggregation(planner, mode, t_attempt, False)
+                self.logger.info(f' > {mode} Failed - {err}')
+                # Specific method was tried but failed, or no fallbacks remain
+                if aggregator is not None or attempt == len(attempt_aggs)-1:
+                    raise err
+                continue
+
+            self._record_aggregation(planner, mode, t_attempt, True)
+            return mode
+
     def _data_to_json(
             self, 
             refs: dict, 
@@ -1338,10 +2715,15 @@ class KerchunkDS(ComputeOperation):
             b64vars: Union[list,None] = None,
         ) -> None:
         """
-        Concatenating to JSON-format Kerchunk file
+        Concatenating to JSON-format Kerchunk file, or to a Parquet
+        store for the ``parq`` file type.
         """
         self.logger.debug('Starting JSON-write process')
 
+        parquet = self.file_type == 'parq'
+        output_file = self.kstore.store_path if parquet else self.kfile.filepath
+        record_size = self.pre_kwargs.get('record_size', 10000)
+
         # Already have default options saved to class variables
         if len(refs) > 1:
 
@@ -1357,7 +2739,8 @@ class KerchunkDS(ComputeOperation):
             self.combine_kwargs = self.combine_kwargs or {}
 
             if self.detail_cfg['virtual_concat']:
-                refs, vdim = self._construct_virtual_dim(refs)
+                # Refs are modified so must be held in memory.
+                refs, vdim = self._construct_virtual_dim(list(refs))
                 self.combine_kwargs['concat_dims'] = [vdim]
 
             if self.combine_kwargs.get('aggregated_vars',None) is None:
@@ -1388,21 +2771,28 @@ class KerchunkDS(ComputeOperation):
             # Virtualizarr special requirement - data ordering
             if not self.order_confirmed and aggregator == 'V':
                 raise ValueError('VirtualiZarr aggregation unavailable for selected dataset.')
+            
+            # Virtualizarr parses the cache files directly.
+            if self.cache_format != 'json' and aggregator == 'V':
+                raise ValueError(
+                    f'VirtualiZarr aggregation unavailable for "{self.cache_format}" cache files.')
         
             ## 2. Select method for aggregation
 
             # Auto-incrementation is OFF - only aggregator 
             # manual selection will cause modes to be skipped.
+            chunk_estm = 0
+            for d in self.combine_kwargs['concat_dims']:
+                chunk_estm += self._chunk_estm_per_var(d)
+            chunk_estm = max(len(self.allfiles.get()), chunk_estm)
+            self.logger.debug(f'Dimensional Chunk Estimate: {chunk_estm}')
+
+            b64_estm = chunk_estm + sum(self._chunk_estm_per_var(v) for v in (b64vars or []))
+            planner = self._aggregation_planner(len(refs), agg_vars, b64_estm)
+
             attempt_aggs = []
             if (aggregator == 'P' or aggregator is None):
                 # Allow manual override for P method if requested.
-
-                chunk_estm = 0
-                for d in self.combine_kwargs['concat_dims']:
-                    chunk_estm += self._chunk_estm_per_var(d)
-                chunk_estm = max(len(self.allfiles.get()), chunk_estm)
-                self.logger.debug(f'Dimensional Chunk Estimate: {chunk_estm}')
-
                 if chunk_estm < 1000:
                     if aggregator == 'P':
                         attempt_aggs.append('PADOCC Aggregator')
@@ -1411,95 +2801,85 @@ class KerchunkDS(ComputeOperation):
                             'due to performance issues with final product'
                         )
                     else:
-                        self.logger.info('Dismissed PADOCC Aggregator for datasets with over 1000 dimensional chunks.')
+                        self.logger.info('Dismissed PADOCC Aggregator for datasets with under 1000 dimensional chunks.')
                 else:
                     attempt_aggs.append('PADOCC Aggregator')
-            if aggregator == 'V' or aggregator is None:
+            if aggregator == 'V' or (aggregator is None and self.cache_format == 'json' and self.order_confirmed):
                 attempt_aggs.append('VirtualiZarr')
             if aggregator == 'K' or aggregator is None:
                 attempt_aggs.append('Kerchunk MultiZarrToZarr')
 
+            if aggregator is None:
+                # Cheapest viable aggregator first, others kept as fallbacks.
+                attempt_aggs = planner.plan(attempt_aggs, memory_budget=self._aggregation_memory_budget())
+
             if len(attempt_aggs) == 0:
                 raise ValueError(f'No appropriate aggregation method could be identified from {aggregator}')
 
             self.logger.info(f"Attempting Aggregation: {attempt_aggs}")
+            self.detail_cfg['aggregation_plan'] = {
+                'predicted': {mode: planner.predict(mode) for mode in attempt_aggs},
+                'order': attempt_aggs,
+                'attempts': [],
+                'calibration': planner.calibration,
+            }
 
-            for attempt, mode in enumerate(attempt_aggs):
-
-                self.logger.info(f'Attempt {attempt+1}: {mode}')
-                if mode == 'PADOCC Aggregator':
-                    try:
-                        # Pure dimensions now ignored in padocc aggregator.
-                        b64vars = b64vars or self.combine_kwargs['concat_dims']
-                        self.padocc_aggregation = True
-                        padocc_combine(
-                            refs,
-                            self.filelist,
-                            agg_dims=self.combine_kwargs['concat_dims'],
-                            agg_vars=agg_vars,
-                            output_file=self.kfile.filepath,
-                            identical_vars=self.combine_kwargs["identical_dims"],
-                            zattrs=self.temp_zattrs.get(),
-                            b64vars=b64vars,
-                            logger=self.logger
-                        )
-                        break
-                    except ConcatFatalError as err:
-                        raise err
-                    except Exception as err:
-                        self.logger.info(f' > PADOCC Aggregator Failed - {err}')
-                        self.padocc_aggregation = False
-                        # Specific method was tried but failed
-                        if aggregator is not None:
-                            raise err
-                else:
-                    self.padocc_aggregation = False
-
-                if mode == 'VirtualiZarr':
-                    self.padocc_aggregation = False
-                    self.virtualizarr = True
-                    try:
-                        virtualise(
-                            f'{self.dir}/cache/', 
-                            output_file=self.kfile.filepath, 
-                            agg_dims=self.combine_kwargs['concat_dims'],
-                            data_vars=agg_vars,
-                            nfiles=self.limiter,
-                            logger=self.logger,
-                            allfiles=self.allfiles.get())
-                        break
-                    except ConcatFatalError as err:
-                        raise err
-                    except Exception as err:
-                        self.logger.info(f' > Virtualizarr Failed - {err}')
-                        self.virtualizarr = False
-                        # Specific method was tried but failed
-                        if aggregator is not None:
-                            raise err
+            def _padocc():
+                # Pure dimensions now ignored in padocc aggregator.
+                padocc_combine(
+                    refs,
+                    None if self._merging_subsets else self.filelist,
+                    agg_dims=self.combine_kwargs['concat_dims'],
+                    agg_vars=agg_vars,
+                    output_file=output_file,
+                    identical_vars=self.combine_kwargs["identical_dims"],
+                    zattrs=self.temp_zattrs.get(),
+                    b64vars=b64vars or self.combine_kwargs['concat_dims'],
+                    logger=self.logger,
+                    workers=self._workers,
+                    file_type=self.file_type,
+                    record_size=record_size,
+                )
+
+            def _virtualizarr():
+                virtualise(
+                    f'{self.dir}/cache/', 
+                    output_file=output_file, 
+                    agg_dims=self.combine_kwargs['concat_dims'],
+                    data_vars=agg_vars,
+                    nfiles=self.limiter,
+                    logger=self.logger,
+                    allfiles=self.allfiles.get(),
+                    workers=self._workers,
+                    file_type=self.file_type,
+                    record_size=record_size)
+
+            def _kerchunk():
+                if parquet:
+                    self._data_to_parq(refs)
                 else:
-                    self.virtualizarr = False
-
-                if mode == 'Kerchunk MultiZarrToZarr':
-                    self.padocc_aggregation = False
-                    self.virtualizarr = False
-                    self.kerchunk_aggregation = True
-                    try:
-                        mzz_combine(
-                            refs, 
-                            output_file=self.kfile, 
-                            concat_dims=self.combine_kwargs.get('concat_dims',None),
-                            identical_dims=self.combine_kwargs.get('identical_dims',None),
-                            zattrs=self.temp_zattrs.get(),
-                            fileset=self.filelist
-                        )
-                    except ConcatFatalError as err:
-                        raise err
-                    except Exception as err:
-                        self.logger.info(f' > Kerchunk MZZ Failed - {err}')
-                        self.kerchunk_aggregation = False
-                        # Specific method was tried but failed
-                        raise err
+                    mzz_combine(
+                        refs, 
+                        output_file=self.kfile, 
+                        concat_dims=self.combine_kwargs.get('concat_dims',None),
+                        identical_dims=self.combine_kwargs.get('identical_dims',None),
+                        zattrs=self.temp_zattrs.get(),
+                        fileset=self.filelist
+                    )
+
+            mode = self._attempt_aggregation(
+                planner, attempt_aggs, {
+                    'PADOCC Aggregator': _padocc,
+                    'VirtualiZarr': _virtualizarr,
+                    'Kerchunk MultiZarrToZarr': _kerchunk,
+                }, aggregator=aggregator)
+
+            self.padocc_aggregation   = (mode == 'PADOCC Aggregator')
+            self.virtualizarr         = (mode == 'VirtualiZarr')
+            self.kerchunk_aggregation = (mode == 'Kerchunk MultiZarrToZarr')
 
+        elif parquet:
+            self._data_to_parq(refs)
         else:
             self.logger.debug('Found single ref to save')
             self.kfile.set(refs[0])
@@ -1571,7 +2951,7 @@ class ZarrDS(ComputeOperation):
         if self._thorough or self._forceful:
             self.tempstore.clear()
 
-        self.mem_allowed = mem_allowed
+        self.mem_allowed = mem_allowed or '100MB'
 
     def _run(self, **kwargs) -> str:
         """
@@ -1693,6 +3073,66 @@ class ZarrDS(ComputeOperation):
                 self.logger.info('Skipped conversion writing')
 
 
+    def append(self, new_files: list) -> str:
+        """
+        Extend the existing Zarr store with newly arrived files along
+        the concatenation dimension. Only the new data is written, using 
+        the chunking of the existing store. Construct with ``append=True``
+        to use the current revision rather than a new version.
+
+        :param new_files:   (list) Paths to native files to add to the store.
+
+        :returns:   Status of the append operation.
+        """
+        existing_files = self.allfiles.get()
+        new_files = [f for f in new_files if f not in existing_files]
+        if len(new_files) == 0:
+            self.logger.info('No new files to append')
+            return 'Skipped'
+
+        concat = self._append_dim()
+
+        existing = self._open_existing_product()
+        new_files = self._order_appended_files(new_files, existing[concat])
+
+        # Match the chunking of the existing store.
+        dim_chunks = {}
+        for var in existing.variables:
+            chunks = existing[var].encoding.get('chunks',None) or []
+            for dim, c in zip(existing[var].dims, chunks):
+                dim_chunks.setdefault(dim, c)
+        existing.close()
+
+        self.logger.info(f'Appending {len(new_files)} files along "{concat}"')
+
+        new_ds = xr.open_mfdataset(
+            new_files,
+            combine='nested',
+            concat_dim=concat,
+            data_vars='minimal')
+        
+        # Variables without the concat dimension are already in the store.
+        new_ds = new_ds.drop_vars([v for v in new_ds.variables if concat not in new_ds[v].dims])
+        new_ds = new_ds.chunk({d: c for d, c in dim_chunks.items() if d in new_ds.dims})
+        for var in new_ds.variables:
+            new_ds[var].encoding = {}
+
+        if self._dryrun:
+            self.logger.info(f'DRYRUN: Skipped appending to {self.zstore}')
+            return 'Success'
+
+        t1 = datetime.now()
+        new_ds.to_zarr(self.zstore.store, append_dim=concat)
+        self.logger.info(f'Concluded append - {(datetime.now()-t1).total_seconds():.2f}s')
+
+        self.allfiles.set(existing_files + new_files)
+        self.allfiles.save()
+
+        self.detail_cfg['num_files'] = len(self.allfiles)
+        self.detail_cfg.save()
+
+        return 'Success'
+
     def _get_rechunk_scheme(self, ds):
         """
         Determine Rechunking Scheme appropriate
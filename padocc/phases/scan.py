@@ -13,7 +13,7 @@ import yaml
 
 from padocc.core import FalseLogger, ProjectOperation
 from padocc.core.errors import ConcatFatalError
-from padocc.core.filehandlers import JSONFileHandler
+from padocc.core.filehandlers import CACHE_FORMATS
 from padocc.core.utils import timestamp
 
 from .compute import ComputeOperation, KerchunkDS, ZarrDS
@@ -251,12 +251,13 @@ class ScanOperation(ProjectOperation):
         ctypes   = mini_ds.ctypes
 
         chunks_per_var = {}
+        ref_bytes = {'metadata': 0, 'variables': {}}
         
         self.logger.info(f'Summarising scan results for {limiter} files')
 
         for count in range(limiter):
             try:
-                volume, chunks_per_file, varchunks, cpv = self._summarise_json(count)
+                volume, chunks_per_file, varchunks, cpv, file_bytes = self._summarise_json(count)
                 vars = sorted(list(varchunks.keys()))
 
                 # Keeping the below options although may be redundant as have already processed the files
@@ -277,6 +278,12 @@ class ScanOperation(ProjectOperation):
                         chunks_per_var[var] = []
                     chunks_per_var[var].append(chunks)
 
+                ref_bytes['metadata'] += file_bytes['metadata']
+                for var, totals in file_bytes['variables'].items():
+                    var_totals = ref_bytes['variables'].setdefault(var, [0, 0, 0, 0])
+                    for i, value in enumerate(totals):
+                        var_totals[i] += value
+
                 cpf.append(chunks_per_file)
                 volms.append(volume)
 
@@ -293,10 +300,22 @@ class ScanOperation(ProjectOperation):
         # Avg per file for each variable
         chunks_per_var = {var: sum(chunks)/len(chunks) for var, chunks in chunks_per_var.items()}
 
+        # Avg encoded bytes per reference for each variable
+        ref_sizes = {
+            var: {
+                'key'  : round(key/nrefs, 1),
+                'ref'  : round(ref/nrefs, 1),
+                'chunk': round(chunk/nrefs, 1),
+            } for var, (key, ref, chunk, nrefs) in ref_bytes['variables'].items() if nrefs
+        }
+
         self._compile_outputs(
             std_vars, cpf, volms, timings, 
             ctypes, escape=escape, scanned_with='kerchunk',
-            chunks_per_var=chunks_per_var
+            chunks_per_var=chunks_per_var,
+            ref_sizes=ref_sizes,
+            metadata_bytes=round(ref_bytes['metadata']/limiter, 1),
+            estimator=mini_ds.estimate_aggregation
         )
 
     def _scan_cfa(
@@ -370,7 +389,7 @@ class ScanOperation(ProjectOperation):
 
     def _summarise_json(self, identifier) -> tuple:
         """
-        Open previously written JSON cached files and perform analysis.
+        Open previously written cache files and perform analysis.
         """
 
         if isinstance(identifier, dict):
@@ -383,13 +402,14 @@ class ScanOperation(ProjectOperation):
                 'forceful':self._forceful,
             }
 
-            fh = JSONFileHandler(self.dir, f'cache/{identifier}', logger=self.logger, **fh_kwargs)
+            cache_format = self.base_cfg.get('cache_format','json')
+            fh = CACHE_FORMATS[cache_format](self.dir, f'cache/{identifier}', logger=self.logger, **fh_kwargs)
             kdict = fh['refs']
 
             self.logger.debug(f'Starting Analysis of references for {identifier}')
 
         if not kdict:
-            return None, None, None
+            return None, None, None, None, None
 
         # Perform summations, extract chunk attributes
         sizes  = []
@@ -397,19 +417,39 @@ class ScanOperation(ProjectOperation):
         chunks = 0
         chunks_per_var = {}
 
+        # Encoded bytes of the keys, refs and chunks, and number of refs, per variable.
+        ref_bytes = {'metadata': 0, 'variables': {}}
+
         for chunkkey in kdict.keys():
+            encoded = len(json.dumps(kdict[chunkkey]))
             if bool(re.search(r'\d', chunkkey)):
+                var = chunkkey.split('/')[0]
+                if isinstance(kdict[chunkkey], str):
+                    # Inlined chunk
+                    nbytes = len(kdict[chunkkey])
+                elif len(kdict[chunkkey]) == 3:
+                    nbytes = kdict[chunkkey][2]
+                else:
+                    nbytes = 0
                 try:
                     sizes.append(int(kdict[chunkkey][2]))
-                    var = chunkkey.split('/')[0]
                     if var not in chunks_per_var:
                         chunks_per_var[var] = 0
                     chunks_per_var[var] += 1
-                except ValueError:
+                except (ValueError, IndexError):
                     pass
+
+                totals = ref_bytes['variables'].setdefault(var, [0, 0, 0, 0])
+                totals[0] += len(chunkkey) + 4
+                totals[1] += encoded
+                totals[2] += int(nbytes)
+                totals[3] += 1
+
                 chunks += 1
                 continue
 
+            ref_bytes['metadata'] += len(chunkkey) + 4 + encoded
+
             if '/.zarray' in chunkkey:
                 var = chunkkey.split('/')[0]
                 chunksize = 0
@@ -420,7 +460,7 @@ class ScanOperation(ProjectOperation):
                         chunksize = dict(kdict[chunkkey])['chunks']
                     vars[var] = chunksize
 
-        return np.sum(sizes), chunks, vars, chunks_per_var
+        return np.sum(sizes), chunks, vars, chunks_per_var, ref_bytes
 
     def _compile_outputs(
         self, 
@@ -432,8 +472,22 @@ class ScanOperation(ProjectOperation):
         escape: bool = None, 
         override_type: str = None, 
         scanned_with : str = None,
-        chunks_per_var: dict = None
+        chunks_per_var: dict = None,
+        ref_sizes: dict = None,
+        metadata_bytes: float = None,
+        estimator: callable = None,
     ) -> None:
+        """
+        Compile the scan summary into the detail config.
+
+        :param ref_sizes:       (dict) Average bytes of the key, reference and
+            chunk for each variable, from the scanned refs.
+
+        :param metadata_bytes:  (float) Average bytes of the metadata keys per file.
+
+        :param estimator:       (callable) Dry-run aggregation estimate from the 
+            chunk info, recorded as ``aggregation_estimate`` for the whole group.
+        """
         
         chunks_per_var = chunks_per_var or {}
 
@@ -467,6 +521,15 @@ class ScanOperation(ProjectOperation):
             }
         }
 
+        if ref_sizes:
+            details['chunk_info']['ref_sizes'] = ref_sizes
+            details['chunk_info']['metadata_bytes'] = metadata_bytes
+
+        if estimator is not None:
+            details['aggregation_estimate'] = estimator(
+                chunk_info=details['chunk_info'], nfiles=len(self.allfiles))
+            self.logger.info(f'Aggregation estimate: {details["aggregation_estimate"]}')
+
         if escape:
             details['scan_status'] = 'FAILED'
 
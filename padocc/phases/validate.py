@@ -3,6 +3,7 @@ __contact__   = "daniel.westwood@stfc.ac.uk"
 __copyright__ = "Copyright 2023 United Kingdom Research and Innovation"
 
 import json
+import math
 import random
 from datetime import datetime
 from typing import Optional, Union
@@ -80,14 +81,209 @@ def check_for_nan(box, bypass, logger, label=None): # Ingest into class structu
 
     return isnan
 
-def slice_all_dims(data_arr: xr.DataArray, intval: int, dim_mid: Union[dict[int,None],None] = None):
+def _iter_blocks(box, block_size: int):
+    """
+    Load a box selection in blocks along its first dimension, yielding each
+    block as a 1D array view.
+    """
+    if len(box.shape) == 0 or box.size == 0:
+        yield np.asarray(box).ravel()
+        return
+
+    rows = max(1, int(block_size / max(1, box.size // box.shape[0])))
+    for i in range(0, box.shape[0], rows):
+        yield np.asarray(box[i:i+rows]).ravel()
+
+def _fused_comparison(
+        test, 
+        control, 
+        rtol: float = 1e-05, 
+        block_size: int = 2**22
+    ) -> Union[dict,None]:
+    """
+    Compare two equally sized box selections in a single pass over blocks 
+    of both arrays, without flattening either array in full.
+
+    Closeness follows ``np.allclose(control, test, atol=tolerance, equal_nan=True)``
+    where the tolerance is 0.1% of the mean of the test values. As the tolerance
+    is only known after the pass, the largest difference in excess of the 
+    relative tolerance is kept and compared at the end.
+
+    :param test:        (obj) The cloud-format dataset selection.
+
+    :param control:     (obj) The native dataset selection.
+
+    :param rtol:        (float) Relative tolerance as for ``np.allclose``.
+
+    :param block_size:  (int) Approximate number of elements loaded per block.
+
+    :returns:   Closeness, exact equality and NaN-mask agreement, with the min, 
+        max and mean of each array, or None for non-numeric data.
+    """
+    if test.dtype.kind not in 'biuf' or control.dtype.kind not in 'biuf':
+        return None
+
+    if tuple(test.shape) != tuple(control.shape):
+        # Blocks would not align, so compare each as a single block.
+        block_size = max(test.size, 1)
+
+    stats = {
+        label: {'min': np.inf, 'max': -np.inf, 'sum': 0.0, 'count': 0}
+        for label in ('test','control')
+    }
+    equal, nan_match, excess = True, True, -np.inf
+
+    for tblock, cblock in zip(_iter_blocks(test, block_size), _iter_blocks(control, block_size)):
+        if tblock.dtype.kind == 'b':
+            tblock = tblock.astype(np.uint8)
+        if cblock.dtype.kind == 'b':
+            cblock = cblock.astype(np.uint8)
+
+        tnan, cnan = np.isnan(tblock), np.isnan(cblock)
+        nan_match = nan_match and np.array_equal(tnan, cnan)
+
+        same = (tblock == cblock) | (tnan & cnan)
+        if not same.all():
+            equal = False
+            diff = ~same
+            t = tblock[diff].astype(np.float64)
+            c = cblock[diff].astype(np.float64)
+            block_excess = np.abs(c - t) - rtol*np.abs(t)
+            # Non-finite differences (NaN against a value, or unequal infinities)
+            block_excess[~np.isfinite(block_excess)] = np.inf
+            excess = max(excess, block_excess.max())
+
+        for label, block, nan in (('test', tblock, tnan), ('control', cblock, cnan)):
+            values = block[~nan] if nan.any() else block
+            if values.size == 0:
+                continue
+            record = stats[label]
+            record['min'] = min(record['min'], float(values.min()))
+            record['max'] = max(record['max'], float(values.max()))
+            record['sum'] += values.sum(dtype=np.float64)
+            record['count'] += values.size
+
+    for record in stats.values():
+        if record['count']:
+            record['mean'] = record['sum']/record['count']
+        else:
+            record.update({'min': np.nan, 'max': np.nan, 'mean': np.nan})
+
+    tolerance = np.abs(stats['test']['mean'])/1000
+    if np.isnan(tolerance):
+        tolerance = 0
+
+    return {
+        'tolerance': tolerance,
+        'close': bool(nan_match and excess <= tolerance),
+        'equal': bool(nan_match and equal),
+        'nan_match': bool(nan_match),
+        'test': stats['test'],
+        'control': stats['control'],
+    }
+
+def get_chunk_sizes(data_arr: xr.DataArray) -> dict:
+    """
+    Storage chunk size for each dimension of the DataArray, from the 
+    ``.zarray`` chunks of a Zarr/Kerchunk source or the HDF5 chunking
+    of a NetCDF4 source, as recorded in the encoding. Contiguous or
+    unknown storage gives an empty set.
+    """
+    encoding = getattr(data_arr, 'encoding', None) or {}
+
+    preferred = encoding.get('preferred_chunks')
+    if preferred:
+        return {dim: int(c) for dim, c in preferred.items() if dim in data_arr.dims}
+
+    chunks = encoding.get('chunks') or encoding.get('chunksizes')
+    if chunks and len(chunks) == len(data_arr.dims):
+        return {dim: int(c) for dim, c in zip(data_arr.dims, chunks)}
+    return {}
+
+# Largest chunk size, as a multiple of the growbox width along a dimension,
+# that the box is snapped to. Whole chunks are decompressed whichever part is
+# selected, so snapping to them costs no extra reads, but a chunk much larger
+# than the box would load and compare far more data than the growbox step
+# intended. Beyond this factor the unaligned box is used instead.
+ALIGN_FACTOR = 4
+
+def chunk_alignment(
+        test: xr.DataArray, 
+        control: xr.DataArray,
+        test_offsets: Union[dict,None] = None,
+        control_offsets: Union[dict,None] = None,
+    ) -> dict:
+    """
+    Storage chunk grids for each dimension, as ``(size, offset)`` pairs
+    with chunk boundaries at indices ``i`` where ``(offset + i) % size == 0``.
+
+    A grid aligned with both the test and control chunks is listed first
+    where one exists, followed by the test grid alone (or the control grid
+    if the test array is not chunked).
+
+    :param test_offsets:        (dict) Start index of any preslice applied to 
+        each dimension of the test array.
+
+    :param control_offsets:     (dict) Start index of any preslice applied to 
+        each dimension of the control array.
+    """
+    tchunks = get_chunk_sizes(test)
+    cchunks = get_chunk_sizes(control)
+    test_offsets    = test_offsets or {}
+    control_offsets = control_offsets or {}
+
+    alignment = {}
+    for dim in set(tchunks) | set(cchunks):
+        ct, cc = tchunks.get(dim, 0), cchunks.get(dim, 0)
+        ot = int(test_offsets.get(dim, 0)) % ct if ct > 0 else 0
+        oc = int(control_offsets.get(dim, 0)) % cc if cc > 0 else 0
+
+        if ct <= 0:
+            if cc > 0:
+                alignment[dim] = [(cc, oc)]
+            continue
+
+        grids = [(ct, ot)]
+        if cc > 0:
+            size = math.lcm(ct, cc)
+            # First index on a boundary of both grids, if they coincide.
+            first = next(
+                (i for i in range((-ot) % ct, size, ct) if (oc + i) % cc == 0),
+                None)
+            if first is not None and (size, (-first) % size) != grids[0]:
+                grids.insert(0, (size, (-first) % size))
+        alignment[dim] = grids
+    return alignment
+
+def _select_grid(grids: Union[list,None], width: int) -> Union[tuple,None]:
+    """
+    Select the first chunk grid of at most ``ALIGN_FACTOR`` times the box
+    width, or None if every grid is larger so the box should not be snapped.
+    """
+    if not grids:
+        return None
+    limit = ALIGN_FACTOR * max(width, 1)
+    for grid in grids:
+        if grid[0] <= limit:
+            return grid
+    return None
+
+def slice_all_dims(
+        data_arr: xr.DataArray, 
+        intval: int, 
+        dim_mid: Union[dict[int,None],None] = None,
+        chunks: Union[dict,None] = None,
+    ):
     """
     Slice all dimensions for the DataArray according 
-    to the integer value."""
+    to the integer value. Where chunk grids are given (see ``chunk_alignment``),
+    the slice is extended to whole chunks so only the chunks needed are read,
+    unless the chunks are more than ``ALIGN_FACTOR`` times the slice width."""
     shape = tuple(data_arr.shape)
     dims  = tuple(data_arr.dims)
 
     dim_mid = dim_mid or {}
+    chunks  = chunks or {}
 
     slice_applied = []
     for dim, d in zip(dims, shape):
@@ -103,9 +299,31 @@ def slice_all_dims(data_arr: xr.DataArray, intval: int, dim_mid: Union[dict[int,
         # Rounding issue solve - bug 20/05/25
         if step < 0.5:
             step = 0.51
-        slice_applied.append(slice(int(mid-step),int(mid+step)))
+
+        start, stop = int(mid-step), int(mid+step)
+        grid = _select_grid(chunks.get(dim), stop-start)
+        if grid is not None:
+            c, offset = grid
+            if stop - start <= c:
+                # Box fits in a single chunk - use the chunk containing the midpoint.
+                first = (offset + min(max(mid, 0), d-1))//c
+                start = max(0, first*c - offset)
+                stop  = min(d, (first+1)*c - offset)
+            else:
+                # Snap outwards to the chunk boundaries.
+                start = max(0, ((offset + start)//c)*c - offset)
+                stop  = min(d, -(-(offset + stop)//c)*c - offset)
+        slice_applied.append(slice(start,stop))
     return tuple(slice_applied)
 
+def _covers_array(slice_applied: Union[tuple,None], shape: tuple) -> bool:
+    """
+    Whether the slices select the whole of an array of the given shape.
+    """
+    if slice_applied is None:
+        return False
+    return all(s.start == 0 and s.stop == d for s, d in zip(slice_applied, shape))
+
 def format_slice(slice: list[slice]) -> str:
     starts = []
     ends = []
@@ -172,6 +390,18 @@ class PresliceSet:
                 da = da.squeeze(dim=squeeze_dims, drop=True)
             return da
 
+    def offsets(self, var: str) -> dict:
+        """
+        Start index of the preslice applied to each dimension of a variable.
+        """
+        offsets = {}
+        for dim, dslice in (self._preslice_set.get(var) or {}).items():
+            if isinstance(dslice, tuple):
+                dslice = dslice[0]
+            if isinstance(dslice, slice) and dslice.start is not None:
+                offsets[dim] = int(dslice.start)
+        return offsets
+
     def _default_preslice(self, data_arr: xr.DataArray) -> xr.DataArray:
         """
         Default preslice performs no operations on the
@@ -916,6 +1146,7 @@ class ValidateDatasets(LoggedOperation):
             current : int = 100,
             recursion_limit : int = 1, 
             dim_mid: Union[dict,None] = None,
+            previous: Union[tuple,None] = None,
         ) -> bool:
         """
         General purpose validation for a specific variable from multiple sources.
@@ -927,6 +1158,8 @@ class ValidateDatasets(LoggedOperation):
         :param test:            (obj) The cloud-format (Kerchunk) dataset selection
 
         :param control:         (obj) The native dataset selection
+
+        :param previous:        (tuple) The last slice found to be all NaN.
         """
         if test.size != control.size:
             self.logger.error(
@@ -935,20 +1168,39 @@ class ValidateDatasets(LoggedOperation):
             )
             return
 
+        # Box snapped to the storage chunks of both sources.
+        chunks = chunk_alignment(
+            test, control,
+            test_offsets=self._preslice_fns[0].offsets(var),
+            control_offsets=self._preslice_fns[1].offsets(var))
+
+        slice_applied = previous
+        while slice_applied == previous and current > recursion_limit:
+            if _covers_array(previous, test.shape):
+                # Box already spans the whole array so cannot grow any further.
+                current = recursion_limit
+                break
+
+            slice_applied = slice_all_dims(test, current, dim_mid=dim_mid, chunks=chunks)
+            if slice_applied == previous:
+                # Step leaves the box unchanged, so it is still all NaN.
+                current -= 1
+
         if current <= recursion_limit:
             self.logger.debug('Maximum recursion depth reached')
             self.logger.info(f'Validation for {var} not performed')
 
             self._data_report[f'variables,growbox,{var}'] = 'all_nans'
             return None
-        
-        slice_applied = slice_all_dims(test, current, dim_mid=dim_mid)
+
         self.logger.debug(f'Applying slice {slice_applied} to {var}')
         tbox = test[slice_applied]
         cbox = control[slice_applied]
 
         if check_for_nan(cbox, BypassSwitch(), self.logger, label=var):
-            return self._validate_selection(var, test, control, current-1, recursion_limit=recursion_limit, dim_mid=dim_mid)
+            return self._validate_selection(
+                var, test, control, current-1, recursion_limit=recursion_limit, 
+                dim_mid=dim_mid, previous=slice_applied)
         else:
             return self._compare_data(var, slice_applied, tbox, cbox)
 
@@ -963,9 +1215,11 @@ class ValidateDatasets(LoggedOperation):
         Compare a NetCDF-derived ND array to a Kerchunk-derived one. This function takes a 
         netcdf selection box array of n-dimensions and an equally sized test array and
         tests for elementwise equality within selection. If possible, tests max/mean/min calculations 
-        for the selection to ensure cached values are the same.
+        for the selection to ensure cached values are the same. All comparisons are made in a single
+        pass over both arrays.
 
-        Expect TypeErrors later from summations which are bypassed. Other errors will exit the run.
+        Non-numeric arrays are bypassed, as are max/min/mean comparisons where either
+        selection has no non-NaN values. Other errors will exit the run.
 
         :param vname:           (str) The name of the variable described by this box selection
 
@@ -980,56 +1234,39 @@ class ValidateDatasets(LoggedOperation):
         """
         self.logger.info(f'Starting data comparison for {vname}')
 
-        self.logger.debug('1. Flattening Arrays')
+        self.logger.debug('1. Comparing Arrays')
         t1 = datetime.now()
 
         data_errors, bypassed = [], []
 
-        ### --- Array Flattening --- ##
+        if len(slice_applied) == 0:
+            slice_applied = [slice(0, test.size)]
+        start, stop = format_slice(slice_applied)
+
+        ### --- Fused comparison: closeness, equality and statistics --- ###
         try:
-            control   = np.array(control).flatten()
-            test      = np.array(test).flatten()
+            result = _fused_comparison(test, control)
         except Exception as err:
-            self.logger.error('Failed to flatten numpy arrays')
+            self.logger.error('Failed to compare arrays')
             raise err
 
-        if len(slice_applied) == 0:
-            slice_applied = [slice(0, len(control))]
-        start, stop = format_slice(slice_applied)
-
-        ### --- Tolerance Calculation --- ###
+        if result is None:
+            self._data_report[f'variables,bypassed,{vname}'] = 'non-comparable'
+            self.logger.info(f'Data validation skipped for {vname} - non-comparable')
+            return
 
-        self.logger.debug(f'2. Calculating Tolerance - {(datetime.now()-t1).total_seconds():.2f}s')
-        try: # Tolerance 0.1% of mean value for xarray set
-            tolerance = np.abs(np.nanmean(test))/1000
-        except TypeError: # Type cannot be summed so skip all summations
-            tolerance = None
+        self.logger.debug(f'2. Comparison complete - {(datetime.now()-t1).total_seconds():.2f}s')
+        tolerance = result['tolerance']
+        tstats, cstats = result['test'], result['control']
 
         ### --- Equality Comparison: with tolerance --- ###
 
-        self.logger.debug(f'3a. Comparing with all_close - {(datetime.now()-t1).total_seconds():.2f}s')
-        try:
-            is_close = np.allclose(control, test, atol=tolerance, equal_nan=True)
-        except TypeError as err:
-            try:
-                is_close = np.allclose(control, test, atol=tolerance)
-            except TypeError:
-                self._data_report[f'variables,bypassed,{vname}'] = 'non-comparable'
-                self.logger.info(f'Data validation skipped for {vname} - non-comparable')
-                return
-            
-        ### --- Equality Comparison: without tolerance --- ###
-
-        self.logger.debug(f'3b. Comparing with array_equal - {(datetime.now()-t1).total_seconds():.2f}s')
-        try:
-            equality = np.allclose(control, test, atol=tolerance, equal_nan=True)
-        except TypeError as err:
-            try:
-                equality = np.allclose(control, test, atol=tolerance)
-            except TypeError:
-                self._data_report[f'variables,bypassed,{vname}'] = 'non-comparable'
-                self.logger.info(f'Data validation skipped for {vname} - non-comparable')
-                return
+        is_close = result['close']
+        # Equality is tested to the same tolerance (0.1% of mean value) as closeness,
+        # so precision errors are not currently reported.
+        equality = result['close']
+        if not result['equal'] and is_close:
+            self.logger.debug(f'Values for {vname} differ within tolerance {tolerance}')
 
         if not equality:
             if not is_close:
@@ -1038,36 +1275,17 @@ class ValidateDatasets(LoggedOperation):
                 data_errors.append('precision_error')
 
         ### --- Max/Min/Mean Comparisons --- ###
-        
-        self.logger.debug(f'4. Comparing Max values - {(datetime.now()-t1).total_seconds():.2f}s')
-        try:
-            if np.abs(np.nanmax(test) - np.nanmax(control)) > tolerance:
-                self.logger.warning(f'Failed maximum comparison for {vname}')
-                self.logger.debug('K ' + str(np.nanmax(test)) + ' N ' + str(np.nanmax(control)))
-                data_errors.append('max_not_equal')
-        except TypeError as err:
-            self.logger.warning(f'Max comparison skipped for non-summable values in {vname}')
-            bypassed.append('max')
-
-        self.logger.debug(f'5. Comparing Min values - {(datetime.now()-t1).total_seconds():.2f}s')
-        try:
-            if np.abs(np.nanmin(test) - np.nanmin(control)) > tolerance:
-                self.logger.warning(f'Failed minimum comparison for {vname}')
-                self.logger.debug('K ' + str(np.nanmin(test)) + ' N ' + str(np.nanmin(control)))
-                data_errors.append('min_not_equal')
-        except TypeError as err:
-            self.logger.warning(f'Min comparison skipped for non-summable values in {vname}')
-            bypassed.append('min')
-
-        self.logger.debug(f'6. Comparing Mean values - {(datetime.now()-t1).total_seconds():.2f}s')
-        try:
-            if np.abs(np.nanmean(test) - np.nanmean(control)) > tolerance:
-                self.logger.warning(f'Failed mean comparison for {vname}')
-                self.logger.debug('K ' + str(np.nanmean(test)) + ' N ' + str(np.nanmean(control)))
-                data_errors.append('mean_not_equal')
-        except TypeError as err:
-            self.logger.warning(f'Mean comparison skipped for non-summable values in {vname}')
-            bypassed.append('mean')
+
+        for stat in ('max','min','mean'):
+            if np.isnan(tstats[stat]) or np.isnan(cstats[stat]):
+                self.logger.warning(f'{stat.capitalize()} comparison skipped for all-NaN values in {vname}')
+                bypassed.append(stat)
+                continue
+
+            if np.abs(tstats[stat] - cstats[stat]) > tolerance:
+                self.logger.warning(f'Failed {stat} comparison for {vname}')
+                self.logger.debug('K ' + str(tstats[stat]) + ' N ' + str(cstats[stat]))
+                data_errors.append(f'{stat}_not_equal')
 
         if data_errors:
             # 1.3.5 Error bypass
@@ -1107,6 +1325,9 @@ class ValidateOperation(ProjectOperation):
 
         self.phase = 'validate'
         super().__init__(proj_code, workdir, **kwargs)
+
+        # Cached positions of sample files along the concat dimension.
+        self._offsets = {}
         if parallel:
             self.update_status(self.phase, 'Pending',jobid=self._logid)
 
@@ -1246,6 +1467,36 @@ class ValidateOperation(ProjectOperation):
         """
         return self.cfa_dataset.open_dataset(**kwargs)
 
+    def _cached_offset(self, test, sample, dim: str, rf: int) -> Union[int,None]:
+        """
+        Determine the position of a sample file along the concatenation
+        dimension from the coordinate ranges cached during file ordering.
+
+        Only a single value of the test coordinate is read to confirm
+        the offset, returns None if no confirmed offset is available.
+        """
+        cache = self.coord_ranges.get()
+        if cache.get('dim',None) != dim or rf is None:
+            return None
+        
+        if rf not in self._offsets:
+            ranges = cache.get('files',{})
+            try:
+                self._offsets[rf] = int(sum(ranges[f][2] for f in self.allfiles[:rf]))
+            except KeyError:
+                self._offsets[rf] = None
+
+        offset = self._offsets[rf]
+        if offset is None or offset >= test[dim].size:
+            return None
+
+        if not np.isclose(
+                np.array(test[dim][offset], dtype=sample[dim].dtype),
+                np.array(sample[dim][0])):
+            self.logger.debug(f'Cached offset for {dim} does not match - {offset}')
+            return None
+        return offset
+
     def _get_preslice(self, test, sample, variables, rf:int = 0):
         """Match timestamp of xarray object to kerchunk object.
         
@@ -1290,6 +1541,10 @@ class ValidateOperation(ProjectOperation):
 
             for dim in sample[var].dims:
 
+                cached = None
+                if len(sample[dim]) >= 2:
+                    cached = self._cached_offset(test, sample, dim, rf)
+
                 if len(sample[dim]) < 2:
                     # Non-coordinate dimensions with no axis.
 
@@ -1299,6 +1554,11 @@ class ValidateOperation(ProjectOperation):
                     pos0 = index #np.array(test[dim][index], dtype=test[dim].dtype)
                     end = stop # np.array(test[dim][stop], dtype=test[dim].dtype)
 
+                elif cached is not None:
+                    # Offset known from cached coordinate ranges.
+                    pos0 = cached
+                    end  = pos0 + len(sample[dim])
+
                 else:
                     # Source Slice validation for coodinate dimensions
 
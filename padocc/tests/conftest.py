@@ -8,6 +8,7 @@ def pytest_collection_modifyitems(items):
         "TestScan",
         "TestCompute",
         "TestZarrCompute",
+        "TestAppend",
         "TestZarrValidate"
         "TestValidate",
         "TestGroup",
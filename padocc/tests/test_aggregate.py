@@ -0,0 +1,307 @@
+import base64
+import json
+import math
+import struct
+
+from padocc.phases.aggregate import (AggregationPlanner, RechunkBuffer,
+                                     _block_owners, _chunk_offsets,
+                                     _coalesce_ranges, _file_blocks,
+                                     padocc_combine, remap_keys)
+
+def _zarray(shape: list, chunks: list) -> str:
+    return json.dumps({
+        'shape': shape, 'chunks': chunks, 'dtype': '<f8', 'compressor': None,
+        'fill_value': None, 'filters': None, 'order': 'C', 'zarr_format': 2
+    })
+
+def _zattrs(dims: list) -> str:
+    return json.dumps({'_ARRAY_DIMENSIONS': dims, 'units': '1'})
+
+def _make_ref(file_ord: int, ntime: int = 2) -> dict:
+    """
+    Refs for one small file with ``ntime`` time steps, an identical
+    ``lat`` variable and a ``tas`` variable aggregated along time.
+    """
+    times = struct.pack(f'<{ntime}d', *range(file_ord*ntime, (file_ord+1)*ntime))
+    refs = {
+        '.zgroup': json.dumps({'zarr_format': 2}),
+        '.zattrs': json.dumps({'title': 'test'}),
+        'time/.zarray': _zarray([ntime], [ntime]),
+        'time/.zattrs': _zattrs(['time']),
+        'time/0': (b'base64:' + base64.b64encode(times)).decode(),
+        'lat/.zarray': _zarray([3], [3]),
+        'lat/.zattrs': _zattrs(['lat']),
+        'lat/0': ['lat.nc', 0, 24],
+        'tas/.zarray': _zarray([ntime, 3], [1, 3]),
+        'tas/.zattrs': _zattrs(['time', 'lat']),
+    }
+    for t in range(ntime):
+        refs[f'tas/{t}.0'] = [f'file{file_ord}.nc', 1000 + 24*t, 24]
+    return {'version': 1, 'refs': refs}
+
+def _b64(values: list) -> str:
+    data = struct.pack(f'<{len(values)}d', *values)
+    return (b'base64:' + base64.b64encode(data)).decode()
+
+def _make_grid_ref(t: int, l: int) -> dict:
+    """
+    Refs for the file at position (t, l) of a grid of files split
+    along both time (2 steps per file) and lat (3 values per file).
+    """
+    refs = {
+        '.zgroup': json.dumps({'zarr_format': 2}),
+        '.zattrs': json.dumps({'title': 'test'}),
+        'time/.zarray': _zarray([2], [2]),
+        'time/.zattrs': _zattrs(['time']),
+        'time/0': _b64([2*t, 2*t+1]),
+        'lat/.zarray': _zarray([3], [3]),
+        'lat/.zattrs': _zattrs(['lat']),
+        'lat/0': _b64([3*l, 3*l+1, 3*l+2]),
+        'tas/.zarray': _zarray([2, 3], [1, 3]),
+        'tas/.zattrs': _zattrs(['time', 'lat']),
+    }
+    for i in range(2):
+        refs[f'tas/{i}.0'] = [f'file_t{t}_l{l}.nc', 1000 + 24*i, 24]
+    return {'version': 1, 'refs': refs}
+
+def _remap_key(key, file_ord, agg_dim_rechunk, label_dim_index, chunk_bounds, rechunk_cache, data):
+    """
+    Previous per-key remapping, replaced by ``remap_keys``.
+    """
+    array_label = key.split('/')[0]
+
+    chunk_coords = [int(c) for c in key.split('/')[1].split('.')]
+    for dim, index in label_dim_index.items():
+        chunk_coords[index] += chunk_bounds[dim][file_ord]
+
+    if array_label in agg_dim_rechunk and data is not None:
+        rechunk_coord = math.floor(chunk_coords[0]/agg_dim_rechunk[array_label])
+        rechunk_cache[array_label].setdefault(f'/{rechunk_coord}', []).append(data)
+        return None, rechunk_cache
+
+    new_key = f'{array_label}/{".".join([str(c) for c in chunk_coords])}'
+    return new_key, rechunk_cache
+
+class TestAggregate:
+
+    def test_combine_identical_vars(self, tmp_path):
+
+        print("Unit Tests: PADOCC combine - identical variables")
+
+        output_file = tmp_path / 'combined.json'
+        padocc_combine(
+            [_make_ref(i) for i in range(3)], None,
+            ['time'], ['tas'], output_file=str(output_file),
+            identical_vars=['lat'])
+
+        # Count every key as written, as json.load keeps only the last duplicate.
+        with open(output_file) as f:
+            pairs = json.load(f, object_pairs_hook=lambda p: p)
+        keys = [k for k, _ in dict(pairs)['refs']]
+
+        assert len(keys) == len(set(keys))
+        assert keys.count('lat/0') == 1
+        assert keys.count('lat/.zarray') == 1
+
+        with open(output_file) as f:
+            refs = json.load(f)['refs']
+        assert refs['lat/0'] == ['lat.nc', 0, 24]
+        assert sorted(k for k in keys if k.startswith('tas/') and '.z' not in k) == [
+            f'tas/{t}.0' for t in range(6)]
+        assert refs['tas/5.0'] == ['file2.nc', 1024, 24]
+
+        print(' - PADOCC combine - identical variables - Complete')
+
+    def test_coalesce_ranges(self):
+
+        print("Unit Tests: Coalesce byte ranges")
+
+        # Overlapping ranges, given out of order.
+        merged = _coalesce_ranges([(50, 100, 'b'), (0, 100, 'a')], max_gap=0)
+        assert merged == [(0, 150, [(0, 100, 'a'), (50, 100, 'b')])]
+
+        # Range contained within another does not shrink the read.
+        merged = _coalesce_ranges([(0, 100, 'a'), (10, 20, 'b')], max_gap=0)
+        assert merged == [(0, 100, [(0, 100, 'a'), (10, 20, 'b')])]
+
+        # Adjacent ranges
+        merged = _coalesce_ranges([(0, 100, 'a'), (100, 50, 'b')], max_gap=0)
+        assert merged == [(0, 150, [(0, 100, 'a'), (100, 50, 'b')])]
+
+        # Gap of exactly max_gap is bridged, one byte more is not.
+        merged = _coalesce_ranges([(0, 100, 'a'), (164, 10, 'b')], max_gap=64)
+        assert merged == [(0, 174, [(0, 100, 'a'), (164, 10, 'b')])]
+
+        merged = _coalesce_ranges([(0, 100, 'a'), (165, 10, 'b'), (175, 5, 'c')], max_gap=64)
+        assert merged == [
+            (0, 100, [(0, 100, 'a')]),
+            (165, 180, [(165, 10, 'b'), (175, 5, 'c')])
+        ]
+
+        assert _coalesce_ranges([], max_gap=64) == []
+        print(' - Coalesce byte ranges - Complete')
+
+    def test_file_grid(self):
+
+        print("Unit Tests: PADOCC combine - 2x2 file grid")
+
+        positions = [(0,0), (0,1), (1,0), (1,1)]
+        grid = [_make_grid_ref(t, l) for t, l in positions]
+
+        file_blocks = _file_blocks(grid, ['time', 'lat'])
+        assert file_blocks == {'time': [0,0,1,1], 'lat': [0,1,0,1]}
+
+        # Coordinate chunks are taken from the first file in each block.
+        assert _block_owners(file_blocks, ['time']) == {0, 2}
+        assert _block_owners(file_blocks, ['lat']) == {0, 1}
+        assert _block_owners(file_blocks, ['time', 'lat']) == {0, 1, 2, 3}
+
+        # Chunk offsets of tas, with 2 chunks per file along time and 1 along lat.
+        assert _chunk_offsets([2,2,2,2], file_blocks['time']) == [0,0,2,2,4]
+        assert _chunk_offsets([1,1,1,1], file_blocks['lat']) == [0,1,0,1,2]
+        assert _chunk_offsets([2,2,2,2]) == [0,2,4,6,8]
+
+        combined = padocc_combine(grid, None, ['time', 'lat'], ['tas'])['refs']
+
+        assert combined['time/0'] == grid[0]['refs']['time/0']
+        assert combined['time/1'] == grid[2]['refs']['time/0']
+        assert combined['lat/0'] == grid[0]['refs']['lat/0']
+        assert combined['lat/1'] == grid[1]['refs']['lat/0']
+
+        chunks = sorted(k for k in combined if k.startswith('tas/') and '.z' not in k)
+        assert chunks == [f'tas/{i}.{j}' for i in range(4) for j in range(2)]
+        for t, l in positions:
+            for i in range(2):
+                assert combined[f'tas/{2*t+i}.{l}'] == [f'file_t{t}_l{l}.nc', 1000 + 24*i, 24]
+
+        # Files must form a complete grid.
+        try:
+            _file_blocks(grid[:3], ['time', 'lat'])
+            assert False, 'Incomplete grid not rejected'
+        except NotImplementedError:
+            pass
+
+        print(' - PADOCC combine - 2x2 file grid - Complete')
+
+    def test_remap_keys(self):
+
+        print("Unit Tests: Remap chunk keys")
+
+        # 4D variable aggregated along its first and third dimensions.
+        label_dim_index = {'time': 0, 'level': 2}
+        chunk_bounds = {'time': [0, 3, 6, 9], 'level': [0, 0, 12, 12]}
+        keys = [f'ta/{t}.{y}.{z}.{x}' for t in range(3) for y in range(2) for z in range(12) for x in range(2)]
+
+        for file_ord in range(3):
+            new_keys, coords = remap_keys('ta', keys, file_ord, {}, label_dim_index, chunk_bounds)
+            old_keys = [
+                _remap_key(k, file_ord, {}, label_dim_index, chunk_bounds, {}, None)[0] for k in keys]
+            assert coords is None
+            assert new_keys == old_keys
+
+        # Rechunked arrays give the combined chunk of each key.
+        chunk_bounds = {'time': [0, 5, 10]}
+        keys = [f'time/{i}' for i in range(5)]
+        for file_ord in range(2):
+            new_keys, coords = remap_keys('time', keys, file_ord, {'time': 4}, {'time': 0}, chunk_bounds)
+            cache = {'time': {}}
+            for k in keys:
+                _remap_key(k, file_ord, {'time': 4}, {'time': 0}, chunk_bounds, cache, k)
+            assert new_keys is None
+            assert cache['time'] == {
+                f'/{c}': [k for k, kc in zip(keys, coords) if kc == c] for c in set(coords)}
+
+        print(' - Remap chunk keys - Complete')
+
+    def test_planner(self):
+
+        print("Unit Tests: Aggregation planner")
+
+        planner = AggregationPlanner(100, 50, 2, b64_chunks=100)
+        cost = AggregationPlanner.COSTS['PADOCC Aggregator']
+
+        # Time and memory from files, variables, refs and inlined chunks.
+        predicted = planner.predict('PADOCC Aggregator')
+        assert predicted['time'] == round(
+            100*(cost['file'] + 2*cost['var']) + 5000*cost['ref'] + 100*cost['b64'], 3)
+        assert predicted['memory'] == int(100*cost['mem_file'] + 5000*cost['mem_ref'])
+
+        # Ordered by predicted time.
+        modes = ['Kerchunk MultiZarrToZarr', 'VirtualiZarr', 'PADOCC Aggregator']
+        times = {m: planner.predict(m)['time'] for m in modes}
+        assert planner.plan(modes) == sorted(modes, key=times.get)
+
+        # Excluded beyond the memory budget, keeping the least memory if none fit.
+        memory = {m: planner.predict(m)['memory'] for m in modes}
+        budget = sorted(memory.values())[1]
+        assert planner.plan(modes, memory_budget=budget) == sorted(
+            [m for m in modes if memory[m] <= budget], key=times.get)
+        assert planner.plan(modes, memory_budget=1) == [min(modes, key=memory.get)]
+        assert planner.plan([]) == []
+
+        # Calibration scales later predictions to the actual time.
+        calibration = planner.calibrate('VirtualiZarr', times['VirtualiZarr']*2)
+        assert calibration == {'VirtualiZarr': 2.0}
+        assert planner.predict('VirtualiZarr')['time'] == round(times['VirtualiZarr']*2, 3)
+        assert planner.predict('VirtualiZarr', calibrate=False)['time'] == times['VirtualiZarr']
+
+        # Supplied costs replace the defaults for that aggregator only.
+        custom = AggregationPlanner(100, 50, 2, b64_chunks=100, costs={'VirtualiZarr': {'mem_ref': 0, 'mem_file': 1}})
+        assert custom.predict('VirtualiZarr')['memory'] == 100
+        assert custom.predict('PADOCC Aggregator') == planner.predict('PADOCC Aggregator')
+        assert AggregationPlanner.COSTS['VirtualiZarr']['mem_ref'] != 0
+
+        print(' - Aggregation planner - Complete')
+
+    def test_rechunk_buffer(self):
+
+        print("Unit Tests: Rechunk buffer")
+
+        # Chunks of two arrays arriving per file, with groups split across files.
+        files = [
+            [('time', '/0', [b'a'*8, b'b'*8]), ('lat', '/0', [b'x'*16])],
+            [('time', '/0', [b'c'*8]), ('time', '/1', [b'd'*8]), ('lat', '/0', [b'y'*16])],
+            [('time', '/1', [b'e'*8, b'f'*8]), ('lat', '/1', [b'z'*16, b'w'*16])],
+        ]
+        rechunk = {'time': 3, 'lat': 2}
+
+        def _combine(max_memory):
+            buffer = RechunkBuffer(rechunk, max_memory=max_memory)
+            output = []
+            for chunks in files:
+                for label, coord, dataset in chunks:
+                    combined = buffer.add(label, coord, dataset)
+                    if combined is not None:
+                        output.append(combined)
+            spilled = buffer._spill is not None
+            buffer.close()
+            return output, spilled
+
+        unbounded, spilled = _combine(10**9)
+        assert not spilled
+
+        # Each group is written once complete, in order of completion.
+        def _b64(data):
+            return (b'base64:' + base64.b64encode(data)).decode()
+        assert unbounded == [
+            ('time/0', _b64(b'a'*8 + b'b'*8 + b'c'*8)),
+            ('lat/0', _b64(b'x'*16 + b'y'*16)),
+            ('time/1', _b64(b'd'*8 + b'e'*8 + b'f'*8)),
+            ('lat/1', _b64(b'z'*16 + b'w'*16)),
+        ]
+
+        # Spilling incomplete groups to disk gives the same output.
+        bounded, spilled = _combine(10)
+        assert spilled
+        assert bounded == unbounded
+
+        # Incomplete groups are an error.
+        buffer = RechunkBuffer(rechunk, max_memory=10)
+        assert buffer.add('time', '/0', [b'a'*8, b'b'*8]) is None
+        try:
+            buffer.close()
+            assert False, 'Incomplete group not rejected'
+        except ValueError:
+            pass
+
+        print(' - Rechunk buffer - Complete')
@@ -0,0 +1,123 @@
+import glob
+
+import numpy as np
+import xarray as xr
+
+from padocc import GroupOperation
+from padocc.core.utils import BypassSwitch
+from padocc.phases.compute import KerchunkDS, ZarrDS
+
+WORKDIR = 'padocc/tests/auto_testdata_dir'
+
+GROUP = 'padocc-append-tests'
+FILES = sorted(glob.glob('padocc/tests/data_creator/1DAgg/*.nc'))
+
+def _create_product(proj_code: str, mode: str = 'kerchunk', file_type: str = 'json', workdir=WORKDIR):
+    """
+    Compute a product from all but the last two files of the 1D aggregation.
+    """
+    group = GroupOperation(GROUP, workdir=workdir, label='test_append', verbose=1)
+    group.add_project({'proj_code': proj_code, 'pattern': FILES[:-2]})
+
+    if mode == 'kerchunk':
+        proj = group[proj_code]
+        proj.file_type = file_type
+        proj.save_files()
+
+    results = group.run(
+        'compute', mode=mode, forceful=True,
+        bypass=BypassSwitch('D'), proj_code=proj_code)
+    assert results['Success'] == 1
+
+def _check_appended(process):
+    """
+    Product should now match the concatenation of all native files.
+    """
+    concat = process._append_dim()
+    expected = xr.open_mfdataset(
+        FILES, combine='nested', concat_dim=concat,
+        data_vars='minimal', decode_times=False)
+
+    process = type(process)(
+        process.proj_code, WORKDIR, groupID=GROUP,
+        append=True, label='test_append', verbose=1)
+    ds = process._open_existing_product()
+
+    assert ds[concat].size == expected[concat].size
+    assert np.all(ds[concat].values == expected[concat].values)
+    for var in expected.data_vars:
+        assert np.allclose(ds[var].values, expected[var].values, equal_nan=True), var
+
+    assert len(process.allfiles.get()) == len(FILES)
+    ds.close()
+    expected.close()
+
+class TestAppend:
+
+    def test_append_json(self, workdir=WORKDIR):
+
+        print("Integration Tests: Append - Kerchunk JSON")
+
+        _create_product('append_json', workdir=workdir)
+
+        process = KerchunkDS(
+            'append_json', workdir, groupID=GROUP,
+            append=True, label='test_append', verbose=1)
+        assert process.append(FILES[-2:]) == 'Success'
+
+        # Files already in the product are skipped.
+        assert process.append(FILES[-2:]) == 'Skipped'
+
+        _check_appended(process)
+        print(' - Append - Kerchunk JSON - Complete')
+
+    def test_append_parq(self, workdir=WORKDIR):
+
+        print("Integration Tests: Append - Kerchunk Parquet")
+
+        _create_product('append_parq', file_type='parq', workdir=workdir)
+
+        process = KerchunkDS(
+            'append_parq', workdir, groupID=GROUP,
+            append=True, label='test_append', verbose=1)
+        assert process.append(FILES[-2:]) == 'Success'
+
+        _check_appended(process)
+        print(' - Append - Kerchunk Parquet - Complete')
+
+    def test_append_zarr(self, workdir=WORKDIR):
+
+        print("Integration Tests: Append - Zarr")
+
+        _create_product('append_zarr', mode='zarr', workdir=workdir)
+
+        process = ZarrDS(
+            'append_zarr', workdir, groupID=GROUP,
+            append=True, label='test_append', verbose=1)
+        assert process.append(FILES[-2:]) == 'Success'
+
+        _check_appended(process)
+        print(' - Append - Zarr - Complete')
+
+    def test_append_order(self, workdir=WORKDIR):
+
+        print("Integration Tests: Append - Ordering")
+
+        process = KerchunkDS(
+            'append_json', workdir, groupID=GROUP,
+            append=True, label='test_append', verbose=1)
+        concat = process._append_dim()
+
+        # Files before the end of the existing product cannot be appended.
+        last = xr.open_dataset(FILES[-1], decode_times=False)[concat]
+        try:
+            process._order_appended_files(FILES[:2], last)
+            assert False, 'Non-monotonic append not rejected'
+        except ValueError:
+            pass
+
+        # Reversed files are placed in coordinate order.
+        first = xr.open_dataset(FILES[0], decode_times=False)[concat]
+        ordered = process._order_appended_files(FILES[1:][::-1], first)
+        assert ordered == FILES[1:]
+        print(' - Append - Ordering - Complete')
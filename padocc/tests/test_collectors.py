@@ -0,0 +1,113 @@
+import json
+
+from padocc.core.collectors import AttrReducer
+
+CONCAT_MSG = 'See individual files for more details'
+
+def _old_reduction(allzattrs: list, nfiles: int) -> tuple[dict,list]:
+    """
+    Attribute reduction as previously applied to the full list of
+    attributes in ``ComputeOperation._clean_attr_array``.
+    """
+    base = json.loads(allzattrs[0])
+
+    times = {k: [base[k]] for k in base.keys() if 'time' in k}
+    nonequal = {}
+    for ref in allzattrs[1:]:
+        zattrs = json.loads(ref)
+        for attr in zattrs.keys():
+            if attr in times:
+                times[attr].append(zattrs[attr])
+            elif attr not in base:
+                nonequal[attr] = False
+            elif base[attr] != zattrs[attr]:
+                nonequal[attr] = False
+
+    for k in times.keys():
+        if 'start' in k:
+            base[k] = sorted(times[k])[0]
+        elif 'end' in k or 'stop' in k:
+            base[k] = sorted(times[k])[-1]
+        elif 'duration' in k:
+            pass
+        elif len(set(times[k])) == 1:
+            base[k] = times[k][0]
+        elif len(set(times[k])) == nfiles:
+            base[k] = 'See individual files for details'
+        else:
+            base[k] = list(set(times[k]))
+
+    for attr in nonequal.keys():
+        base[attr] = CONCAT_MSG
+    return base, sorted(nonequal.keys())
+
+def _zattrs(nfiles: int, ntimes: int) -> list:
+    """
+    Attributes for ``nfiles`` files, with ``ntimes`` distinct values
+    of the ``time_frequency`` attribute.
+    """
+    allzattrs = []
+    for i in range(nfiles):
+        zattrs = {
+            'title': 'test',
+            'history': f'created {i}',
+            'time_coverage_start': f'2000-01-{i+1:02d}',
+            'time_coverage_end': f'2000-01-{i+2:02d}',
+            'time_coverage_duration': 'P1D',
+            'time_frequency': f'freq{i % ntimes}',
+            'time_constant': 'day',
+        }
+        if i == 2:
+            zattrs['extra'] = 'only here'
+        allzattrs.append(json.dumps(zattrs))
+    return allzattrs
+
+class TestCollectors:
+
+    def test_attr_reducer(self):
+
+        print("Unit Tests: Attribute reducer")
+
+        for ntimes in [1, 3, 10]:
+            allzattrs = _zattrs(10, ntimes)
+
+            reducer = AttrReducer(CONCAT_MSG, nfiles=10)
+            for zattrs in allzattrs:
+                reducer.add(zattrs)
+
+            base, nonequal = reducer.reduce()
+            old_base, old_nonequal = _old_reduction(allzattrs, 10)
+
+            # Distinct values may be ordered differently.
+            if isinstance(old_base['time_frequency'], list):
+                assert sorted(base.pop('time_frequency')) == sorted(old_base.pop('time_frequency'))
+
+            assert base == old_base, ntimes
+            assert nonequal == old_nonequal == ['extra', 'history']
+
+        print(' - Attribute reducer - Complete')
+
+    def test_attr_reducer_distinct(self):
+
+        print("Unit Tests: Attribute reducer - distinct values")
+
+        allzattrs = _zattrs(10, 5)
+
+        # Up to max_distinct values are listed as before.
+        reducer = AttrReducer(CONCAT_MSG, nfiles=10, max_distinct=5)
+        for zattrs in allzattrs:
+            reducer.add(zattrs)
+        base, _ = reducer.reduce()
+        assert sorted(base['time_frequency']) == sorted(
+            _old_reduction(allzattrs, 10)[0]['time_frequency'])
+
+        # Beyond max_distinct, the values are no longer listed.
+        reducer = AttrReducer(CONCAT_MSG, nfiles=10, max_distinct=4)
+        for zattrs in allzattrs:
+            reducer.add(zattrs)
+        base, _ = reducer.reduce()
+        assert base['time_frequency'] == 'See individual files for details'
+        assert base['time_coverage_start'] == '2000-01-01'
+        assert base['time_coverage_end'] == '2000-01-11'
+
+        print(' - Attribute reducer - distinct values - Complete')
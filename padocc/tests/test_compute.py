@@ -1,4 +1,15 @@
+import logging
+import sys
+from types import SimpleNamespace
+
+import netCDF4
+import numpy as np
+
 from padocc import GroupOperation
+from padocc.core.errors import ConcatFatalError
+from padocc.phases.aggregate import AggregationPlanner
+from padocc.phases.compute import (ComputeOperation, KerchunkDS,
+                                   _header_summary, _ref_nbytes)
 
 WORKDIR = 'padocc/tests/auto_testdata_dir'
 
@@ -16,6 +27,251 @@ class TestCompute:
 
         assert results['Success'] == 3
 
+    def test_compute_parallel_cached(self, workdir=WORKDIR):
+        groupID = 'padocc-test-suite'
+
+        process = KerchunkDS(
+            '1DAgg',
+            workdir=workdir,
+            groupID=groupID,
+            label='test_compute_parallel',
+            verbose=1)
+
+        # All files cached by the basic compute test, driver not passed.
+        listfiles = process.allfiles.get()
+        refset = list(process._convert_parallel(listfiles, 0, len(listfiles), ctype=None, workers=2))
+
+        assert len(refset) == len(listfiles)
+        for x, ref, ctype, _ in refset:
+            assert ref, f'Cached refs not loaded for file {x}'
+            assert ctype is not None
+
+        ctypes = [ctype for _, _, ctype, _ in refset]
+        assert '/'.join(set(ctypes))
+
+def _write_header_file(nfile, time: int, changed: bool = False):
+    """
+    Small file with one time step, identical lat, aggregated tas and
+    a large mask that differs in a single value if ``changed``.
+    """
+    with netCDF4.Dataset(nfile, 'w') as ds:
+        ds.createDimension('time', 1)
+        ds.createDimension('lat', 1000)
+        ds.createDimension('lon', 200)
+
+        ds.createVariable('time', 'i4', ('time',))[:] = [time]
+        ds.createVariable('lat', 'f4', ('lat',))[:] = np.arange(1000)
+        ds.createVariable('tas', 'f4', ('time','lat'))[:] = np.full((1,1000), time)
+
+        mask = np.zeros((1000,200), dtype='i1')
+        if changed:
+            mask[1,1] = 1
+        ds.createVariable('mask', 'i1', ('lat','lon'))[:] = mask
+
+class TestHeaders:
+
+    def test_header_summary(self, tmp_path):
+
+        print("Unit Tests: Header summary")
+
+        _write_header_file(tmp_path / 'a.nc', 0)
+        _write_header_file(tmp_path / 'b.nc', 0, changed=True)
+
+        a = _header_summary(str(tmp_path / 'a.nc'))
+        assert a['dims'] == {'time': 1, 'lat': 1000, 'lon': 200}
+        assert a['vars']['tas'] == {
+            'dims': ['time','lat'], 'shape': [1,1000], 'hash': a['vars']['tas']['hash']}
+        assert a['sampled'] == []
+
+        # Hashed in full, the single changed value is detected.
+        b = _header_summary(str(tmp_path / 'b.nc'))
+        assert a['vars']['mask']['hash'] != b['vars']['mask']['hash']
+        assert a['vars']['lat']['hash'] == b['vars']['lat']['hash']
+
+        # Sampled beyond the limit, the changed value is missed.
+        a = _header_summary(str(tmp_path / 'a.nc'), small=1000, full=10000)
+        b = _header_summary(str(tmp_path / 'b.nc'), small=1000, full=10000)
+        assert a['sampled'] == ['mask']
+        assert a['vars']['mask']['hash'] == b['vars']['mask']['hash']
+
+        print(' - Header summary - Complete')
+
+    def test_dims_via_headers(self, tmp_path):
+
+        print("Unit Tests: Dimensions via headers")
+
+        files = []
+        for t in range(4):
+            nfile = str(tmp_path / f'file{t}.nc')
+            _write_header_file(nfile, t, changed=(t == 3))
+            files.append(nfile)
+
+        def _dims(cfg):
+            project = SimpleNamespace(
+                allfiles=SimpleNamespace(get=lambda: files),
+                base_cfg=cfg,
+                logger=logging.getLogger('test_headers'))
+            return ComputeOperation._dims_via_headers(project)
+
+        concat_dims, identical_dims, aggregated_vars = _dims({'dim_sample_size': 4})
+        assert concat_dims == ['time']
+        assert sorted(identical_dims) == ['lat', 'lon']
+        assert sorted(aggregated_vars) == ['mask', 'tas']
+
+        # Mask is sampled and appears identical - the documented limit.
+        concat_dims, identical_dims, aggregated_vars = _dims(
+            {'dim_sample_size': 4, 'header_hash_limit': 10000})
+        assert sorted(identical_dims) == ['lat', 'lon', 'mask']
+        assert aggregated_vars == ['tas']
+
+        print(' - Dimensions via headers - Complete')
+
+def _deep_sizeof(refs: dict) -> int:
+    size = sys.getsizeof(refs)
+    for key, value in refs.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, list):
+            size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+class TestRefMemory:
+
+    def test_ref_nbytes(self):
+
+        print("Unit Tests: Ref memory estimate")
+
+        refs = {'.zgroup': '{"zarr_format": 2}'}
+        for i in range(5000):
+            refs[f'tas/{i}.0.0'] = ['padocc/tests/data_creator/1DAgg/file0.nc', 1000*i, 1000]
+
+        # Sampled estimate of uniform refs is close to the full measurement.
+        estimate = _ref_nbytes({'refs': refs})
+        assert abs(estimate - _deep_sizeof(refs)) < 0.05*_deep_sizeof(refs)
+
+        assert _ref_nbytes({'refs': {}}) == sys.getsizeof({})
+        print(' - Ref memory estimate - Complete')
+
+class TestAggregationAttempts:
+
+    def _attempt(self, methods, attempt_aggs, aggregator=None):
+        records = []
+        project = SimpleNamespace(
+            logger=logging.getLogger('test_attempts'),
+            _record_aggregation=lambda planner, mode, t, success: records.append((mode, success)))
+        try:
+            return KerchunkDS._attempt_aggregation(
+                project, None, attempt_aggs, methods, aggregator=aggregator), records
+        except Exception as err:
+            return err, records
+
+    def test_attempt_fallback(self):
+
+        print("Unit Tests: Aggregation attempts")
+
+        def _fail():
+            raise ValueError('aggregation failed')
+
+        def _fatal():
+            raise ConcatFatalError(var='tas', chunk1=1, chunk2=2)
+
+        def _succeed():
+            pass
+
+        # Falls back to the next method when no aggregator was requested.
+        result, records = self._attempt({'P': _fail, 'V': _succeed, 'K': _fail}, ['P','V','K'])
+        assert result == 'V'
+        assert records == [('P', False), ('V', True)]
+
+        # Requested aggregators do not fall back.
+        result, records = self._attempt({'P': _fail, 'K': _succeed}, ['P','K'], aggregator='P')
+        assert isinstance(result, ValueError)
+        assert records == [('P', False)]
+
+        # Failure of the last method is raised.
+        result, records = self._attempt({'P': _fail, 'K': _fail}, ['P','K'])
+        assert isinstance(result, ValueError)
+        assert records == [('P', False), ('K', False)]
+
+        # Chunk mismatches are fatal for every method.
+        result, records = self._attempt({'P': _fatal, 'K': _succeed}, ['P','K'])
+        assert isinstance(result, ConcatFatalError)
+        assert records == [('P', False)]
+
+        print(' - Aggregation attempts - Complete')
+
+    def test_aggregation_memory_budget(self, monkeypatch):
+
+        print("Unit Tests: Aggregation memory budget")
+
+        monkeypatch.delenv('SLURM_MEM_PER_NODE', raising=False)
+
+        def _budget(base_cfg=None, mem_allowed=None, ref_memory=None):
+            project = SimpleNamespace(
+                base_cfg=base_cfg or {}, mem_allowed=mem_allowed,
+                detail_cfg={'ref_memory': ref_memory})
+            return KerchunkDS._aggregation_memory_budget(project)
+
+        assert _budget() is None
+        assert _budget(base_cfg={'aggregation_memory': '2GB'}, mem_allowed='1GB') == 2000000000
+
+        # Refs held from ref creation are not available for aggregation.
+        assert _budget(mem_allowed='1GB') == 1000000000
+        assert _budget(mem_allowed='1GB', ref_memory={'peak': 4e8, 'streamed': False}) == 600000000
+        assert _budget(mem_allowed='1GB', ref_memory={'peak': 4e8, 'streamed': True}) == 1000000000
+
+        # Full SLURM allocation, rather than the half allowed for refs.
+        monkeypatch.setenv('SLURM_MEM_PER_NODE', '4000')
+        assert _budget() == 4000000000
+
+        print(' - Aggregation memory budget - Complete')
+
+class TestAggregationEstimate:
+
+    def test_estimate_aggregation(self):
+
+        print("Unit Tests: Aggregation estimate")
+
+        chunk_info = {
+            'variables': {'time': '1.0', 'lat': '1.0', 'tas': '4.0'},
+            'chunks_per_file': '6.0',
+            'ref_sizes': {
+                'time': {'key': 6, 'ref': 40, 'chunk': 8},
+                'tas': {'key': 9, 'ref': 50, 'chunk': 1000},
+            },
+            'metadata_bytes': 500,
+        }
+        project = SimpleNamespace(
+            detail_cfg={}, base_cfg={}, pre_kwargs={}, drop_vars=None,
+            combine_kwargs={
+                'concat_dims': ['time'], 'identical_dims': ['lat'], 'aggregated_vars': ['tas']})
+        project._aggregation_planner = lambda *args, **kwargs: KerchunkDS._aggregation_planner(
+            project, *args, **kwargs)
+
+        estimate = KerchunkDS.estimate_aggregation(project, chunk_info=chunk_info, nfiles=10)
+
+        # Time is inlined (21 encoded bytes per chunk), lat taken from one file and
+        # lat refs without measured sizes use the typical sizes.
+        assert estimate['total_refs'] == 10 + 1 + 40
+        assert estimate['b64vars'] == ['time']
+        assert estimate['b64_bytes'] == 10*21
+        assert estimate['json_size'] == 500 + 10*(6+21) + (20+150) + 40*(9+50)
+        assert estimate['parq_size'] == 500 + 10*8 + 16 + 40*16
+        assert estimate['parq_files'] == 3
+
+        # Open times and aggregator predictions from the same cost model.
+        planner = AggregationPlanner(10, 6.0, 1, b64_chunks=10)
+        assert estimate['open_time'] == {
+            'json': round(planner.open_time('json', 3300, 51), 3),
+            'parq': round(planner.open_time('parq', 500, 11, dim_files=2, nvars=3), 3),
+        }
+        assert estimate['suggested_type'] == 'json'
+        assert estimate['aggregators'] == {
+            mode: planner.predict(mode) for mode in AggregationPlanner.COSTS}
+
+        assert KerchunkDS.estimate_aggregation(project, chunk_info={'variables': {}}) is None
+        print(' - Aggregation estimate - Complete')
+
 if __name__ == '__main__':
     #workdir = '/home/users/dwest77/cedadev/padocc/padocc/tests/auto_testdata_dir'
-    TestCompute().test_compute_basic()#workdir=workdir)
\ No newline at end of file
+    TestCompute().test_compute_basic()#workdir=workdir)
+    TestCompute().test_compute_parallel_cached()
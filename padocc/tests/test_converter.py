@@ -0,0 +1,29 @@
+from padocc.phases.compute import KerchunkConverter
+
+SIGNATURES = {
+    'ncf3_classic.nc': (b'CDF\x01' + b'\x00'*60, 'ncf3'),
+    'ncf3_64bit.nc'  : (b'CDF\x02' + b'\x00'*60, 'ncf3'),
+    'hdf5.nc'        : (b'\x89HDF\r\n\x1a\n' + b'\x00'*60, 'hdf5'),
+    'hdf5_userblock.nc': (b'\x00'*512 + b'\x89HDF\r\n\x1a\n' + b'\x00'*60, 'hdf5'),
+    'grib.grb'       : (b'GRIB' + b'\x00'*60, 'grib'),
+    'unknown.dat'    : (b'NOTAFORMAT' + b'\x00'*60, None),
+    'empty.dat'      : (b'', None),
+}
+
+class TestConverter:
+
+    def test_detect_type(self, tmp_path):
+
+        print("Unit Tests: Converter type detection")
+
+        converter = KerchunkConverter()
+
+        for name, (content, ctype) in SIGNATURES.items():
+            nfile = tmp_path / name
+            nfile.write_bytes(content)
+            assert converter.detect_type(str(nfile)) == ctype, name
+
+        # Missing files fall back to trial-and-error detection
+        assert converter.detect_type(str(tmp_path / 'missing.nc')) is None
+
+        print(' - Converter type detection - Complete')
@@ -1,10 +1,17 @@
+import gzip
+import json
 import os
 
+import numpy as np
+import pytest
+import xarray as xr
 import yaml
 
-from padocc.core.filehandlers import (CSVFileHandler, JSONFileHandler,
-                                      KerchunkFile, ListFileHandler,
-                                      LogFileHandler)
+from padocc.core.filehandlers import (CacheManifest, CSVFileHandler,
+                                      IcechunkStore, JSONFileHandler,
+                                      KerchunkFile, KerchunkPackFile,
+                                      ListFileHandler, LogFileHandler,
+                                      RefWriter)
 
 WORKDIR = 'padocc/tests/auto_testdata_dir'
 
@@ -113,14 +120,161 @@ class TestFHs:
 
             print(f' - CSV FH (dryrun={dryrun}) - Complete')
 
-if __name__ == '__main__':
-    fht = TestFHs()
+    def test_manifest_fh(self):
 
-    fht.test_json_fh()
-    fht.test_text_fh()
-    fht.test_csv_fh()
+        print("Unit Tests: Cache Manifest FH")
+
+        source = f'{WORKDIR}/manifest_source.txt'
+        with open(source,'w') as f:
+            f.write('version 1')
+
+        manifest = CacheManifest(WORKDIR, 'testmf', use_hash=True)
+
+        # No fingerprints recorded - existing caches trusted.
+        assert manifest.is_current(source, 0)
+
+        manifest.record(source, 0)
+        assert manifest.is_current(source, 0)
+        assert not manifest.is_current(source, 1)
+        assert manifest.relocations(['other', source]) == {0: 1}
+
+        with open(source,'w') as f:
+            f.write('version two')
+
+        assert not manifest.is_current(source, 0)
+        assert manifest.relocations(['other', source]) == {}
+
+        os.system(f'rm -f {source} {manifest.filepath}')
+
+        # Subset jobs sharing a manifest keep each other's entries
+        sources = [f'{WORKDIR}/manifest_source{i}.txt' for i in range(2)]
+        for src in sources:
+            with open(src,'w') as f:
+                f.write(src)
+
+        subsets = [CacheManifest(WORKDIR, 'testmf') for _ in sources]
+        for x, (subset, src) in enumerate(zip(subsets, sources)):
+            subset.record(src, x)
+        for subset in subsets:
+            subset.save()
+
+        merged = CacheManifest(WORKDIR, 'testmf')
+        assert merged.position(sources[0]) == 0
+        assert merged.position(sources[1]) == 1
+
+        os.system(f'rm -f {" ".join(sources)} {merged.filepath} {merged.filepath}.lock')
+
+        print(' - Cache Manifest FH - Complete')
+
+    def test_pack_fh(self):
+
+        print("Unit Tests: Kerchunk Pack FH")
+
+        refs = {
+            'version': 1,
+            'refs': {
+                '.zgroup': '{"zarr_format":2}',
+                'tas/.zarray': '{"chunks":[1,10]}',
+                'tas/0.0': ['/path/to/file.nc', 1024, 4096],
+                'tas/1.0': ['/path/to/file.nc', 5120, 4096],
+                'time/0': 'base64:AAAA',
+            }
+        }
+
+        pack_fh = KerchunkPackFile(WORKDIR, 'testpk')
+        pack_fh.set(refs)
+        pack_fh.save()
+
+        assert os.path.isfile(pack_fh.filepath)
+
+        # Round trip through the packed file
+        assert KerchunkPackFile(WORKDIR, 'testpk').get() == refs
+
+        os.system(f'rm -f {pack_fh.filepath}')
+
+        # Existing JSON caches are still readable
+        json_fh = KerchunkFile(WORKDIR, 'testpk')
+        json_fh.set(refs)
+        json_fh.save()
 
+        assert KerchunkPackFile(WORKDIR, 'testpk').get() == refs
 
+        os.system(f'rm -f {json_fh.filepath}')
 
+        print(' - Kerchunk Pack FH - Complete')
 
+    def test_ref_writer(self):
 
+        print("Unit Tests: Ref Writer")
+
+        refs = {
+            '.zgroup': '{"zarr_format":2}',
+            'tas/0.0': ['/path/to/file.nc', 1024, 4096],
+            'time/0': 'base64:AAAA',
+        }
+
+        # Kerchunk files are written incrementally
+        kfile = KerchunkFile(WORKDIR, 'testrw')
+        kfile.set({'version': 1, 'refs': refs})
+        kfile.save()
+
+        with open(kfile.filepath) as f:
+            assert json.load(f) == {'version': 1, 'refs': refs}
+
+        os.system(f'rm -f {kfile.filepath}')
+
+        # Compression inferred from the extension
+        writer = RefWriter(f'{WORKDIR}/testrw.json.gz', 1, buffer_size=10)
+        for k, v in refs.items():
+            writer.write(k, v)
+        writer.close()
+
+        with gzip.open(f'{WORKDIR}/testrw.json.gz','rt') as f:
+            assert json.load(f) == {'version': 1, 'refs': refs}
+
+        os.system(f'rm -f {WORKDIR}/testrw.json.gz')
+
+        print(' - Ref Writer - Complete')
+
+    def test_icechunk_fh(self, tmp_path):
+
+        pytest.importorskip('icechunk')
+
+        from obstore.store import from_url
+        from virtualizarr import open_virtual_dataset
+        from virtualizarr.parsers import HDFParser
+        from virtualizarr.registry import ObjectStoreRegistry
+
+        print("Unit Tests: Icechunk FH")
+
+        nfile = os.path.abspath('padocc/tests/data_creator/1DAgg/file0.nc')
+        vds = open_virtual_dataset(
+            url=f'file://{nfile}',
+            parser=HDFParser(),
+            registry=ObjectStoreRegistry({'file://': from_url('file://')}))
+
+        store = IcechunkStore(str(tmp_path), 'testic')
+        store.write_virtual(vds, [nfile], attrs={'title': 'padocc icechunk test'})
+
+        # Read back through the virtual references
+        ds = store.open_dataset(decode_times=False)
+        expected = xr.open_dataset(nfile, decode_times=False)
+        for var in expected.variables:
+            assert np.array_equal(
+                ds[var].values, expected[var].values, equal_nan=True), var
+
+        assert store.get_meta()['title'] == 'padocc icechunk test'
+
+        ds.close()
+        expected.close()
+        print(' - Icechunk FH - Complete')
+
+if __name__ == '__main__':
+    fht = TestFHs()
+
+    fht.test_json_fh()
+    fht.test_text_fh()
+    fht.test_csv_fh()
+    fht.test_manifest_fh()
+    fht.test_pack_fh()
+    fht.test_ref_writer()
@@ -1,5 +1,7 @@
 import os
 
+from padocc.core.utils import mem_to_val
+
 
 class TestSetup:
     def test_setup(self):
@@ -10,4 +12,22 @@ class TestCleanup:
 
     def test_cleanup(self):
         os.system('rm -rf padocc/tests/auto_testdata_dir')
-        assert not os.path.isdir('padocc/tests/auto_testdata_dir')
\ No newline at end of file
+        assert not os.path.isdir('padocc/tests/auto_testdata_dir')
+
+class TestUtils:
+
+    def test_mem_to_val(self):
+
+        print("Unit Tests: Memory values")
+
+        assert mem_to_val('100MB') == 100000000
+        assert mem_to_val('100 MB') == 100000000
+        assert mem_to_val('100M') == 100000000
+        assert mem_to_val('2G') == 2000000000
+        assert mem_to_val('2gb') == 2000000000
+        assert mem_to_val('1.5KB') == 1500
+        assert mem_to_val('3T') == 3000000000000
+        assert mem_to_val('512B') == 512
+        assert mem_to_val('512') == 512
+
+        print(' - Memory values - Complete')
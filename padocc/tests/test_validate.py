@@ -1,10 +1,245 @@
+import logging
 import os
+from types import SimpleNamespace
+
+import numpy as np
+import xarray as xr
 
 from padocc import GroupOperation
 from padocc.core.utils import BypassSwitch
+from padocc.phases.validate import (Report, ValidateDatasets, _fused_comparison,
+                                    _select_grid, chunk_alignment, slice_all_dims)
 
 WORKDIR = 'padocc/tests/auto_testdata_dir'
 
+def _old_comparison(test, control) -> list:
+    """
+    Data errors as previously found by ``ValidateDatasets._compare_data``,
+    from flattened copies of both arrays.
+    """
+    control = np.array(control).flatten()
+    test    = np.array(test).flatten()
+
+    tolerance = np.abs(np.nanmean(test))/1000
+    errors = []
+    if not np.allclose(control, test, atol=tolerance, equal_nan=True):
+        errors.append('not_equal')
+
+    for stat, func in (('max', np.nanmax), ('min', np.nanmin), ('mean', np.nanmean)):
+        if np.abs(func(test) - func(control)) > tolerance:
+            errors.append(f'{stat}_not_equal')
+    return errors
+
+def _chunked(shape: tuple, dims: tuple, encoding: dict, fill: float = 0) -> xr.DataArray:
+    """
+    DataArray with storage chunking recorded in the encoding.
+    """
+    data_arr = xr.DataArray(np.full(shape, fill), dims=dims)
+    data_arr.encoding = encoding
+    return data_arr
+
+def _comparison_cases() -> dict:
+    """
+    Pairs of (test, control) arrays covering equal, close and differing
+    values, with matching and mismatched NaNs and masks.
+    """
+    rng  = np.random.default_rng(0)
+    base = rng.random((20,6,5)).astype(np.float32) + 1
+
+    within = base*np.float32(1 + 1e-6)
+
+    beyond = base.copy()
+    beyond[3,2,1] += 10
+
+    nans = base.copy()
+    nans[:,0,0] = np.nan
+
+    nan_mismatch = nans.copy()
+    nan_mismatch[5,3,3] = np.nan
+
+    mask = np.zeros(base.shape, dtype=bool)
+    mask[10:,4,:] = True
+    masked = np.ma.masked_array(base, mask=mask)
+
+    # Masked values are compared by their underlying data.
+    mask_data = base.copy()
+    mask_data[mask] = -1
+    masked_diff = np.ma.masked_array(mask_data, mask=mask)
+
+    integers = rng.integers(0, 1000, size=(50,4))
+    int_diff = integers.copy()
+    int_diff[7,1] += 500
+
+    return {
+        'identical':    (base.copy(), base),
+        'within':       (within, base),
+        'beyond':       (beyond, base),
+        'nans':         (nans.copy(), nans),
+        'nan_mismatch': (nan_mismatch, nans),
+        'masked':       (masked.copy(), masked),
+        'masked_diff':  (masked_diff, masked),
+        'integers':     (integers.copy(), integers),
+        'int_diff':     (int_diff, integers),
+    }
+
+class TestComparison:
+
+    def test_fused_comparison(self):
+
+        print("Unit Tests: Fused comparison")
+
+        for case, (test, control) in _comparison_cases().items():
+            flat_t = np.array(test).flatten()
+            flat_c = np.array(control).flatten()
+            tolerance = np.abs(np.nanmean(flat_t))/1000
+
+            # Single and multiple blocks give the same result.
+            for block_size in [2**22, 7]:
+                result = _fused_comparison(test, control, block_size=block_size)
+
+                assert np.isclose(result['tolerance'], tolerance), case
+                assert result['close'] == np.allclose(
+                    flat_c, flat_t, atol=tolerance, equal_nan=True), case
+                assert result['equal'] == np.array_equal(flat_c, flat_t, equal_nan=True), case
+                assert result['nan_match'] == np.array_equal(
+                    np.isnan(flat_t), np.isnan(flat_c)), case
+
+                for label, flat in (('test', flat_t), ('control', flat_c)):
+                    for stat, func in (('max', np.nanmax), ('min', np.nanmin), ('mean', np.nanmean)):
+                        assert np.isclose(result[label][stat], func(flat)), (case, label, stat)
+
+        assert _fused_comparison(np.array(['a','b']), np.array(['a','b'])) is None
+        print(' - Fused comparison - Complete')
+
+    def test_compare_data(self):
+
+        print("Unit Tests: Data comparison report")
+
+        def compare(test, control):
+            fake = SimpleNamespace(
+                logger=logging.getLogger('test_compare'),
+                _data_report=Report())
+            ValidateDatasets._compare_data(
+                fake, 'var', [slice(0, s) for s in test.shape], test, control)
+            return fake._data_report.value.get('variables',{})
+
+        for case, (test, control) in _comparison_cases().items():
+            report = compare(test, control)
+            errors = report.get('data_errors',{}).get('var',{}).get('type')
+            errors = errors.split(',') if errors else []
+            assert errors == _old_comparison(test, control), case
+            assert 'bypassed' not in report, case
+
+        # Statistics of an all-NaN selection are bypassed.
+        control = np.ones((10,10))
+        report = compare(np.full((10,10), np.nan), control)
+        assert report['data_errors']['var']['type'] == 'not_equal'
+        assert report['bypassed']['var'] == 'max,min,mean'
+
+        report = compare(np.array(['a','b']), np.array(['a','b']))
+        assert report['bypassed']['var'] == 'non-comparable'
+        print(' - Data comparison report - Complete')
+
+class TestGrowbox:
+
+    def test_chunk_alignment(self):
+
+        print("Unit Tests: Chunk alignment")
+
+        dims = ('time','lat')
+        test    = _chunked((200,30), dims, {'chunks': (20,30)})
+        control = _chunked((200,30), dims, {'chunksizes': (30,30)})
+
+        # Grid common to both chunkings is listed before the test grid.
+        assert chunk_alignment(test, control) == {
+            'time': [(60,0),(20,0)], 'lat': [(30,0)]}
+
+        # Preslice offsets with no common boundaries give the test grid alone.
+        assert chunk_alignment(test, control, test_offsets={'time':5}) == {
+            'time': [(20,5)], 'lat': [(30,0)]}
+        assert chunk_alignment(
+            test, control, test_offsets={'time':5}, control_offsets={'time':5}) == {
+            'time': [(60,5),(20,5)], 'lat': [(30,0)]}
+
+        # Control grid is used where the test array is not chunked.
+        unchunked = _chunked((200,30), dims, {})
+        assert chunk_alignment(unchunked, control) == {
+            'time': [(30,0)], 'lat': [(30,0)]}
+
+        preferred = _chunked((200,30), dims, {'preferred_chunks': {'time': 10}})
+        assert chunk_alignment(preferred, unchunked) == {'time': [(10,0)]}
+        assert chunk_alignment(unchunked, unchunked) == {}
+        print(' - Chunk alignment - Complete')
+
+    def test_select_grid(self):
+
+        print("Unit Tests: Chunk grid selection")
+
+        grids = [(60,0),(20,0)]
+        assert _select_grid(None, 10) is None
+        assert _select_grid([], 10) is None
+        assert _select_grid(grids, 20) == (60,0)
+        assert _select_grid(grids, 10) == (20,0)
+
+        # Chunks over ALIGN_FACTOR times the box width are not used.
+        assert _select_grid(grids, 4) is None
+        print(' - Chunk grid selection - Complete')
+
+    def test_slice_all_dims(self):
+
+        print("Unit Tests: Slice all dimensions")
+
+        data_arr = _chunked((200,30), ('time','lat'), {})
+        lat = slice(14,16)
+
+        assert slice_all_dims(data_arr, 10) == (slice(90,110), lat)
+
+        # Box within one chunk uses the chunk containing the midpoint.
+        assert slice_all_dims(data_arr, 10, chunks={'time': [(20,0)]}) == (slice(100,120), lat)
+
+        # Larger boxes are snapped outwards to chunk boundaries.
+        assert slice_all_dims(data_arr, 5, chunks={'time': [(20,0)]})[0] == slice(80,120)
+        assert slice_all_dims(data_arr, 7, chunks={'time': [(20,0)]})[0] == slice(80,120)
+        assert slice_all_dims(data_arr, 7, chunks={'time': [(20,5)]})[0] == slice(75,115)
+
+        # Chunks far larger than the box leave it unaligned.
+        assert slice_all_dims(data_arr, 10, chunks={'time': [(200,0)]}) == (slice(90,110), lat)
+        assert slice_all_dims(data_arr, 10, chunks={'lat': [(30,0)]}) == (slice(90,110), lat)
+
+        # Short dimensions are selected in full.
+        assert slice_all_dims(_chunked((6,), ('time',), {}), 10) == (slice(0,6),)
+        print(' - Slice all dimensions - Complete')
+
+    def test_growbox(self):
+
+        print("Unit Tests: Growbox selection")
+
+        for shape, chunks in [((200,), (50,)), ((200,), (20,)), ((6,), (6,))]:
+            data_arr = _chunked(shape, ('time',), {'chunks': chunks}, fill=np.nan)
+
+            calls = []
+            def validate(*args, **kwargs):
+                calls.append(kwargs.get('previous'))
+                return ValidateDatasets._validate_selection(fake, *args, **kwargs)
+
+            fake = SimpleNamespace(
+                logger=logging.getLogger('test_growbox'),
+                _data_report=Report(),
+                _preslice_fns=[SimpleNamespace(offsets=lambda var: {})]*2,
+                _validate_selection=validate)
+
+            fake._validate_selection('var', data_arr, data_arr, current=100)
+
+            # Each all-NaN box is read once, and steps stop once nothing changes.
+            reads = calls[1:]
+            assert all(reads.count(box) == 1 for box in reads), (shape, chunks)
+            assert len(reads) < 99, (shape, chunks)
+            assert fake._data_report.value['variables']['growbox']['var'] == 'all_nans'
+
+        # Box covering the whole array is not grown further.
+        assert reads == [(slice(0,6),)]
+        print(' - Growbox selection - Complete')
+
 class TestValidate:
     def test_validate(self, workdir=WORKDIR):
         groupID = 'padocc-test-suite'